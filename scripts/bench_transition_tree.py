@@ -0,0 +1,69 @@
+'''
+Benchmarks recording and recovering wide and deep cascades of changes.
+
+    python scripts/bench_transition_tree.py [n]
+
+wide: one listener makes n changes and then fails, so the whole transition is undone.
+deep: a transition tree n levels deep, built directly since listener cascades are limited by the recursion limit.
+Both are run with the debug trees (TransitionTree and ChangesTree) and, for wide, with the flat tree.
+'''
+
+import logging
+import sys
+import time
+
+from topicsync.change import IntChangeTypes
+from topicsync.state_machine.changes_tree import ChangesTree
+from topicsync.state_machine.state_machine import StateMachine
+from topicsync.state_machine.transition_tree import TransitionTree
+from topicsync.topic import IntTopic
+
+
+def timed(name, f):
+    start = time.perf_counter()
+    f()
+    print(f'{name:<32}{time.perf_counter() - start:8.3f}s')
+
+
+def wide(n, debug):
+    machine = StateMachine(changes_tree_callback=(lambda tree: tree.serialize()) if debug else None)
+    a = machine.add_topic('a', IntTopic)
+    b = machine.add_topic('b', IntTopic)
+
+    def on_set(value):
+        for _ in range(n):
+            b.add(1)
+        raise ValueError('fail after the cascade')
+    a.on_set.add_auto(on_set)
+
+    try:
+        a.add(1)
+    except ValueError:
+        pass
+    assert (a.get(), b.get()) == (0, 0)
+
+
+def deep(n):
+    machine = StateMachine()
+    a = machine.add_topic('a', IntTopic)
+    changes_list = []
+    changes_tree = ChangesTree()
+    tree = TransitionTree(machine.get_topic, changes_list, changes_tree)
+    for _ in range(n):
+        change = IntChangeTypes.AddChange('a', 1)
+        a.apply_change(change)
+        tree.cursor = tree.add_child(change)
+        changes_tree.cursor = changes_tree.add_child(change)
+    tree.to_list()
+    changes_tree.serialize()
+    tree.cursor = tree.root
+    tree.clear_subtree()
+    assert a.get() == 0
+
+
+if __name__ == '__main__':
+    logging.getLogger('topicsync').setLevel(logging.CRITICAL) # the failed transitions are expected
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    timed(f'wide {n}, flat tree', lambda: wide(n, False))
+    timed(f'wide {n}, debug trees', lambda: wide(n, True))
+    timed(f'deep {n}, debug trees', lambda: deep(n))
@@ -8,8 +8,7 @@ from topicsync.topic import FloatTopic, IntTopic, StringTopic, SetTopic, Generic
 server = TopicsyncServer(8765)
 
 a=server.add_topic('a',FloatTopic)
-b=server.add_topic('b',FloatTopic)
-
-a.on_set += lambda x: b.set(x*2)
+# b is computed from a when someone reads it or subscribes to it
+b=server.add_derived_topic('b',lambda x: x*2,['a'])
 
 asyncio.run(server.serve())
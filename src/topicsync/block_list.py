@@ -0,0 +1,190 @@
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Tuple
+
+from topicsync.utils import canonical_key
+
+# Blocks are split when they grow over 2 * _BLOCK_SIZE items
+_BLOCK_SIZE = 512
+
+class BlockList:
+    '''
+    A list stored as a sequence of blocks, with a Fenwick tree over the block sizes.
+    Inserting or popping at any position costs O(log n + block size) instead of O(n).
+
+    With index_items=True, it also keeps an index from items to the blocks containing them, so index() and
+    `in` don't scan the whole list. Items must then be JSON-like (see canonical_key).
+
+    It implements the part of the list API used by ListTopic and its changes.
+    '''
+    def __init__(self, items: Iterable[Any] = (), index_items: bool = False):
+        items = list(items)
+        self._blocks: List[List[Any]] = [items[i:i + _BLOCK_SIZE] for i in range(0, len(items), _BLOCK_SIZE)] or [[]]
+        self._len = len(items)
+        self._index_items = index_items
+        # canonical key -> id of block -> number of occurrences in the block
+        self._where: Dict[Hashable, Dict[int, int]] = {}
+        if index_items:
+            for block in self._blocks:
+                for item in block:
+                    self._index_add(item, block)
+        self._rebuild()
+
+    '''
+    Block bookkeeping
+    '''
+
+    def _rebuild(self):
+        '''
+        Rebuild the Fenwick tree and the block positions after blocks are added or removed.
+        '''
+        n = len(self._blocks)
+        tree = [0] * (n + 1)
+        for i, block in enumerate(self._blocks, 1):
+            tree[i] += len(block)
+            parent = i + (i & -i)
+            if parent <= n:
+                tree[parent] += tree[i]
+        self._tree = tree
+        self._block_pos = {id(block): i for i, block in enumerate(self._blocks)}
+
+    def _tree_add(self, block_pos: int, delta: int):
+        i = block_pos + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, block_pos: int) -> int:
+        '''
+        The number of items in the blocks before block_pos.
+        '''
+        total = 0
+        i = block_pos
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, position: int) -> Tuple[int, int]:
+        '''
+        Find the block containing the position. Return the block position and the offset in the block.
+        '''
+        if position >= self._len:
+            return len(self._blocks) - 1, position - self._len + len(self._blocks[-1])
+        block_pos = 0
+        step = 1 << (len(self._blocks).bit_length())
+        while step:
+            next_pos = block_pos + step
+            if next_pos < len(self._tree) and self._tree[next_pos] <= position:
+                block_pos = next_pos
+                position -= self._tree[next_pos]
+            step >>= 1
+        return block_pos, position
+
+    def _index_add(self, item, block: List[Any]):
+        counts = self._where.setdefault(canonical_key(item), {})
+        counts[id(block)] = counts.get(id(block), 0) + 1
+
+    def _index_remove(self, item, block: List[Any]):
+        key = canonical_key(item)
+        counts = self._where[key]
+        counts[id(block)] -= 1
+        if counts[id(block)] == 0:
+            del counts[id(block)]
+            if not counts:
+                del self._where[key]
+
+    def _normalize(self, position: int) -> int:
+        if position < 0:
+            position += self._len
+        if not 0 <= position < self._len:
+            raise IndexError('list index out of range')
+        return position
+
+    '''
+    List API
+    '''
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[Any]:
+        for block in self._blocks:
+            yield from block
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return self.to_list()[position]
+        block_pos, offset = self._locate(self._normalize(position))
+        return self._blocks[block_pos][offset]
+
+    def __contains__(self, item) -> bool:
+        if self._index_items:
+            return canonical_key(item) in self._where
+        return any(item in block for block in self._blocks)
+
+    def __eq__(self, other):
+        if isinstance(other, BlockList):
+            other = other.to_list()
+        if not isinstance(other, list):
+            return NotImplemented
+        return self._len == len(other) and self.to_list() == other
+
+    __hash__ = None # type: ignore # mutable
+
+    def __repr__(self):
+        return f'BlockList({self.to_list()!r})'
+
+    def insert(self, position: int, item):
+        if position < 0:
+            position = max(position + self._len, 0)
+        block_pos, offset = self._locate(min(position, self._len))
+        block = self._blocks[block_pos]
+        block.insert(offset, item)
+        self._len += 1
+        if self._index_items:
+            self._index_add(item, block)
+
+        if len(block) > 2 * _BLOCK_SIZE:
+            new_block = block[_BLOCK_SIZE:]
+            del block[_BLOCK_SIZE:]
+            if self._index_items:
+                for moved in new_block:
+                    self._index_remove(moved, block)
+                    self._index_add(moved, new_block)
+            self._blocks.insert(block_pos + 1, new_block)
+            self._rebuild()
+        else:
+            self._tree_add(block_pos, 1)
+
+    def append(self, item):
+        self.insert(self._len, item)
+
+    def pop(self, position: int = -1):
+        block_pos, offset = self._locate(self._normalize(position))
+        block = self._blocks[block_pos]
+        item = block.pop(offset)
+        self._len -= 1
+        if self._index_items:
+            self._index_remove(item, block)
+
+        if not block and len(self._blocks) > 1:
+            del self._blocks[block_pos]
+            self._rebuild()
+        else:
+            self._tree_add(block_pos, -1)
+        return item
+
+    def index(self, item) -> int:
+        if not self._index_items:
+            for block_pos, block in enumerate(self._blocks):
+                if item in block:
+                    return self._prefix(block_pos) + block.index(item)
+            raise ValueError(f'{item!r} is not in list')
+
+        counts = self._where.get(canonical_key(item))
+        if not counts:
+            raise ValueError(f'{item!r} is not in list')
+        block_pos = min(self._block_pos[block_id] for block_id in counts)
+        return self._prefix(block_pos) + self._blocks[block_pos].index(item)
+
+    def to_list(self) -> List[Any]:
+        return [item for block in self._blocks for item in block]
@@ -1,9 +1,13 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING, Any, List, Optional, Self
+from typing import TYPE_CHECKING, Any, Callable, List, Optional, Self
 import copy
+import inspect
+import sys
 
-from topicsync.utils import IdGenerator
+from topicsync.utils import IdGenerator, compact_id, render_id
+from topicsync.indexed_set import IndexedSet
 from topicsync.string_diff import insert, delete, adjust_delete, extend_delete
+from topicsync import json_pointer, numeric_array
 
 if TYPE_CHECKING:
     from topicsync.topic import Topic, StringTopic
@@ -19,6 +23,17 @@ class InvalidChangeError(Exception):
         self.change = change
         self.reason = reason
 
+class VersionTooOldError(Exception):
+    '''
+    Raised when a change is based on a topic version that has been dropped from the topic's history.
+    The client should resync the topic instead of retrying the change.
+    '''
+    def __init__(self,topic_name:str,version:str,checkpoint_version:str):
+        super().__init__(f'Version {version} of topic {topic_name} is too old. The oldest available version is {checkpoint_version}.')
+        self.topic_name = topic_name
+        self.version = version
+        self.checkpoint_version = checkpoint_version
+
 default_topic_value = {
     'generic':None,
     'string':'',
@@ -28,15 +43,12 @@ default_topic_value = {
     'set':[],
     'list':[],
     'dict':{},
+    'log':[],
+    'counter':0,
+    'array':{'dtype':'float64','data':''},
     'event':None
 }
 
-def remove_entry(dictionary,key):
-    dictionary = dictionary.copy()
-    if key in dictionary:
-        del dictionary[key]
-    return dictionary
-
 def type_validator(*ts):
     def f(new_value,change):
         for t in ts:
@@ -45,22 +57,89 @@ def type_validator(*ts):
         return False
     return f
 
+def set_type_validator(*ts):
+    '''
+    Pre-validator that checks the type of the value a SetChange (or a path set at the root) replaces the value with.
+    Other changes of a topic keep the type of its value, so they are not checked.
+    '''
+    def f(old_value,change):
+        if isinstance(change,SetChange) or (isinstance(change,PathSetChange) and change.path == ''):
+            return isinstance(change.value,ts)
+        return True
+    return f
+
+def operand_type_validator(*ts):
+    '''
+    Pre-validator for number topics, whose changes all carry a number in change.value.
+    '''
+    def f(old_value,change):
+        return isinstance(change.value,ts)
+    return f
+
+def _compile_decoder(cls: type[Change]) -> Callable[[dict[str,Any]], Change]:
+    '''
+    Generate a function that creates a cls from its serialized dict. Keys matching the parameters of cls.__init__ are
+    passed positionally, so the dict is neither copied nor unpacked. Other keys, like "type" and "topic_type", are ignored.
+    A decoded dict is not referenced by anything else, so a change that copies its values in __init__ is created with
+    its _from_snapshots() instead.
+    '''
+    constructor = getattr(cls, '_from_snapshots', cls)
+    args = []
+    defaults = []
+    for parameter in inspect.signature(constructor).parameters.values():
+        if parameter.default is inspect.Parameter.empty:
+            args.append(f'd[{parameter.name!r}]')
+        else:
+            args.append(f'd.get({parameter.name!r}, defaults[{len(defaults)}])')
+            defaults.append(parameter.default)
+    namespace = {'constructor': constructor, 'defaults': defaults}
+    exec(f'def decode(d):\n    return constructor({", ".join(args)})', namespace)
+    return namespace['decode']
+
+# (topic type, change type) -> decoder, filled on first use
+_decoders: dict[tuple[str,str], Callable[[dict[str,Any]], Change]] = {}
+
 class Change:
     @staticmethod
     def deserialize(change_dict:dict[str,Any])->Change:
-        change_type, topic_type, change_dict = change_dict['type'], change_dict['topic_type'], remove_entry(remove_entry(change_dict,'type'),'topic_type')
-        return type_name_to_change_types[topic_type].types[change_type].deserialize_init(change_dict)
+        key = (change_dict['topic_type'], change_dict['type'])
+        decode = _decoders.get(key)
+        if decode is None:
+            decode = _decoders[key] = _compile_decoder(type_name_to_change_types[key[0]].types[key[1]])
+        return decode(change_dict)
 
-    @classmethod
-    def deserialize_init(cls, change_dict: dict[str, Any]) -> Self:
-        return cls(**change_dict)
+    # Transitions and histories keep many changes alive, so changes have no __dict__, topic names are interned and
+    # server ids are kept as numbers. The id property gives the string form used on the wire.
+    # _serialized memoizes serialize(). Code that modifies a change after it's applied must call invalidate_serialized().
+    __slots__ = ('topic_name','_id','_serialized')
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if 'serialize' in cls.__dict__:
+            cls.serialize = _memoize_serialize(cls.__dict__['serialize'])
 
     def __init__(self,topic_name,id:Optional[str]=None):
-        self.topic_name = topic_name
+        self.topic_name = sys.intern(topic_name) if type(topic_name) is str else topic_name
         if id is None:
-            self.id = IdGenerator.generate_id()
+            self._id = IdGenerator.generate_number()
         else:
-            self.id = id
+            self._id = compact_id(id)
+
+    @property
+    def id(self) -> str:
+        return render_id(self._id)
+
+    @id.setter
+    def id(self, id:str):
+        self._id = compact_id(id)
+        self._serialized = None
+
+    def invalidate_serialized(self):
+        '''
+        Drop the memoized result of serialize(). Topic.apply_change calls it, since applying a change may modify it.
+        '''
+        self._serialized = None
+
     def apply(self, old_value):
         return old_value
     def serialize(self)->dict[str,Any]:
@@ -68,6 +147,8 @@ class Change:
         The serialize() method is used in two purposes:
         1. To send the change to clients.
         2. To print the change for debugging purposes.
+
+        The result is memoized until the change is modified, so it is shared between callers and must not be modified.
         '''
         raise NotImplementedError()
     def inverse(self)->Change:
@@ -76,7 +157,20 @@ class Change:
         '''
         raise NotImplementedError()
 
+def _memoize_serialize(serialize: Callable[[Change], dict[str,Any]]):
+    def memoized(self: Change) -> dict[str,Any]:
+        try:
+            serialized = self._serialized
+        except AttributeError:
+            serialized = None
+        if serialized is None:
+            serialized = self._serialized = serialize(self)
+        return serialized
+    memoized.__doc__ = serialize.__doc__
+    return memoized
+
 class NullChange(Change):
+    __slots__ = ()
     def __init__(self,topic_name,id=None):
         super().__init__(topic_name,id)
     def apply(self, old_value):
@@ -87,12 +181,28 @@ class NullChange(Change):
         raise NotImplementedError('NullChange should be discarded before serialization.')
 
 class SetChange(Change):
+    '''
+    value and old_value are snapshots: they are never modified, so the change, its inverse and the topic share them.
+    The values passed to __init__ are copied, since the caller may still modify them. The topic copies its value
+    before modifying it in place (see Topic.apply_change).
+    '''
+    __slots__ = ('value', 'old_value')
     def __init__(self,topic_name, value,old_value=None,id=None):
         super().__init__(topic_name,id)
         self.value = copy.deepcopy(value)
         self.old_value = copy.deepcopy(old_value)
+    @classmethod
+    def _from_snapshots(cls, topic_name, value, old_value=None, id=None) -> Self:
+        '''
+        Create the change without copying the values, for values that nothing else can modify.
+        '''
+        change = cls.__new__(cls)
+        Change.__init__(change, topic_name, id)
+        change.value = value
+        change.old_value = old_value
+        return change
     def apply(self, old_value):
-        old_value = copy.deepcopy(old_value)
+        # The topic replaces its value with self.value, so the old value is not modified anymore and can be kept as is.
         # if self.old_value != None:
         #     #? Is it correct?
         #     assert old_value == self.old_value, f'old_value: {old_value} != self.old_value: {self.old_value}'
@@ -104,9 +214,9 @@ class SetChange(Change):
     
         
         self.old_value = old_value
-        return copy.deepcopy(self.value)
+        return self.value
     def inverse(self)->Change:
-        return self.__class__(self.topic_name,copy.deepcopy(self.old_value),copy.deepcopy(self.value))
+        return self._from_snapshots(self.topic_name,self.old_value,self.value)
     def serialize(self):
         return {"topic_name":self.topic_name,"topic_type":"unknown","type":"set","value":self.value,"old_value":self.old_value,"id":self.id}
     def __eq__(self, other):
@@ -120,43 +230,169 @@ class SetChange(Change):
             self.id == other.id
 
 
+class PathSetChange(Change):
+    '''
+    Sets the value at a JSON pointer path like "/players/0/x", adding the key if the parent is a dict without it.
+    Only the changed part of the value is sent to clients and kept in the history.
+    Subclasses set topic_type, which is also used to find the change types of the inverse.
+    '''
+    __slots__ = ('path', 'value', 'existed', 'old_value')
+    topic_type = 'unknown'
+    def __init__(self,topic_name, path:str, value, id=None):
+        super().__init__(topic_name,id)
+        self.path = path
+        self.value = copy.deepcopy(value)
+        self.existed = True
+        self.old_value = None
+    def apply(self, old_value):
+        # A new root is shared like the value of a SetChange: the topic copies it before modifying it in place
+        try:
+            new_value, self.existed, self.old_value = json_pointer.set_value(old_value, json_pointer.split(self.path), self.value)
+        except ValueError as e:
+            raise InvalidChangeError(self, e.args[0]) from e
+        return new_value
+    def serialize(self):
+        return {"topic_name":self.topic_name,"topic_type":self.topic_type,"type":"path_set","path":self.path,"value":self.value,"id":self.id}
+    def inverse(self)->Change:
+        types = type_name_to_change_types[self.topic_type].types
+        if self.existed:
+            return types['path_set'](self.topic_name,self.path,self.old_value)
+        return types['path_remove'](self.topic_name,self.path)
+    def __eq__(self, other):
+        if type(self) != type(other):
+            return False
+        return self.topic_name == other.topic_name and \
+            self.path == other.path and \
+            self.value == other.value and \
+            self.id == other.id
+
+class PathInsertChange(Change):
+    '''
+    Inserts a value into a list at a JSON pointer path like "/players/0" ("/players/-" appends), or adds a new key to a dict.
+    '''
+    __slots__ = ('path', 'value')
+    topic_type = 'unknown'
+    def __init__(self,topic_name, path:str, value, id=None):
+        super().__init__(topic_name,id)
+        self.path = path
+        self.value = copy.deepcopy(value)
+    def apply(self, old_value):
+        try:
+            new_value, tokens = json_pointer.insert_value(old_value, json_pointer.split(self.path), self.value)
+        except ValueError as e:
+            raise InvalidChangeError(self, e.args[0]) from e
+        self.path = json_pointer.join(tokens) # resolve "-"
+        return new_value
+    def serialize(self):
+        return {"topic_name":self.topic_name,"topic_type":self.topic_type,"type":"path_insert","path":self.path,"value":self.value,"id":self.id}
+    def inverse(self)->Change:
+        return type_name_to_change_types[self.topic_type].types['path_remove'](self.topic_name,self.path)
+    def __eq__(self, other):
+        if type(self) != type(other):
+            return False
+        return self.topic_name == other.topic_name and \
+            self.path == other.path and \
+            self.value == other.value and \
+            self.id == other.id
+
+class PathRemoveChange(Change):
+    '''
+    Removes the list item or the dict key at a JSON pointer path.
+    '''
+    __slots__ = ('path', 'value')
+    topic_type = 'unknown'
+    def __init__(self,topic_name, path:str, id=None):
+        super().__init__(topic_name,id)
+        self.path = path
+        self.value = None
+    def apply(self, old_value):
+        try:
+            new_value, self.value = json_pointer.remove_value(old_value, json_pointer.split(self.path))
+        except ValueError as e:
+            raise InvalidChangeError(self, e.args[0]) from e
+        return new_value
+    def serialize(self):
+        return {"topic_name":self.topic_name,"topic_type":self.topic_type,"type":"path_remove","path":self.path,"id":self.id}
+    def inverse(self)->Change:
+        return type_name_to_change_types[self.topic_type].types['path_insert'](self.topic_name,self.path,self.value)
+    def __eq__(self, other):
+        if type(self) != type(other):
+            return False
+        return self.topic_name == other.topic_name and \
+            self.path == other.path and \
+            self.id == other.id
+
 class GenericChangeTypes:
     class SetChange(SetChange):
+        __slots__ = ()
         def serialize(self):
             return {"topic_name":self.topic_name,"topic_type":"generic","type":"set","value":self.value,"old_value":self.old_value,"id":self.id}
+    class PathSetChange(PathSetChange):
+        __slots__ = ()
+        topic_type = 'generic'
+    class PathInsertChange(PathInsertChange):
+        __slots__ = ()
+        topic_type = 'generic'
+    class PathRemoveChange(PathRemoveChange):
+        __slots__ = ()
+        topic_type = 'generic'
+
+    types = {'set':SetChange,'path_set':PathSetChange,'path_insert':PathInsertChange,'path_remove':PathRemoveChange}
 
-    types = {'set':SetChange}
+class _StringEditChange(Change):
+    '''
+    Base of string changes based on a topic version. Versions are server ids, kept compact like change ids.
+    '''
+    __slots__ = ('_topic_version','_result_topic_version')
+
+    def __init__(self, topic_name: str, topic_version: str, result_topic_version: Optional[str]=None, id: Optional[str]=None):
+        super().__init__(topic_name, id)
+        self._topic_version = compact_id(topic_version)
+        self._result_topic_version = IdGenerator.generate_number() if not result_topic_version else compact_id(result_topic_version)
+
+    @property
+    def topic_version(self) -> str:
+        return render_id(self._topic_version)
+
+    @topic_version.setter
+    def topic_version(self, topic_version: str):
+        self._topic_version = compact_id(topic_version)
+        self._serialized = None
+
+    @property
+    def result_topic_version(self) -> str:
+        return render_id(self._result_topic_version)
 
 class StringChangeTypes:
     class SetChange(SetChange):
+        __slots__ = ()
         def exchange_topic_version(self, current_version: str, topic: StringTopic) -> str:
             return self.id
         def serialize(self):
             return {"topic_name":self.topic_name,"topic_type":"string","type":"set","value":self.value,"old_value":self.old_value,"id":self.id}
 
-    class InsertChange(Change):
+    class InsertChange(_StringEditChange):
+        __slots__ = ('position', 'insertion')
         def __init__(self, topic_name: str, topic_version: str, position: int, insertion: str, result_topic_version: Optional[str] = None, id: Optional[str]=None):
-            super().__init__(topic_name, id)
+            super().__init__(topic_name, topic_version, result_topic_version, id)
             self.position = position
             self.insertion = insertion
-            self.topic_version = topic_version
-            self.result_topic_version = IdGenerator.generate_id() if not result_topic_version else result_topic_version
 
         def exchange_topic_version(self, current_version: str, topic: StringTopic) -> str:
             if self.topic_version == current_version:
                 return self.result_topic_version
 
             try:
-                changes = topic.changes_from(self.topic_version)
+                transform = topic.transform_from(self.topic_version)
+            except VersionTooOldError:
+                raise
             except:
                 raise InvalidChangeError(self, f"Invalid base topic version: {self.topic_version}")
 
-            for change in changes:
-                if isinstance(change, StringChangeTypes.SetChange):
-                    # view it as delete all and insert all, the cursor should be at the beginning
-                    self.position = 0
-                else:
-                    self._adjust(change)
+            # Equivalent to calling _adjust() with every change since the base version
+            self.position, survived = transform.map_insertion(self.position)
+            if not survived:
+                self.insertion = ''
             self.topic_version = current_version
             self.id = f'{self.id}_adjust'
 
@@ -199,37 +435,34 @@ class StringChangeTypes:
                 self.result_topic_version == other.result_topic_version and \
                 self.id == other.id
 
-    class DeleteChange(Change):
+    class DeleteChange(_StringEditChange):
+        __slots__ = ('position', 'deletion')
         def __init__(self, topic_name: str, topic_version: str, position: int, deletion: str, result_topic_version: Optional[str]=None, id: Optional[str]=None):
-            super().__init__(topic_name, id)
+            super().__init__(topic_name, topic_version, result_topic_version, id)
             self.position = position
             self.deletion = deletion
-            self.topic_version = topic_version
-            self.result_topic_version = IdGenerator.generate_id() if not result_topic_version else result_topic_version
 
         def exchange_topic_version(self, current_version: str, topic: StringTopic) -> str:
             if self.topic_version == current_version:
                 return self.result_topic_version
 
             try:
-                changes = topic.changes_from(self.topic_version)
+                transform = topic.transform_from(self.topic_version)
+            except VersionTooOldError:
+                raise
             except:
                 raise InvalidChangeError(self, f"Invalid base topic version: {self.topic_version}")
 
-            for change in changes:
-                if isinstance(change, StringChangeTypes.SetChange):
-                    # view it as delete all and insert all,
-                    # the cursor should be at the beginning and no deletion will happen
-                    self.position = 0
-                    self.deletion = ''
-                else:
-                    self._adjust(change)
+            # Equivalent to calling _adjust() with every change since the base version
+            try:
+                self.position, self.deletion = transform.map_deletion(self.position, self.deletion)
+            except ValueError as e:
+                raise InvalidChangeError(self, e.args[0]) from e
             self.topic_version = current_version
             self.id = f'{self.id}_adjust'
 
             return self.result_topic_version
 
-
         def _adjust(self, change: StringChangeTypes.InsertChange | StringChangeTypes.DeleteChange):
             if isinstance(change, StringChangeTypes.DeleteChange):
                 self.position, self.deletion = adjust_delete(
@@ -269,10 +502,12 @@ class StringChangeTypes:
 
 class IntChangeTypes:
     class SetChange(SetChange):
+        __slots__ = ()
         def serialize(self):
             return {"topic_name":self.topic_name,"topic_type":"int","type":"set","value":self.value,"old_value":self.old_value,"id":self.id}
 
     class AddChange(Change):
+        __slots__ = ('value',)
         def __init__(self,topic_name, value,id=None):
             super().__init__(topic_name,id)
             self.value = value
@@ -281,9 +516,9 @@ class IntChangeTypes:
         def serialize(self):
             return {"topic_name":self.topic_name,"topic_type":"int","type":"add","value":self.value,"id":self.id}
         def inverse(self)->Change:
-            return IntChangeTypes.AddChange(self.topic_name,-self.value)
+            return type(self)(self.topic_name,-self.value)
         def __eq__(self, other):
-            if not isinstance(other, IntChangeTypes.AddChange):
+            if type(other) is not type(self):
                 return False
             return self.topic_name == other.topic_name and \
                 self.value == other.value and \
@@ -291,12 +526,27 @@ class IntChangeTypes:
 
     types = {'set':SetChange,'add':AddChange}
 
+class CounterChangeTypes:
+    class SetChange(SetChange):
+        __slots__ = ()
+        def serialize(self):
+            return {"topic_name":self.topic_name,"topic_type":"counter","type":"set","value":self.value,"old_value":self.old_value,"id":self.id}
+
+    class AddChange(IntChangeTypes.AddChange):
+        __slots__ = ()
+        def serialize(self):
+            return {"topic_name":self.topic_name,"topic_type":"counter","type":"add","value":self.value,"id":self.id}
+
+    types = {'set':SetChange,'add':AddChange}
+
 class FloatChangeTypes:
     class SetChange(SetChange):
+        __slots__ = ()
         def serialize(self):
             return {"topic_name":self.topic_name,"topic_type":"float","type":"set","value":self.value,"old_value":self.old_value,"id":self.id}
 
     class AddChange(Change):
+        __slots__ = ('value',)
         def __init__(self,topic_name, value,id=None):
             super().__init__(topic_name,id)
             self.value = value
@@ -317,15 +567,20 @@ class FloatChangeTypes:
 
 class SetChangeTypes:
     class SetChange(SetChange):
+        __slots__ = ()
         def serialize(self):
                 return {"topic_name":self.topic_name,"topic_type":"set","type":"set","value":self.value,"old_value":self.old_value,"id":self.id}
     class AppendChange(Change):
+        __slots__ = ('item',)
         def __init__(self,topic_name, item,id=None):
             super().__init__(topic_name,id)
             self.item = item
         def apply(self, old_value):
             if self.item in old_value:
                 raise InvalidChangeError(self,f'Adding {repr(self.item)} to {old_value} would create a duplicate.')
+            if isinstance(old_value, IndexedSet):
+                old_value.add(self.item)
+                return old_value
             return old_value + [self.item]
         def serialize(self):
             return {"topic_name":self.topic_name,"topic_type":"set","type":"append","item":self.item,"id":self.id}
@@ -339,12 +594,16 @@ class SetChangeTypes:
                 self.id == other.id
 
     class RemoveChange(Change):
+        __slots__ = ('item',)
         def __init__(self,topic_name, item,id=None):
             super().__init__(topic_name,id)
             self.item = item
         def apply(self, old_value):
             if self.item not in old_value:
                 raise InvalidChangeError(self,f'Cannot remove {self.item} from {old_value}')
+            if isinstance(old_value, IndexedSet):
+                old_value.remove(self.item)
+                return old_value
             new_value = old_value[:]
             new_value.remove(self.item)
             return new_value
@@ -359,14 +618,55 @@ class SetChangeTypes:
                 self.item == other.item and \
                 self.id == other.id
 
-    types = {'set':SetChange,'append':AppendChange,'remove':RemoveChange}
+    class UpdateChange(Change):
+        '''
+        Appends and removes many items in one change.
+        '''
+        __slots__ = ('append_items', 'remove_items')
+        def __init__(self,topic_name, append_items:list|None=None, remove_items:list|None=None,id=None):
+            super().__init__(topic_name,id)
+            self.append_items = append_items if append_items is not None else []
+            self.remove_items = remove_items if remove_items is not None else []
+        def apply(self, old_value):
+            items = old_value if isinstance(old_value, IndexedSet) else IndexedSet(old_value)
+            appending = IndexedSet(self.append_items)
+            if len(appending) != len(self.append_items):
+                raise InvalidChangeError(self,'Items to append contain duplicates.')
+            for item in self.append_items:
+                if item in items:
+                    raise InvalidChangeError(self,f'Adding {repr(item)} would create a duplicate.')
+            if len(IndexedSet(self.remove_items)) != len(self.remove_items):
+                raise InvalidChangeError(self,'Items to remove contain duplicates.')
+            for item in self.remove_items:
+                if item not in items:
+                    raise InvalidChangeError(self,f'Cannot remove {repr(item)}')
+            for item in self.remove_items:
+                items.remove(item)
+            for item in self.append_items:
+                items.add(item)
+            return old_value if items is old_value else items.to_list()
+        def serialize(self):
+            return {"topic_name":self.topic_name,"topic_type":"set","type":"update","append_items":self.append_items,"remove_items":self.remove_items,"id":self.id}
+        def inverse(self)->Change:
+            return SetChangeTypes.UpdateChange(self.topic_name,self.remove_items,self.append_items)
+        def __eq__(self, other):
+            if not isinstance(other, SetChangeTypes.UpdateChange):
+                return False
+            return self.topic_name == other.topic_name and \
+                self.append_items == other.append_items and \
+                self.remove_items == other.remove_items and \
+                self.id == other.id
+
+    types = {'set':SetChange,'append':AppendChange,'remove':RemoveChange,'update':UpdateChange}
 
 class ListChangeTypes:
     class SetChange(SetChange):
+        __slots__ = ()
         def serialize(self):
             return {"topic_name":self.topic_name,"topic_type":"list","type":"set","value":self.value,"old_value":self.old_value,"id":self.id}
 
     class InsertChange(Change):
+        __slots__ = ('item', 'position')
         def __init__(self,topic_name, item,position:int,id=None):
             super().__init__(topic_name,id)
             self.item = item
@@ -389,6 +689,7 @@ class ListChangeTypes:
                 self.position == other.position and \
                 self.id == other.id
     class PopChange(Change):
+        __slots__ = ('position', 'item')
         def __init__(self,topic_name, position:int,id=None):
             super().__init__(topic_name,id)
             self.position = position
@@ -408,13 +709,78 @@ class ListChangeTypes:
                 self.position == other.position and \
                 self.id == other.id
 
-    types = {'set': SetChange, 'insert': InsertChange, 'pop': PopChange}
+    class ExtendChange(Change):
+        '''
+        Inserts many items before the position. The default position -1 appends them.
+        '''
+        __slots__ = ('items', 'position')
+        def __init__(self,topic_name, items:list, position:int=-1,id=None):
+            super().__init__(topic_name,id)
+            self.items = items
+            self.position = position
+        def apply(self, old_value):
+            if self.position < 0:
+                self.position = max(len(old_value) + self.position + 1, 0) # +1 because insert inserts before the position
+            self.position = min(self.position, len(old_value))
+            if isinstance(old_value, list):
+                old_value[self.position:self.position] = self.items
+            else:
+                for i, item in enumerate(self.items):
+                    old_value.insert(self.position + i, item)
+            return old_value
+        def serialize(self):
+            return {"topic_name":self.topic_name,"topic_type":"list","type":"extend","items":self.items,"position":self.position,"id":self.id}
+        def inverse(self)->Change:
+            return ListChangeTypes.PopRangeChange(self.topic_name,self.position,len(self.items))
+        def __eq__(self, other):
+            if not isinstance(other, ListChangeTypes.ExtendChange):
+                return False
+            return self.topic_name == other.topic_name and \
+                self.items == other.items and \
+                self.position == other.position and \
+                self.id == other.id
+    class PopRangeChange(Change):
+        '''
+        Removes count items from the position.
+        '''
+        __slots__ = ('position', 'count', 'items')
+        def __init__(self,topic_name, position:int, count:int,id=None):
+            super().__init__(topic_name,id)
+            self.position = position
+            self.count = count
+            self.items = []
+        def apply(self, old_value):
+            if self.position < 0:
+                self.position = len(old_value) + self.position
+            if not (0 <= self.position and 0 <= self.count and self.position + self.count <= len(old_value)):
+                raise InvalidChangeError(self,f'Cannot pop {self.count} items from position {self.position} of a list of length {len(old_value)}')
+            if isinstance(old_value, list):
+                self.items = old_value[self.position:self.position + self.count]
+                del old_value[self.position:self.position + self.count]
+            else:
+                self.items = [old_value.pop(self.position) for _ in range(self.count)]
+            return old_value
+        def serialize(self):
+            return {"topic_name":self.topic_name,"topic_type":"list","type":"pop_range","position":self.position,"count":self.count,"id":self.id}
+        def inverse(self)->Change:
+            return ListChangeTypes.ExtendChange(self.topic_name,self.items,self.position)
+        def __eq__(self, other):
+            if not isinstance(other, ListChangeTypes.PopRangeChange):
+                return False
+            return self.topic_name == other.topic_name and \
+                self.position == other.position and \
+                self.count == other.count and \
+                self.id == other.id
+
+    types = {'set': SetChange, 'insert': InsertChange, 'pop': PopChange, 'extend': ExtendChange, 'pop_range': PopRangeChange}
 
 class DictChangeTypes:
     class SetChange(SetChange):
+        __slots__ = ()
         def serialize(self):
             return {"topic_name":self.topic_name,"topic_type":"dict","type":"set","value":self.value,"old_value":self.old_value,"id":self.id}
     class AddChange(Change):
+        __slots__ = ('key', 'value')
         def __init__(self,topic_name, key,value,id=None):
             super().__init__(topic_name,id)
             self.key = key
@@ -436,6 +802,7 @@ class DictChangeTypes:
                 self.value == other.value and \
                 self.id == other.id
     class PopChange(Change):
+        __slots__ = ('key', 'value')
         def __init__(self,topic_name, key,id=None):
             super().__init__(topic_name,id)
             self.key = key
@@ -456,6 +823,7 @@ class DictChangeTypes:
                 self.key == other.key and \
                 self.id == other.id
     class ChangeValueChange(Change):
+        __slots__ = ('key', 'value', 'old_value')
         def __init__(self,topic_name, key,value,old_value=None,id=None):
             super().__init__(topic_name,id)
             self.key = key
@@ -466,7 +834,7 @@ class DictChangeTypes:
                 raise InvalidChangeError(self,f'{self.key} is not in {old_dict}')
             if self.old_value != old_dict[self.key]:
                 # regenerate id
-                self.id = IdGenerator.generate_id()
+                self._id = IdGenerator.generate_number()
             self.old_value = old_dict[self.key]
             old_dict[self.key] = self.value
             return old_dict
@@ -482,10 +850,222 @@ class DictChangeTypes:
                 self.value == other.value and \
                 self.old_value == other.old_value and \
                 self.id == other.id
-    types = {'set':SetChange,'add':AddChange,'pop':PopChange,'change_value':ChangeValueChange}
+    class UpdateChange(Change):
+        '''
+        Adds or changes the values of many keys, and pops many keys, in one change.
+        '''
+        __slots__ = ('values', 'pop_keys', 'old_values')
+        def __init__(self,topic_name, values:dict|None=None, pop_keys:list|None=None,id=None):
+            super().__init__(topic_name,id)
+            self.values = values if values is not None else {}
+            self.pop_keys = pop_keys if pop_keys is not None else []
+            self.old_values = {} # values of the keys that existed before
+        def apply(self, old_dict):
+            if len(set(self.pop_keys)) != len(self.pop_keys):
+                raise InvalidChangeError(self,'Keys to pop contain duplicates.')
+            for key in self.pop_keys:
+                if key not in old_dict:
+                    raise InvalidChangeError(self,f'{key} is not in {old_dict}')
+                if key in self.values:
+                    raise InvalidChangeError(self,f'{key} is both set and popped')
+            self.old_values = {key: old_dict[key] for key in self.pop_keys}
+            self.old_values.update((key, old_dict[key]) for key in self.values if key in old_dict)
+            for key in self.pop_keys:
+                del old_dict[key]
+            old_dict.update(self.values)
+            return old_dict
+        def serialize(self):
+            return {"topic_name":self.topic_name,"topic_type":"dict","type":"update","values":self.values,"pop_keys":self.pop_keys,"id":self.id}
+        def inverse(self)->Change:
+            added_keys = [key for key in self.values if key not in self.old_values]
+            return DictChangeTypes.UpdateChange(self.topic_name,dict(self.old_values),added_keys)
+        def __eq__(self, other):
+            if not isinstance(other, DictChangeTypes.UpdateChange):
+                return False
+            return self.topic_name == other.topic_name and \
+                self.values == other.values and \
+                self.pop_keys == other.pop_keys and \
+                self.id == other.id
+    class PathSetChange(PathSetChange):
+        __slots__ = ()
+        topic_type = 'dict'
+    class PathInsertChange(PathInsertChange):
+        __slots__ = ()
+        topic_type = 'dict'
+    class PathRemoveChange(PathRemoveChange):
+        __slots__ = ()
+        topic_type = 'dict'
+    types = {'set':SetChange,'add':AddChange,'pop':PopChange,'change_value':ChangeValueChange,'update':UpdateChange,
+             'path_set':PathSetChange,'path_insert':PathInsertChange,'path_remove':PathRemoveChange}
+
+class LogChangeTypes:
+    class SetChange(SetChange):
+        __slots__ = ()
+        def serialize(self):
+            return {"topic_name":self.topic_name,"topic_type":"log","type":"set","value":self.value,"old_value":self.old_value,"id":self.id}
+
+    class AppendChange(Change):
+        __slots__ = ('items',)
+        def __init__(self,topic_name, items:list,id=None):
+            super().__init__(topic_name,id)
+            self.items = items
+        def apply(self, old_value):
+            old_value.extend(self.items)
+            return old_value
+        def serialize(self):
+            return {"topic_name":self.topic_name,"topic_type":"log","type":"append","items":self.items,"id":self.id}
+        def inverse(self)->Change:
+            return LogChangeTypes.PopChange(self.topic_name,len(self.items))
+        def __eq__(self, other):
+            if not isinstance(other, LogChangeTypes.AppendChange):
+                return False
+            return self.topic_name == other.topic_name and \
+                self.items == other.items and \
+                self.id == other.id
+    class PopChange(Change):
+        '''
+        Removes the newest count entries. Mainly used to undo AppendChange.
+        '''
+        __slots__ = ('count', 'items')
+        def __init__(self,topic_name, count:int,id=None):
+            super().__init__(topic_name,id)
+            self.count = count
+            self.items = []
+        def apply(self, old_value):
+            if not 0 <= self.count <= len(old_value):
+                raise InvalidChangeError(self,f'Cannot pop {self.count} entries from a log of {len(old_value)} entries')
+            self.items = old_value.pop_last(self.count)
+            return old_value
+        def serialize(self):
+            return {"topic_name":self.topic_name,"topic_type":"log","type":"pop","count":self.count,"id":self.id}
+        def inverse(self)->Change:
+            return LogChangeTypes.AppendChange(self.topic_name,self.items)
+        def __eq__(self, other):
+            if not isinstance(other, LogChangeTypes.PopChange):
+                return False
+            return self.topic_name == other.topic_name and \
+                self.count == other.count and \
+                self.id == other.id
+
+    types = {'set':SetChange,'append':AppendChange,'pop':PopChange}
+
+class ArrayChangeTypes:
+    '''
+    Changes of ArrayTopic. Slices of items are carried as base64 of little-endian items of the topic's dtype (see numeric_array).
+    '''
+    class SetChange(SetChange):
+        __slots__ = ()
+        def serialize(self):
+            return {"topic_name":self.topic_name,"topic_type":"array","type":"set","value":self.value,"old_value":self.old_value,"id":self.id}
+
+    class SetSliceChange(Change):
+        __slots__ = ('start', 'data', 'stop', 'old_data')
+        def __init__(self,topic_name, start:int, data:str, id=None):
+            super().__init__(topic_name,id)
+            self.start = start
+            self.data = data
+            self.stop = start # known after apply
+            self.old_data = None
+        def apply(self, old_value):
+            values = ArrayChangeTypes._decode(self, self.data, old_value)
+            self.stop = self.start + len(values)
+            self.old_data = numeric_array.encode_data(old_value[self.start:self.stop])
+            old_value[self.start:self.stop] = values
+            return old_value
+        def serialize(self):
+            return {"topic_name":self.topic_name,"topic_type":"array","type":"set_slice","start":self.start,"data":self.data,"id":self.id}
+        def inverse(self)->Change:
+            return ArrayChangeTypes.SetSliceChange(self.topic_name,self.start,self.old_data)
+        def __eq__(self, other):
+            if not isinstance(other, ArrayChangeTypes.SetSliceChange):
+                return False
+            return self.topic_name == other.topic_name and \
+                self.start == other.start and \
+                self.data == other.data and \
+                self.id == other.id
+
+    class AddRangeChange(Change):
+        '''
+        Adds value to every item in [start, stop).
+        '''
+        __slots__ = ('start', 'stop', 'value')
+        def __init__(self,topic_name, start:int, stop:int, value, id=None):
+            super().__init__(topic_name,id)
+            self.start = start
+            self.stop = stop
+            self.value = value
+        def apply(self, old_value):
+            ArrayChangeTypes._check_range(self, self.start, self.stop, old_value)
+            try:
+                numeric_array.add_scalar(old_value, self.start, self.stop, self.value)
+            except ValueError as e:
+                raise InvalidChangeError(self, str(e)) from e
+            return old_value
+        def serialize(self):
+            return {"topic_name":self.topic_name,"topic_type":"array","type":"add_range","start":self.start,"stop":self.stop,"value":self.value,"id":self.id}
+        def inverse(self)->Change:
+            return ArrayChangeTypes.AddRangeChange(self.topic_name,self.start,self.stop,-self.value)
+        def __eq__(self, other):
+            if not isinstance(other, ArrayChangeTypes.AddRangeChange):
+                return False
+            return self.topic_name == other.topic_name and \
+                self.start == other.start and \
+                self.stop == other.stop and \
+                self.value == other.value and \
+                self.id == other.id
+
+    class AddSliceChange(Change):
+        '''
+        Adds data to the items from start element-wise.
+        '''
+        __slots__ = ('start', 'data', 'stop', 'old_data')
+        def __init__(self,topic_name, start:int, data:str, id=None):
+            super().__init__(topic_name,id)
+            self.start = start
+            self.data = data
+            self.stop = start # known after apply
+            self.old_data = None
+        def apply(self, old_value):
+            deltas = ArrayChangeTypes._decode(self, self.data, old_value)
+            self.stop = self.start + len(deltas)
+            self.old_data = numeric_array.encode_data(old_value[self.start:self.stop])
+            try:
+                numeric_array.add_elementwise(old_value, self.start, deltas)
+            except ValueError as e:
+                raise InvalidChangeError(self, str(e)) from e
+            return old_value
+        def serialize(self):
+            return {"topic_name":self.topic_name,"topic_type":"array","type":"add_slice","start":self.start,"data":self.data,"id":self.id}
+        def inverse(self)->Change:
+            # Restore the old items exactly instead of subtracting, which may round floats
+            return ArrayChangeTypes.SetSliceChange(self.topic_name,self.start,self.old_data)
+        def __eq__(self, other):
+            if not isinstance(other, ArrayChangeTypes.AddSliceChange):
+                return False
+            return self.topic_name == other.topic_name and \
+                self.start == other.start and \
+                self.data == other.data and \
+                self.id == other.id
+
+    @staticmethod
+    def _check_range(change:Change, start:int, stop:int, old_value):
+        if not isinstance(start, int) or not isinstance(stop, int) or not 0 <= start <= stop <= len(old_value):
+            raise InvalidChangeError(change, f'Range [{start}:{stop}] is out of an array of length {len(old_value)}')
+
+    @staticmethod
+    def _decode(change:Change, data:str, old_value):
+        try:
+            values = numeric_array.decode_data(data, old_value.typecode)
+        except ValueError as e:
+            raise InvalidChangeError(change, f'Invalid data: {e}') from e
+        ArrayChangeTypes._check_range(change, change.start, change.start + len(values), old_value)
+        return values
+
+    types = {'set':SetChange,'set_slice':SetSliceChange,'add_range':AddRangeChange,'add_slice':AddSliceChange}
 
 class EventChangeTypes:
     class EmitChange(Change):
+        __slots__ = ('args', 'forward_info')
         def __init__(self,topic_name,args=None,id=None,forward_info=None):
             super().__init__(topic_name,id)
             self.args = args if args is not None else {}
@@ -506,6 +1086,7 @@ class EventChangeTypes:
                 self.forward_info == other.forward_info and \
                 self.id == other.id
     class ReversedEmitChange(Change):
+            __slots__ = ('args', 'forward_info')
             def __init__(self,topic_name,args=None,id=None,forward_info=None):
                 super().__init__(topic_name,id)
                 self.args = args if args is not None else {}
@@ -533,5 +1114,8 @@ type_name_to_change_types = {
                                 'set':SetChangeTypes,
                                 'dict':DictChangeTypes,
                                 'list':ListChangeTypes,
+                                'log':LogChangeTypes,
+                                'counter':CounterChangeTypes,
+                                'array':ArrayChangeTypes,
                                 'event':EventChangeTypes
                             }
@@ -0,0 +1,64 @@
+from typing import Any, Callable, Dict, Hashable, List
+
+from topicsync.utils import canonical_key
+
+_MISSING = object()
+
+class DictIndex:
+    '''
+    A secondary index of a dict. It maps a derived value of each entry (the whole value, or a field of it) to the keys
+    of the entries, so entries can be found by value in O(1).
+
+    Derived values are compared by canonical_key(), so they can be lists or dicts. Entries whose value doesn't have
+    the indexed field are not indexed. Keys holding the same derived value are returned in the order they were indexed.
+    '''
+    def __init__(self, key: str | Callable[[Any], Any]):
+        '''
+        key: a function computing the derived value from a dict value, or the name of a field of dict values.
+        '''
+        self._key_func = key if callable(key) else self._field_getter(key)
+        # derived value -> keys of the dict, as an insertion-ordered set
+        self._buckets: Dict[Hashable, Dict[Any, None]] = {}
+        # key of the dict -> derived value, so stale entries can be removed without the old value
+        self._index_keys: Dict[Any, Hashable] = {}
+
+    @staticmethod
+    def _field_getter(field: str) -> Callable[[Any], Any]:
+        def getter(value):
+            if isinstance(value, dict):
+                return value.get(field, _MISSING)
+            return _MISSING
+        return getter
+
+    def set(self, key, value):
+        '''
+        Index the entry, replacing the old index of the key if any.
+        '''
+        self.discard(key)
+        derived = self._key_func(value)
+        if derived is _MISSING:
+            return
+        index_key = canonical_key(derived)
+        self._index_keys[key] = index_key
+        self._buckets.setdefault(index_key, {})[key] = None
+
+    def discard(self, key):
+        index_key = self._index_keys.pop(key, _MISSING)
+        if index_key is _MISSING:
+            return
+        bucket = self._buckets[index_key]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[index_key]
+
+    def rebuild(self, dictionary: Dict):
+        self._buckets.clear()
+        self._index_keys.clear()
+        for key, value in dictionary.items():
+            self.set(key, value)
+
+    def find(self, derived_value) -> List[Any]:
+        '''
+        Get the keys of the entries whose derived value equals derived_value.
+        '''
+        return list(self._buckets.get(canonical_key(derived_value), ()))
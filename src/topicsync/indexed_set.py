@@ -0,0 +1,56 @@
+from typing import Any, Dict, Hashable, Iterable, Iterator, List
+
+from topicsync.utils import canonical_key
+
+class IndexedSet:
+    '''
+    An insertion-ordered set of JSON-like items, including unhashable ones like lists and dicts.
+    Items are indexed by canonical_key(), so add, remove and contains are O(1).
+    SetTopic uses it as the backing store of its value, which is a list on the wire.
+    '''
+    def __init__(self, items: Iterable[Any] = ()):
+        self._items: Dict[Hashable, Any] = {}
+        for item in items:
+            self._items.setdefault(canonical_key(item), item)
+
+    def __contains__(self, item) -> bool:
+        return canonical_key(item) in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._items.values())
+
+    def __eq__(self, other):
+        if isinstance(other, IndexedSet):
+            other = other.to_list()
+        if not isinstance(other, list):
+            return NotImplemented
+        return self.to_list() == other
+
+    __hash__ = None # type: ignore # mutable
+
+    def __repr__(self):
+        return f'IndexedSet({self.to_list()!r})'
+
+    def add(self, item):
+        self._items[canonical_key(item)] = item
+
+    def remove(self, item):
+        '''
+        Raise KeyError if the item is not in the set.
+        '''
+        del self._items[canonical_key(item)]
+
+    def keys(self):
+        '''
+        A set-like view of the canonical keys of the items.
+        '''
+        return self._items.keys()
+
+    def get_by_key(self, key: Hashable):
+        return self._items[key]
+
+    def to_list(self) -> List[Any]:
+        return list(self._items.values())
@@ -0,0 +1,123 @@
+'''
+JSON pointers (RFC 6901) address a location inside a JSON-like value, like "/players/0/x". The empty pointer is
+the whole value.
+
+The edit functions mutate the root container in place, and replace the containers along the path with shallow
+copies instead of mutating them. So a nested value that is also referenced elsewhere, like in a change kept in the
+undo history, is never modified.
+'''
+from typing import Any, Callable, List, Tuple
+
+def split(pointer: str) -> List[str]:
+    '''
+    Split a pointer into unescaped tokens. Raise ValueError if the pointer is malformed.
+    '''
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise ValueError(f'Invalid JSON pointer {pointer!r}: must be empty or start with "/"')
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+def join(tokens: List[Any]) -> str:
+    return ''.join('/' + str(token).replace('~', '~0').replace('/', '~1') for token in tokens)
+
+def is_prefix(prefix: List[str], tokens: List[str]) -> bool:
+    return len(prefix) <= len(tokens) and tokens[:len(prefix)] == prefix
+
+def _child_key(container, token: str, allow_end: bool = False):
+    '''
+    Convert a token to a key of the container. allow_end allows the position right after the last item of a list,
+    which can be written as "-".
+    '''
+    if isinstance(container, dict):
+        return token
+    if isinstance(container, list):
+        if allow_end and token == '-':
+            return len(container)
+        if not token.isdigit() or (len(token) > 1 and token[0] == '0'):
+            raise ValueError(f'Invalid list index {token!r}')
+        index = int(token)
+        if index > len(container) or (index == len(container) and not allow_end):
+            raise ValueError(f'List index {index} out of range')
+        return index
+    raise ValueError(f'Cannot index into {type(container).__name__} with {token!r}')
+
+def get(document, tokens: List[str]):
+    for token in tokens:
+        key = _child_key(document, token)
+        if isinstance(document, dict) and key not in document:
+            raise ValueError(f'Key {key!r} not found')
+        document = document[key]
+    return document
+
+def _edit_parent(document, tokens: List[str], edit: Callable[[Any, str], Any]):
+    '''
+    Call edit(parent, last_token) on the container holding the location, after copying the containers along the path.
+    '''
+    parent = document
+    for token in tokens[:-1]:
+        key = _child_key(parent, token)
+        if isinstance(parent, dict) and key not in parent:
+            raise ValueError(f'Key {key!r} not found')
+        child = parent[key]
+        if isinstance(child, (dict, list)):
+            child = child.copy()
+            parent[key] = child
+        parent = child
+    return edit(parent, tokens[-1])
+
+def set_value(document, tokens: List[str], value) -> Tuple[Any, bool, Any]:
+    '''
+    Set the value at the location. A missing key of a dict is added.
+    Returns the new document, whether the location existed, and the old value at the location.
+    '''
+    if not tokens:
+        return value, True, document
+
+    def edit(parent, token):
+        key = _child_key(parent, token)
+        existed = not isinstance(parent, dict) or key in parent
+        old_value = parent[key] if existed else None
+        parent[key] = value
+        return existed, old_value
+
+    existed, old_value = _edit_parent(document, tokens, edit)
+    return document, existed, old_value
+
+def insert_value(document, tokens: List[str], value) -> Tuple[Any, List[str]]:
+    '''
+    Insert the value into a list before the index, or add a new key to a dict.
+    Returns the new document and the tokens of the inserted value, with "-" resolved to an index.
+    '''
+    if not tokens:
+        raise ValueError('Cannot insert at the root')
+
+    def edit(parent, token):
+        key = _child_key(parent, token, allow_end=True)
+        if isinstance(parent, dict):
+            if key in parent:
+                raise ValueError(f'Key {key!r} already exists')
+            parent[key] = value
+        else:
+            parent.insert(key, value)
+        return str(key)
+
+    last = _edit_parent(document, tokens, edit)
+    return document, tokens[:-1] + [last]
+
+def remove_value(document, tokens: List[str]) -> Tuple[Any, Any]:
+    '''
+    Remove the item of a list or the key of a dict at the location.
+    Returns the new document and the removed value.
+    '''
+    if not tokens:
+        raise ValueError('Cannot remove the root')
+
+    def edit(parent, token):
+        key = _child_key(parent, token)
+        if isinstance(parent, dict) and key not in parent:
+            raise ValueError(f'Key {key!r} not found')
+        return parent.pop(key)
+
+    old_value = _edit_parent(document, tokens, edit)
+    return document, old_value
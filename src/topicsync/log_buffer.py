@@ -0,0 +1,125 @@
+'''
+A log buffer stores the newest entries of an append-only log in fixed-size segments. Every entry has a sequence
+number, which counts the entries ever appended. When the buffer is over its capacity, the oldest entries are dropped.
+Appending, dropping and reading an entry by sequence number cost O(1).
+'''
+import collections
+from typing import Any, Iterable, Iterator, List, Optional
+
+# Number of entries in a segment
+_SEGMENT_SIZE = 256
+
+class LogBuffer:
+    def __init__(self, items: Iterable[Any] = (), first_seq: int = 0, max_entries: Optional[int] = None):
+        self._segments: collections.deque[List[Any]] = collections.deque()
+        self._head = 0 # number of dropped entries in the first segment
+        self._len = 0
+        self._first_seq = first_seq
+        self._max_entries = max_entries
+        self.extend(items)
+
+    @property
+    def first_seq(self) -> int:
+        '''
+        The sequence number of the oldest stored entry.
+        '''
+        return self._first_seq
+
+    @property
+    def next_seq(self) -> int:
+        '''
+        The sequence number the next appended entry will get.
+        '''
+        return self._first_seq + self._len
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[Any]:
+        for i, segment in enumerate(self._segments):
+            yield from (segment[self._head:] if i == 0 else segment)
+
+    def __eq__(self, other):
+        if isinstance(other, LogBuffer):
+            other = other.to_list()
+        if not isinstance(other, list):
+            return NotImplemented
+        return self._len == len(other) and self.to_list() == other
+
+    __hash__ = None # type: ignore # mutable
+
+    def __repr__(self):
+        return f'LogBuffer({self.to_list()!r}, first_seq={self._first_seq})'
+
+    def to_list(self) -> List[Any]:
+        return list(self)
+
+    def set_max_entries(self, max_entries: Optional[int]):
+        '''
+        Set the capacity. None means unlimited. Entries over the capacity are dropped immediately.
+        '''
+        self._max_entries = max_entries
+        self._trim()
+
+    def extend(self, items: Iterable[Any]):
+        '''
+        Append entries, dropping the oldest ones if the buffer gets over its capacity.
+        '''
+        for item in items:
+            if not self._segments or len(self._segments[-1]) == _SEGMENT_SIZE:
+                self._segments.append([])
+            self._segments[-1].append(item)
+            self._len += 1
+        self._trim()
+
+    def pop_last(self, count: int) -> List[Any]:
+        '''
+        Remove the newest count entries and return them, oldest first.
+        '''
+        if not 0 <= count <= self._len:
+            raise IndexError(f'Cannot pop {count} entries from a log of {self._len} entries')
+        popped = []
+        remaining = count
+        while remaining:
+            segment = self._segments[-1]
+            start = self._head if len(self._segments) == 1 else 0
+            take = min(remaining, len(segment) - start)
+            popped.append(segment[len(segment) - take:])
+            del segment[len(segment) - take:]
+            remaining -= take
+            if len(segment) == start:
+                self._segments.pop()
+                if not self._segments:
+                    self._head = 0
+        self._len -= count
+        return [item for chunk in reversed(popped) for item in chunk]
+
+    def page(self, start_seq: int, end_seq: int) -> List[Any]:
+        '''
+        Get the stored entries with sequence numbers in [start_seq, end_seq).
+        '''
+        start = max(start_seq - self._first_seq, 0) + self._head
+        end = min(end_seq - self._first_seq, self._len) + self._head
+        result = []
+        while start < end:
+            segment = self._segments[start // _SEGMENT_SIZE]
+            offset = start % _SEGMENT_SIZE
+            chunk = segment[offset:offset + end - start]
+            result += chunk
+            start += len(chunk)
+        return result
+
+    def _trim(self):
+        if self._max_entries is None:
+            return
+        excess = self._len - self._max_entries
+        if excess <= 0:
+            return
+        self._len -= excess
+        self._first_seq += excess
+        self._head += excess
+        while self._segments and self._head >= len(self._segments[0]):
+            self._head -= len(self._segments[0])
+            self._segments.popleft()
+        if not self._segments:
+            self._head = 0
@@ -0,0 +1,95 @@
+'''
+Helpers for the value of ArrayTopic, an array.array of numbers.
+
+On the wire, an array is {"dtype": <dtype name>, "data": <base64 of the little-endian bytes>}, and slices in changes
+are the base64 data alone, whose dtype is the dtype of the topic. When NumPy is installed, adds on float arrays are
+vectorized over a view of the array's buffer. It is optional.
+'''
+import array
+import base64
+import sys
+from typing import Any, Dict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# dtype name -> array typecode. Typecodes with a platform-dependent size are not used.
+DTYPES = {
+    'int8': 'b', 'uint8': 'B', 'int16': 'h', 'uint16': 'H', 'int32': 'i', 'uint32': 'I',
+    'int64': 'q', 'uint64': 'Q', 'float32': 'f', 'float64': 'd',
+}
+_TYPECODE_TO_DTYPE = {typecode: dtype for dtype, typecode in DTYPES.items()}
+_FLOAT_TYPECODES = ('f', 'd')
+
+def dtype_of(values: array.array) -> str:
+    return _TYPECODE_TO_DTYPE[values.typecode]
+
+def encode_data(values: array.array) -> str:
+    if sys.byteorder == 'big':
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return base64.b64encode(values.tobytes()).decode('ascii')
+
+def decode_data(data: str, typecode: str) -> array.array:
+    '''
+    Raise ValueError if the data is not valid base64 or its length is not a multiple of the item size.
+    '''
+    values = array.array(typecode)
+    values.frombytes(base64.b64decode(data, validate=True))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+def encode(values: array.array) -> Dict[str, str]:
+    return {'dtype': dtype_of(values), 'data': encode_data(values)}
+
+def to_array(value: Any, dtype: str = 'float64') -> array.array:
+    '''
+    Convert an encoded array, an array.array, a NumPy array or an iterable of numbers to an array.array.
+    Raise ValueError if it can't be converted.
+    '''
+    if isinstance(value, dict):
+        if value.get('dtype') not in DTYPES:
+            raise ValueError(f'Unsupported dtype {value.get("dtype")!r}')
+        return decode_data(value.get('data', ''), DTYPES[value['dtype']])
+    if isinstance(value, array.array):
+        typecode = value.typecode
+        if typecode in ('l', 'L'):
+            # C long is 4 or 8 bytes depending on the platform
+            typecode = {4: {'l': 'i', 'L': 'I'}, 8: {'l': 'q', 'L': 'Q'}}[value.itemsize][typecode]
+        if typecode not in _TYPECODE_TO_DTYPE:
+            raise ValueError(f'Unsupported array typecode {typecode!r}')
+        return array.array(typecode, value)
+    if np is not None and isinstance(value, np.ndarray):
+        return to_array(value.ravel().tolist(), value.dtype.name)
+    try:
+        return array.array(DTYPES[dtype], value)
+    except (TypeError, OverflowError, KeyError) as e:
+        raise ValueError(f'Cannot convert to an array of {dtype}: {e}') from e
+
+def add_scalar(values: array.array, start: int, stop: int, delta):
+    '''
+    Add delta to values[start:stop] in place. Raise ValueError if the result doesn't fit the dtype.
+    '''
+    if np is not None and values.typecode in _FLOAT_TYPECODES:
+        np.frombuffer(values, dtype=values.typecode)[start:stop] += delta
+        return
+    try:
+        values[start:stop] = array.array(values.typecode, [x + delta for x in values[start:stop]])
+    except (TypeError, OverflowError) as e:
+        raise ValueError(str(e)) from e
+
+def add_elementwise(values: array.array, start: int, deltas: array.array):
+    '''
+    Add deltas to values[start:start+len(deltas)] element-wise, in place. Raise ValueError if the result doesn't fit the dtype.
+    '''
+    stop = start + len(deltas)
+    if np is not None and values.typecode in _FLOAT_TYPECODES:
+        np.frombuffer(values, dtype=values.typecode)[start:stop] += np.frombuffer(deltas, dtype=deltas.typecode)
+        return
+    try:
+        values[start:stop] = array.array(values.typecode, [x + d for x, d in zip(values[start:stop], deltas)])
+    except (TypeError, OverflowError) as e:
+        raise ValueError(str(e)) from e
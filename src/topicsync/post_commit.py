@@ -0,0 +1,137 @@
+'''
+Post-commit callbacks are added with Action.add_post_commit. While a transition is recorded, their calls are queued
+with snapshots of the arguments. After the transition commits, the state machine hands the queue to its
+PostCommitDispatcher, so the callbacks don't add to the time the transition takes. The queue of a failed transition
+is dropped.
+'''
+
+import asyncio
+from collections import deque
+from concurrent.futures import Executor
+import copy
+import logging
+import threading
+import traceback
+from typing import Any, Callable, Dict, List, Tuple
+logger = logging.getLogger(__name__)
+
+# callback, batch, args, kwargs
+PostCommitCall = Tuple[Callable, bool, tuple, dict]
+
+class _Pending(threading.local):
+    def __init__(self):
+        # The queue of the transition the thread is recording. None if not recording or there are no post-commit callbacks.
+        self.queue : List[PostCommitCall]|None = None
+
+pending = _Pending()
+
+_IMMUTABLE_TYPES = (str, int, float, bool, bytes, type(None))
+
+def snapshot(value:Any, topic=None) -> Any:
+    '''
+    Returns a value that post-commit callbacks can read later. The value of topic is not copied here: the topic is
+    marked as sharing it, and copies it before its next change. Other mutable values are deep-copied.
+    '''
+    if isinstance(value, _IMMUTABLE_TYPES):
+        return value
+    if topic is not None and topic._share_value(value):
+        return value
+    return copy.deepcopy(value)
+
+class PostCommitDispatcher:
+    '''
+    Runs post-commit callbacks after their transition commits.
+
+    - Coroutine functions run on loop.
+    - Other callbacks run in executor if it's given, else on loop if it's given, else right away in dispatch().
+    - With ordered, the calls of each callback run one at a time, in the order their transitions commit. Otherwise
+        they may run concurrently.
+
+    A batched callback is called once per transition, with a list of the (args, kwargs) of its calls.
+    '''
+    def __init__(self, loop:asyncio.AbstractEventLoop|None=None, executor:Executor|None=None, ordered:bool=True):
+        self._loop = loop
+        self._executor = executor
+        self._ordered = ordered
+        self._lock = threading.Lock()
+        # Calls waiting for the previous call of the same callback, when ordered. A callback has a lane while its
+        # calls are being run.
+        self._lanes : Dict[Callable, deque[Tuple[tuple,dict]]] = {}
+
+    def set_loop(self, loop:asyncio.AbstractEventLoop|None):
+        self._loop = loop
+
+    def dispatch(self, calls:List[PostCommitCall]):
+        invocations : Dict[Callable, List[Tuple[tuple,dict]]] = {}
+        batches : Dict[Callable, List[Tuple[tuple,dict]]] = {}
+        for callback, batch, args, kwargs in calls:
+            if batch:
+                batch_calls = batches.get(callback)
+                if batch_calls is None:
+                    batch_calls = batches[callback] = []
+                    invocations.setdefault(callback, []).append(((batch_calls,), {}))
+                batch_calls.append((args, kwargs))
+            else:
+                invocations.setdefault(callback, []).append((args, kwargs))
+
+        for callback, callback_invocations in invocations.items():
+            if self._ordered:
+                with self._lock:
+                    lane = self._lanes.get(callback)
+                    if lane is not None:
+                        # Its calls are being run. These will be run after them.
+                        lane.extend(callback_invocations)
+                        continue
+                    self._lanes[callback] = deque(callback_invocations)
+                self._run(callback, self._run_lane_async if asyncio.iscoroutinefunction(callback) else self._run_lane, callback)
+            else:
+                for args, kwargs in callback_invocations:
+                    self._run(callback, self._call_async if asyncio.iscoroutinefunction(callback) else self._call, callback, args, kwargs)
+
+    def _run(self, callback:Callable, runner:Callable, *args):
+        if asyncio.iscoroutinefunction(callback):
+            loop = self._loop
+            if loop is None:
+                try:
+                    loop = asyncio.get_running_loop()
+                except RuntimeError:
+                    logger.error(f"Can't run the coroutine post-commit callback {callback} without a loop")
+                    return
+            asyncio.run_coroutine_threadsafe(runner(*args), loop)
+        elif self._executor is not None:
+            self._executor.submit(runner, *args)
+        elif self._loop is not None:
+            self._loop.call_soon_threadsafe(runner, *args)
+        else:
+            runner(*args)
+
+    def _next_in_lane(self, callback:Callable) -> Tuple[tuple,dict]|None:
+        with self._lock:
+            lane = self._lanes[callback]
+            if not lane:
+                del self._lanes[callback]
+                return None
+            return lane.popleft()
+
+    def _run_lane(self, callback:Callable):
+        while (invocation := self._next_in_lane(callback)) is not None:
+            self._call(callback, *invocation)
+
+    async def _run_lane_async(self, callback:Callable):
+        while (invocation := self._next_in_lane(callback)) is not None:
+            await self._call_async(callback, *invocation)
+
+    def _call(self, callback:Callable, args:tuple, kwargs:dict):
+        try:
+            callback(*args, **kwargs)
+        except Exception:
+            logger.error(f"An error has occured in the post-commit callback {callback}. The error was:\n{traceback.format_exc()}")
+
+    async def _call_async(self, callback:Callable, args:tuple, kwargs:dict):
+        try:
+            await callback(*args, **kwargs)
+        except Exception:
+            logger.error(f"An error has occured in the post-commit callback {callback}. The error was:\n{traceback.format_exc()}")
+
+# Dispatches the calls of actions that don't belong to a state machine
+default_dispatcher = PostCommitDispatcher()
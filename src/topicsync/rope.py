@@ -0,0 +1,186 @@
+'''
+A rope is a string stored as a balanced tree of chunks. Inserting or deleting a substring costs O(log n) instead of
+rebuilding the whole string. StringTopic can use it as the backing store of large documents.
+'''
+from __future__ import annotations
+import random
+from typing import List, Optional, Tuple
+
+# Edits that fit in a chunk of this size are done in place instead of creating new nodes
+_MAX_CHUNK = 512
+
+class _Node:
+    __slots__ = ('text', 'priority', 'left', 'right', 'length')
+
+    def __init__(self, text: str):
+        self.text = text
+        self.priority = random.random()
+        self.left: Optional[_Node] = None
+        self.right: Optional[_Node] = None
+        self.length = len(text)
+
+    def update(self):
+        self.length = len(self.text) + _length(self.left) + _length(self.right)
+
+def _length(node: Optional[_Node]) -> int:
+    return node.length if node is not None else 0
+
+def _merge(a: Optional[_Node], b: Optional[_Node]) -> Optional[_Node]:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a.priority > b.priority:
+        a.right = _merge(a.right, b)
+        a.update()
+        return a
+    b.left = _merge(a, b.left)
+    b.update()
+    return b
+
+def _split(node: Optional[_Node], pos: int) -> Tuple[Optional[_Node], Optional[_Node]]:
+    '''
+    Split the tree into the first pos characters and the rest.
+    '''
+    if node is None:
+        return None, None
+    left_length = _length(node.left)
+    if pos <= left_length:
+        left, node.left = _split(node.left, pos)
+        node.update()
+        return left, node
+    if pos >= left_length + len(node.text):
+        node.right, right = _split(node.right, pos - left_length - len(node.text))
+        node.update()
+        return node, right
+    # The split point is inside this node's chunk
+    offset = pos - left_length
+    right_node = _Node(node.text[offset:])
+    node.text = node.text[:offset]
+    right_node.right, node.right = node.right, None
+    right_node.update()
+    node.update()
+    return node, right_node
+
+def _build(text: str) -> Optional[_Node]:
+    root = None
+    for i in range(0, len(text), _MAX_CHUNK):
+        root = _merge(root, _Node(text[i:i + _MAX_CHUNK]))
+    return root
+
+class Rope:
+    def __init__(self, text: str = ''):
+        self._root = _build(text)
+        self._flat: Optional[str] = text # cache of str(self), dropped on every edit
+
+    def __len__(self):
+        return _length(self._root)
+
+    def __str__(self):
+        if self._flat is None:
+            self._flat = ''.join(self._chunks(self._root))
+        return self._flat
+
+    def __repr__(self):
+        return f'Rope({str(self)!r})'
+
+    def __eq__(self, other):
+        if isinstance(other, Rope):
+            other = str(other)
+        if not isinstance(other, str):
+            return NotImplemented
+        return len(self) == len(other) and str(self) == other
+
+    __hash__ = None # type: ignore # mutable
+
+    def _chunks(self, node: Optional[_Node]) -> List[str]:
+        # iterative in-order traversal
+        chunks = []
+        stack = []
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            chunks.append(node.text)
+            node = node.right
+        return chunks
+
+    def _locate(self, pos: int) -> Tuple[List[_Node], int]:
+        '''
+        Find the node whose chunk contains the cursor position. Return the path from the root to the node and the offset in the chunk.
+        A cursor between two chunks is located at the end of the left one.
+        '''
+        path = []
+        node = self._root
+        while node is not None:
+            path.append(node)
+            left_length = _length(node.left)
+            if pos < left_length:
+                node = node.left
+            elif pos <= left_length + len(node.text):
+                return path, pos - left_length
+            else:
+                pos -= left_length + len(node.text)
+                node = node.right
+        return path, pos
+
+    def substring(self, start: int, end: int) -> str:
+        start, end = max(start, 0), max(end, 0)
+        if self._flat is not None:
+            return self._flat[start:end]
+        result = []
+        # Each stack item is a subtree or a chunk, with the position of its first character.
+        # Subtrees that don't overlap [start, end) are skipped.
+        stack: List[Tuple[Optional[_Node] | str, int]] = [(self._root, 0)]
+        while stack:
+            item, offset = stack.pop()
+            if isinstance(item, str):
+                if offset < end and offset + len(item) > start:
+                    result.append(item[max(start - offset, 0):end - offset])
+                continue
+            if item is None or offset >= end or offset + item.length <= start:
+                continue
+            text_start = offset + _length(item.left)
+            stack.append((item.right, text_start + len(item.text)))
+            stack.append((item.text, text_start))
+            stack.append((item.left, offset))
+        return ''.join(result)
+
+    def insert(self, pos: int, text: str):
+        if not text:
+            return
+        self._flat = None
+        path, offset = self._locate(pos)
+        if path and len(path[-1].text) + len(text) <= _MAX_CHUNK:
+            node = path[-1]
+            node.text = node.text[:offset] + text + node.text[offset:]
+            for node in path:
+                node.length += len(text)
+            return
+        left, right = _split(self._root, pos)
+        self._root = _merge(_merge(left, _build(text)), right)
+
+    def delete(self, pos: int, text: str):
+        '''
+        Delete text at pos. Raise ValueError if the text does not appear at pos.
+        '''
+        if not text:
+            return
+        path, offset = self._locate(pos)
+        if path and offset + len(text) < len(path[-1].text):
+            node = path[-1]
+            if not node.text.startswith(text, offset):
+                raise ValueError(f"'{text}' doesn't appear at position {pos}")
+            self._flat = None
+            node.text = node.text[:offset] + node.text[offset + len(text):]
+            for node in path:
+                node.length -= len(text)
+            return
+        left, rest = _split(self._root, pos)
+        middle, right = _split(rest, len(text))
+        if _length(middle) != len(text) or ''.join(self._chunks(middle)) != text:
+            self._root = _merge(_merge(left, middle), right)
+            raise ValueError(f"'{text}' doesn't appear at position {pos}")
+        self._flat = None
+        self._root = _merge(left, right)
@@ -2,15 +2,17 @@
 import asyncio
 import json
 import logging
+import threading
 from topicsync.server.update_buffer import UpdateBuffer
+from topicsync.server.init_message_cache import InitMessageCache
 
 from topicsync.state_machine.state_machine import ALREADY_LOGGED_ERROR_NOTE, StateMachine
 from topicsync.utils import SimpleAction
 logger = logging.getLogger(__name__)
 import traceback
-from typing import Awaitable, Callable, Dict, List, Tuple, AsyncIterator, Protocol
+from typing import Any, Awaitable, Callable, Dict, List, Tuple, AsyncIterator, Protocol
 from itertools import count
-from collections import defaultdict
+from collections import defaultdict, deque
 
 from topicsync.change import Change, SetChange
 
@@ -36,7 +38,7 @@ class ConnectionClosedException(Exception):
         return repr(self._inner_exception)
 
 class Client:
-    def __init__(self, id, comm: ClientCommProtocol, sending_queue:asyncio.Queue[Tuple['Client',Tuple,Dict]]):
+    def __init__(self, id, comm: ClientCommProtocol, sending_queue:asyncio.Queue[Tuple['Client',str|dict]]):
         self.id = id
         self._comm = comm
         self._sending_queue = sending_queue
@@ -46,14 +48,29 @@ class Client:
         logger.debug(f"<{self.id} {message[:100]}")
 
     async def send_async(self,*args,**kwargs):
+        await self.send_raw_async(make_message(*args,**kwargs))
+
+    async def send_raw_async(self,message:str):
         try:
-            await self._send_raw(make_message(*args,**kwargs))
+            await self._send_raw(message)
         except Exception as e:
-            print(f"Error sending message to client, args: {args}, kwargs: {kwargs}",e)
+            print(f"Error sending message to client, message: {message[:100]}",e)
             raise
 
     def send(self,*args,**kwargs):
-        self._sending_queue.put_nowait((self,args,kwargs))
+        self.send_raw(make_message(*args,**kwargs))
+
+    def send_raw(self,message:str):
+        '''
+        Queue an already encoded message.
+        '''
+        self._sending_queue.put_nowait((self,message))
+
+    def queue_update(self,changes:List[dict],action_id:str):
+        '''
+        Queue an update to be merged with the other updates queued for the client in the same tick.
+        '''
+        self._sending_queue.put_nowait((self,{"changes":changes,"action_id":action_id}))
 
     @property
     def messages(self) -> AsyncIterator[str]:
@@ -61,30 +78,74 @@ class Client:
 
 ClientCommFactory = Callable[[], ClientCommProtocol]
 class ClientManager:
-    def __init__(self,state_machine:StateMachine) -> None:
+    def __init__(self,state_machine:StateMachine,group_commit:bool=False) -> None:
+        '''
+        With group_commit, the updates queued for a client while the sending loop is busy are sent as one
+        `update_batch` message, whose `updates` are the {changes, action_id} of each update in order.
+        '''
         self._state_machine = state_machine
+        self._group_commit = group_commit
         self._clients:Dict[int,Client] = {}
         self._client_id_count = count(1)
         self._message_handlers:Dict[str,Callable[...,None|Awaitable[None]]] = {'subscribe':self._handle_subscribe,
                                                                                'unsubscribe':self._handle_unsubscribe,}
         self._subscriptions:defaultdict[str,set] =defaultdict(set)
-        self._sending_queue:asyncio.Queue[Tuple[Client,Tuple,Dict]] = asyncio.Queue()
-
-        self._update_buffer = UpdateBuffer(self._state_machine,self.send_update)
+        self._sending_queue:asyncio.Queue[Tuple[Client,str|dict]] = asyncio.Queue()
+        self._init_message_cache = InitMessageCache(make_message)
+        # don't keep removed topics alive
+        self._state_machine.get_topic('_topicsync/topic_list').on_remove += self._init_message_cache.discard
+
+        self._update_buffer = UpdateBuffer(self._state_machine,self.send_update,self.send_ack)
+        self.set_rate_limit = self._update_buffer.set_rate_limit
+        # Updates of transitions run in other threads, waiting to be added to the buffer by the event loop
+        self._pending_updates:deque[Tuple[List[Change],str]] = deque()
+        self._loop:asyncio.AbstractEventLoop|None = None
+        self._loop_thread_id:int|None = None
         self.on_client_connect = SimpleAction()
         self.on_client_disconnect = SimpleAction()
 
     async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
         asyncio.get_event_loop().create_task(self._update_buffer.run())
         while True:
-            client,args,kwargs = await self._sending_queue.get()
-            try:
-                await client.send_async(*args,**kwargs)
-            except ConnectionClosedException:
-                self._cleanup_client(client)
+            messages = [await self._sending_queue.get()]
+            if self._group_commit:
+                while not self._sending_queue.empty():
+                    messages.append(self._sending_queue.get_nowait())
+                messages = self._group_updates(messages)
+            for client,message in messages:
+                try:
+                    await client.send_raw_async(message) # type: ignore
+                except ConnectionClosedException:
+                    self._cleanup_client(client)
+
+    def _group_updates(self,messages:List[Tuple[Client,str|dict]]) -> List[Tuple[Client,str]]:
+        '''
+        Merge the queued updates of each client into one message. Other messages to the client stay in order with them.
+        '''
+        grouped:List[Tuple[Client,str]] = []
+        pending_updates:Dict[Client,List[dict]] = {}
+        def send_pending_updates(client:Client):
+            updates = pending_updates.pop(client)
+            if len(updates) == 1:
+                grouped.append((client,make_message("update",**updates[0])))
+            else:
+                grouped.append((client,make_message("update_batch",updates=updates)))
+
+        for client,message in messages:
+            if isinstance(message,str):
+                if client in pending_updates:
+                    send_pending_updates(client)
+                grouped.append((client,message))
+            else:
+                pending_updates.setdefault(client,[]).append(message)
+        for client in list(pending_updates):
+            send_pending_updates(client)
+        return grouped
 
     def send(self,client:Client,*args,**kwargs):
-        self._sending_queue.put_nowait((client,args,kwargs))
+        client.send(*args,**kwargs)
 
 
     async def handle_client(self, client_comm: ClientCommProtocol):
@@ -94,28 +155,30 @@ class ClientManager:
 
         client_id = next(self._client_id_count)
         client = self._clients[client_id] = Client(client_id, client_comm, self._sending_queue)
+        # Messages are received into inbound while earlier ones are handled, so the ones piled up can be coalesced
+        inbound:asyncio.Queue[str|Exception|None] = asyncio.Queue()
+        receiver = None
 
         try:
             logger.info(f"Client {client_id} connected")
             await client.send_async("hello",id=client_id)
             self.on_client_connect.invoke(client_id)
 
-            async for message in client.messages:
-                logger.debug(f"> {message[:100]}")
-
-                message_type, args = parse_message(message)
-                if message_type not in self._message_handlers:
-                    logger.error(f"Unknown message type: {message_type}")
-                    continue
-
-                try:
-                    return_value = self._message_handlers[message_type](sender = client,**args)
-                    if isinstance(return_value,Awaitable):
-                        await return_value
-                except Exception as e:
-                    if not hasattr(e,"__notes__") or ALREADY_LOGGED_ERROR_NOTE not in e.__notes__:
-                        logger.warn(f"Error handling message {message_type}:\n{traceback.format_exc()}")
-                    continue
+            receiver = asyncio.get_running_loop().create_task(self._receive(client,inbound))
+            while True:
+                received = [await inbound.get()]
+                while not inbound.empty():
+                    received.append(inbound.get_nowait())
+                messages = [parse_message(message) for message in received if isinstance(message,str)]
+                for message_type, args, dropped in self._coalesce_actions(messages):
+                    if dropped:
+                        await self._handle_action_with_dropped(client,args,dropped)
+                    else:
+                        await self._handle_message(client,message_type,args)
+                if isinstance(received[-1],Exception):
+                    raise received[-1]
+                if received[-1] is None:
+                    break
 
         except ConnectionClosedException as e:
             logger.info(f"Client {client_id} disconnected: {repr(e)}")
@@ -123,9 +186,102 @@ class ClientManager:
         except Exception as e:
             logger.error(f"Error handling client {client_id}:\n{traceback.format_exc()}")
             self._cleanup_client(client)
+        finally:
+            if receiver is not None:
+                receiver.cancel()
+
+    async def _receive(self, client:Client, inbound:asyncio.Queue[str|Exception|None]):
+        '''
+        Put the messages of the client into inbound, then None when the connection ends, or the error receiving them.
+        '''
+        try:
+            async for message in client.messages:
+                logger.debug(f"> {message[:100]}")
+                inbound.put_nowait(message)
+        except Exception as e:
+            inbound.put_nowait(e)
+        else:
+            inbound.put_nowait(None)
+
+    async def _handle_message(self, client:Client, message_type:str, args:dict):
+        '''
+        Returns what the handler returns. The action handler returns the reason the action is rejected, if it is.
+        '''
+        if message_type not in self._message_handlers:
+            logger.error(f"Unknown message type: {message_type}")
+            return
+
+        try:
+            return_value = self._message_handlers[message_type](sender = client,**args)
+            if isinstance(return_value,Awaitable):
+                return_value = await return_value
+            return return_value
+        except Exception as e:
+            if not hasattr(e,"__notes__") or ALREADY_LOGGED_ERROR_NOTE not in e.__notes__:
+                logger.warn(f"Error handling message {message_type}:\n{traceback.format_exc()}")
+            return repr(e)
+
+    async def _handle_action_with_dropped(self, client:Client, args:dict, dropped:List[dict]):
+        '''
+        Handle an action that superseded the dropped actions, then acknowledge them. If it is rejected, the latest
+        dropped action is handled in its place.
+        '''
+        while await self._handle_message(client,'action',args) is not None and dropped:
+            args = dropped.pop()
+        for dropped_args in dropped:
+            self._acknowledge(client,dropped_args.get('action_id',''))
+
+    def _coalesce_actions(self, messages:List[Tuple[str,dict]]) -> List[Tuple[str,dict,List[dict]]]:
+        '''
+        Drop the actions that only set a topic which is not order strict, when a later action among the consecutive
+        actions in messages sets it again. Returns the kept messages, each with the args of the actions it superseded,
+        oldest first. Those are acknowledged once it is applied.
+        '''
+        if len(messages) < 2:
+            return [(message_type,args,[]) for message_type, args in messages]
+        kept:List[Tuple[str,dict,List[dict]]] = []
+        superseded : Dict[str,List[dict]] = {} # topics set by the later actions, to the actions they drop
+        for message_type, args in reversed(messages):
+            if message_type != 'action':
+                superseded.clear()
+                kept.append((message_type,args,[]))
+                continue
+            commands = args.get('commands',())
+            set_topics = [command.get('topic_name') for command in commands if command.get('type') == 'set' and self._is_coalescable(command.get('topic_name'))]
+            if len(commands) == 1 and set_topics and set_topics[0] in superseded:
+                superseded[set_topics[0]].insert(0,args)
+                continue
+            dropped = []
+            for topic_name in set_topics:
+                superseded[topic_name] = dropped
+            kept.append((message_type,args,dropped))
+        kept.reverse()
+        return kept
+
+    def _acknowledge(self, client:Client, action_id:str):
+        '''
+        Send an empty update for an action whose changes won't be sent.
+        '''
+        if self._group_commit:
+            client.queue_update([],action_id)
+        else:
+            self.send(client,"update",changes=[],action_id=action_id)
+
+    def _is_coalescable(self, topic_name) -> bool:
+        return self._state_machine.has_topic(topic_name) and not self._state_machine.get_topic(topic_name).is_order_strict()
 
     def send_update_or_buffer(self,changes:List[Change],action_id:str):
-        self._update_buffer.add_changes(changes,action_id)
+        if self._loop is None or threading.get_ident() == self._loop_thread_id:
+            self._add_pending_updates()
+            self._update_buffer.add_changes(changes,action_id)
+        else:
+            # The buffer and the sending queue belong to the event loop
+            self._pending_updates.append((changes,action_id))
+            self._loop.call_soon_threadsafe(self._add_pending_updates)
+
+    def _add_pending_updates(self):
+        while self._pending_updates:
+            self._update_buffer.add_changes(*self._pending_updates.popleft())
 
     def send_update(self,changes:List[Change],action_id:str):
         '''
@@ -138,14 +294,25 @@ class ClientManager:
 
         for client_id in messages_for_client:
             client = self._clients[client_id]
-            self.send(client,"update",changes=messages_for_client[client_id],action_id=action_id)
+            if self._group_commit:
+                client.queue_update(messages_for_client[client_id],action_id)
+            else:
+                self.send(client,"update",changes=messages_for_client[client_id],action_id=action_id)
     
-    def register_message_handler(self,message_type:str,handler:Callable[...,None|Awaitable[None]]):
+    def send_ack(self,topic_name:str,action_id:str):
+        '''
+        Send an empty update with action_id to the clients subscribed to the topic, acknowledging an action whose changes
+        won't be sent.
+        '''
+        for client_id in self._subscriptions[topic_name]:
+            self._acknowledge(self._clients[client_id],action_id)
+
+    def register_message_handler(self,message_type:str,handler:Callable[...,Any|Awaitable[Any]]):
         self._message_handlers[message_type] = handler
 
     def _cleanup_client(self,client:Client):
         for topic in self._subscriptions:
-            self._subscriptions[topic].discard(client.id)
+            self._discard_subscription(client.id,topic)
         self.on_client_disconnect.invoke(client.id)
 
     def _handle_subscribe(self,sender:Client,topic_name:str):
@@ -155,15 +322,51 @@ class ClientManager:
             #logger.warning(f"Client {sender.id} tried to subscribe to non-existing topic {topic_name}")
             return
         
-        self._update_buffer.flush() # clear the buffer before sending `init` so the client starts at a correct state
+        # Wait for the transition changing the topic, if any. Its updates are pending when it releases the lock.
+        lock = self._state_machine.domain_lock_of(topic_name)
+        if not lock.acquire(blocking=False):
+            return self._subscribe_when_unlocked(sender,topic_name,lock)
+        try:
+            self._subscribe(sender,topic_name)
+        finally:
+            lock.release()
 
-        self._subscriptions[topic_name].add(sender.id)
+    async def _subscribe_when_unlocked(self,sender:Client,topic_name:str,lock:threading.RLock):
+        '''
+        A transition in a worker thread holds the topic's domain. Poll the lock instead of blocking the event loop, which
+        the other clients and the transition itself may be waiting on.
+        '''
+        delay = 0.001
+        while not lock.acquire(blocking=False):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+        try:
+            if self._state_machine.has_topic(topic_name):
+                self._subscribe(sender,topic_name)
+        finally:
+            lock.release()
+
+    def _subscribe(self,sender:Client,topic_name:str):
+        self._add_pending_updates()
+        self._update_buffer.flush(topic_name) # clear the buffer before sending `init` so the client starts at a correct state
+
+        subscribers = self._subscriptions[topic_name]
+        subscribers.add(sender.id)
+        if len(subscribers) == 1:
+            self._state_machine.get_topic(topic_name).set_observed(True)
         logger.debug(f"Client {sender.id} subscribed to {topic_name}")
-        msg = self._state_machine.get_topic(topic_name).get_init_message()
-        self.send(sender,"init",**msg)
+        # Clients subscribing between two changes of the topic share the same encoded message
+        sender.send_raw(self._init_message_cache.get(self._state_machine.get_topic(topic_name)))
 
     def _handle_unsubscribe(self,sender:Client,topic_name:str):
-        self._subscriptions[topic_name].discard(sender.id)
+        self._discard_subscription(sender.id,topic_name)
+
+    def _discard_subscription(self,client_id:int,topic_name:str):
+        subscribers = self._subscriptions[topic_name]
+        if client_id in subscribers:
+            subscribers.discard(client_id)
+            if not subscribers and self._state_machine.has_topic(topic_name):
+                self._state_machine.get_topic(topic_name).set_observed(False)
     
     def set_client_id_count(self,id_count):
         self._client_id_count = count(id_count)
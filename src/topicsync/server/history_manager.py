@@ -1,29 +1,161 @@
+from collections import deque
+import json
+import pickle
+import tempfile
+import time
+from typing import IO, Dict, List
 from topicsync.server.server import TopicsyncServer
 from topicsync.state_machine.state_machine import StateMachine, Transition
 
 
+class _HistoryEntry:
+    __slots__ = ('transition','size','topic_names')
+    def __init__(self,transition:Transition,size:int,topic_names:frozenset[str]):
+        self.transition = transition
+        self.size = size
+        self.topic_names = topic_names
+
+class _History:
+    '''
+    The undo and redo stacks of an action source, or of all sources if they share one history
+    '''
+    def __init__(self,spill_to_disk:bool):
+        self.undo_stack : deque[_HistoryEntry] = deque()
+        self.redo_stack : List[Transition] = []
+        self.size = 0 # estimated bytes of the transitions in undo_stack
+        self.mergeable_until : float|None = None # a transition added before this time can be merged into the last one
+        self.spill_to_disk = spill_to_disk
+        # Transitions dropped from undo_stack are pickled to spill_file, the latest one at the end. The file is created
+        # when the first transition is spilled and closed when the last one is loaded back.
+        self.spill_file : IO[bytes]|None = None
+        self.spill_offsets : List[int] = []
+
+    def spill(self,transition:Transition):
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile()
+        self.spill_file.seek(0,2)
+        self.spill_offsets.append(self.spill_file.tell())
+        pickle.dump(transition,self.spill_file,pickle.HIGHEST_PROTOCOL)
+
+    def load_spilled(self) -> Transition:
+        assert self.spill_file is not None
+        offset = self.spill_offsets.pop()
+        self.spill_file.seek(offset)
+        transition = pickle.load(self.spill_file)
+        self.spill_file.truncate(offset)
+        if not self.spill_offsets:
+            self.close()
+        return transition
+
+    def close(self):
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+            self.spill_offsets.clear()
+
 class HistoryManager:
     '''
-    A simple history manager that stores transitions and a pointer to the current transition
+    A history manager that stores transitions for undo and redo
+
+    - max_transitions, max_bytes: When the undo stack of a history is longer or larger than these, its oldest
+        transitions are dropped. The size of a transition is estimated by the length of its serialized changes.
+    - merge_interval: A transition is merged with the previous one into one undo step if they change the same topics,
+        come from the same action source, and the previous one was added less than merge_interval seconds before.
+        For example, a burst of typing in a string topic.
+    - per_source: Keep a history for each action source. undo() and redo() take the action source. Undoing a
+        transition of one source doesn't transform its changes against later changes of other sources, so it may fail
+        or apply at stale positions if they changed the same topics. set_server() with a TopicsyncServer discards the
+        history of a client when it disconnects, see discard_source().
+    - spill_to_disk: Instead of dropping the oldest transitions, write them to a temporary file. They are loaded back
+        when undone.
     '''
-    def __init__(self):
-        self._history = []
-        self._current_ptr = -1
-    
+    def __init__(self,max_transitions:int|None=None,max_bytes:int|None=None,merge_interval:float=0,per_source:bool=False,spill_to_disk:bool=False):
+        self._max_transitions = max_transitions
+        self._max_bytes = max_bytes
+        self._merge_interval = merge_interval
+        self._per_source = per_source
+        self._spill_to_disk = spill_to_disk
+        self._histories : Dict[int|None,_History] = {}
+
     def set_server(self,topicsync:TopicsyncServer|StateMachine):
         self._topicsync = topicsync
+        if self._per_source and isinstance(topicsync,TopicsyncServer):
+            topicsync.on_client_disconnect += self.discard_source
+
+    def discard_source(self,action_source:int|None):
+        '''
+        Forget the history of an action source, which won't undo or redo anymore.
+        '''
+        history = self._histories.pop(action_source if self._per_source else None,None)
+        if history is not None:
+            history.close()
+
+    def _get_history(self,action_source:int|None) -> _History:
+        key = action_source if self._per_source else None
+        history = self._histories.get(key)
+        if history is None:
+            history = self._histories[key] = _History(self._spill_to_disk)
+        return history
+
+    def _make_entry(self,transition:Transition) -> _HistoryEntry:
+        size = 0
+        if self._max_bytes is not None:
+            size = sum(len(json.dumps(change.serialize(),default=repr)) for change in transition.changes)
+        return _HistoryEntry(transition,size,frozenset(change.topic_name for change in transition.changes))
 
     def add_transition(self,transition:Transition):
-        self._current_ptr += 1
-        self._history = self._history[:self._current_ptr]
-        self._history.append(transition)
-        
-    def undo(self):
-        if len(self._history) > 0 and self._current_ptr >= 0:
-            self._topicsync.undo(self._history[self._current_ptr])
-            self._current_ptr -= 1
-
-    def redo(self):
-        if self._current_ptr < len(self._history)-1:
-            self._current_ptr += 1
-            self._topicsync.redo(self._history[self._current_ptr])
+        history = self._get_history(transition.action_source)
+        history.redo_stack.clear()
+        entry = self._make_entry(transition)
+
+        if history.mergeable_until is not None and history.undo_stack:
+            now = time.monotonic()
+            last = history.undo_stack[-1]
+            if now <= history.mergeable_until and last.topic_names == entry.topic_names \
+                    and last.transition.action_source == transition.action_source:
+                history.undo_stack.pop()
+                history.size -= last.size
+                merged = Transition(last.transition.changes + transition.changes,transition.action_source)
+                entry = _HistoryEntry(merged,last.size + entry.size,last.topic_names)
+
+        history.undo_stack.append(entry)
+        history.size += entry.size
+        if self._merge_interval:
+            history.mergeable_until = time.monotonic() + self._merge_interval
+        self._trim(history)
+
+    def _trim(self,history:_History):
+        while history.undo_stack and (
+                (self._max_transitions is not None and len(history.undo_stack) > self._max_transitions) or
+                (self._max_bytes is not None and history.size > self._max_bytes)):
+            oldest = history.undo_stack.popleft()
+            history.size -= oldest.size
+            if history.spill_to_disk:
+                history.spill(oldest.transition)
+
+    def undo(self,action_source:int|None=None):
+        history = self._histories.get(action_source if self._per_source else None)
+        if history is None:
+            return
+        if not history.undo_stack and history.spill_offsets:
+            entry = self._make_entry(history.load_spilled())
+            history.undo_stack.append(entry)
+            history.size += entry.size
+        if len(history.undo_stack) > 0:
+            self._topicsync.undo(history.undo_stack[-1].transition)
+            entry = history.undo_stack.pop()
+            history.size -= entry.size
+            history.redo_stack.append(entry.transition)
+        history.mergeable_until = None
+
+    def redo(self,action_source:int|None=None):
+        history = self._histories.get(action_source if self._per_source else None)
+        if history is None:
+            return
+        if len(history.redo_stack) > 0:
+            self._topicsync.redo(history.redo_stack[-1])
+            entry = self._make_entry(history.redo_stack.pop())
+            history.undo_stack.append(entry)
+            history.size += entry.size
+            self._trim(history)
+        history.mergeable_until = None
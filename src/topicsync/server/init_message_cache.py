@@ -0,0 +1,41 @@
+from collections import OrderedDict
+from typing import Callable, Tuple
+
+from topicsync.topic import Topic
+
+
+class InitMessageCache:
+    '''
+    Caches the encoded `init` message of topics, so clients subscribing to a topic that has not changed since the last
+    subscription reuse the same frame instead of copying and encoding the value again.
+
+    An entry is valid as long as the topic object and its revision are the same as when the entry was encoded.
+    The least recently used entries are evicted when there are more than `max_entries` entries.
+    '''
+    def __init__(self, encode: Callable[..., str], max_entries: int = 256):
+        self._encode = encode
+        self._max_entries = max_entries
+        self._entries: OrderedDict[str, Tuple[Topic, int, str]] = OrderedDict()
+
+    def get(self, topic: Topic) -> str:
+        '''
+        Get the encoded init message of the topic, encoding it if the cached one is missing or stale.
+        '''
+        name = topic.get_name()
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] is topic and entry[1] == topic.get_revision():
+            self._entries.move_to_end(name)
+            return entry[2]
+
+        message = self._encode("init", **topic.get_init_message())
+        self._entries[name] = (topic, topic.get_revision(), message)
+        self._entries.move_to_end(name)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+        return message
+
+    def discard(self, topic_name: str):
+        self._entries.pop(topic_name, None)
+
+    def __len__(self):
+        return len(self._entries)
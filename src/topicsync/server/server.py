@@ -1,5 +1,7 @@
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import os
+import threading
 import traceback
 from typing import Any, Callable, Dict, List, TypeVar, Optional, Awaitable, AsyncIterator, Protocol
 import logging
@@ -14,8 +16,9 @@ from topicsync.server.client_manager import ClientManager, Client, ClientCommPro
     ClientCommFactory
 from topicsync.service import Service
 from topicsync.state_machine.state_machine import ALREADY_LOGGED_ERROR_NOTE, StateMachine, Transition
-from topicsync.topic import DictTopic, EventTopic, Topic, SetTopic
+from topicsync.topic import DerivedTopic, DictTopic, EventTopic, LogTopic, Topic, SetTopic
 from topicsync.change import Change
+from topicsync.post_commit import PostCommitDispatcher
 
 from topicsync_debugger import Debugger
 
@@ -28,17 +31,32 @@ class ClientServer(Protocol):
 class TopicsyncServer:
     # The init stays the same for backwards compatibility
     # though I would recommend to replace it with _initialize
-    def __init__(self, transition_callback=lambda transition:None) -> None:
+    def __init__(self, transition_callback=lambda transition:None, lock_domain_of:Callable[[str],Any]|None=None, action_workers:int=0,
+                 group_commit:bool=False, post_commit_workers:int=0) -> None:
+        '''
+        Set lock_domain_of and action_workers to handle actions of clients in action_workers threads. Actions changing
+        topics in different lock domains (see StateMachine) run in parallel.
+        Set group_commit to send the updates queued for a client in one `update_batch` message (see ClientManager).
+        Clients must support `update_batch`.
+        Post-commit callbacks (see Action.add_post_commit) run on the event loop, or in post_commit_workers threads if
+        it's set.
+        '''
         self.debug = os.environ.get('DEBUG') is not None and (os.environ.get('DEBUG').lower() == 'true')
         debugger = Debugger(8800, 'localhost') if self.debug else None
         
-        self._initialize(debugger, transition_callback)
+        self._initialize(debugger, transition_callback, lock_domain_of, action_workers, group_commit, post_commit_workers)
 
-    def _initialize(self, debugger: Optional[Debugger], transition_callback):
+    def _initialize(self, debugger: Optional[Debugger], transition_callback, lock_domain_of:Callable[[str],Any]|None=None, action_workers:int=0,
+                    group_commit:bool=False, post_commit_workers:int=0):
         self._services: Dict[str, Service] = {}
+        self._derived_topics: Dict[str, tuple] = {} # compute and dependencies of derived topics, kept after removal for undo
         self._debugger = debugger
+        self._post_commit_dispatcher = PostCommitDispatcher(
+            executor=ThreadPoolExecutor(post_commit_workers, thread_name_prefix='topicsync-post-commit') if post_commit_workers else None)
         self._state_machine = StateMachine(self._changes_callback, transition_callback,
-                                           self._debugger.push_changes_tree if self.debug else None)
+                                           self._debugger.push_changes_tree if self.debug else None,
+                                           lock_domain_of=lock_domain_of, post_commit_dispatcher=self._post_commit_dispatcher)
+        self._action_executor = ThreadPoolExecutor(action_workers, thread_name_prefix='topicsync-action') if action_workers else None
 
         self._topic_list = self._state_machine.add_topic("_topicsync/topic_list", DictTopic, is_stateful=True,
                                                          init_value=
@@ -48,7 +66,7 @@ class TopicsyncServer:
         self._topic_list.on_add += self._add_topic_raw
         self._topic_list.on_remove += self._remove_topic_raw
 
-        self._client_manager = ClientManager(self._state_machine)
+        self._client_manager = ClientManager(self._state_machine, group_commit)
         self.set_client_id_count = self._client_manager.set_client_id_count
         self.get_client_id_count = self._client_manager.get_client_id_count
 
@@ -57,7 +75,9 @@ class TopicsyncServer:
         self.on_client_connect = self._client_manager.on_client_connect
         self.on_client_disconnect = self._client_manager.on_client_disconnect
 
-        self._action_source = 0
+        self._thread = threading.local() # holds action_source
+
+        self.register_service("_topicsync/log_page", self._get_log_page)
 
     async def serve(self):
         '''
@@ -65,6 +85,7 @@ class TopicsyncServer:
         '''
         self._client_manager.register_message_handler("action",self._handle_action)
         self._client_manager.register_message_handler("request",self._handle_request)
+        self._post_commit_dispatcher.set_loop(asyncio.get_running_loop())
         await asyncio.gather(
             self._debugger.run() if self.debug else asyncio.sleep(0),
             self._client_manager.run(),
@@ -78,7 +99,10 @@ class TopicsyncServer:
         self._client_manager.send_update_or_buffer(changes,actionID)
 
     def _add_topic_raw(self,topic_name,props):
-        if props.get('is_restore',False):
+        if props.get('derived',False):
+            topic = self._state_machine.add_topic(topic_name,DerivedTopic,is_stateful=False)
+            topic.set_compute(*self._derived_topics[topic_name])
+        elif props.get('is_restore',False):
             self._state_machine.restore_topic(props["type"], props['serialized'])
         else:
             self._state_machine.add_topic_s(topic_name,props["type"],props["is_stateful"],props["boundary_value"],props["order_strict"])
@@ -91,24 +115,69 @@ class TopicsyncServer:
     """
 
     def _handle_action(self, sender:Client, commands: list[dict[str, Any]],action_id:str):
-        self._action_source = sender.id
+        '''
+        Returns the reason the action is rejected, if it is.
+        '''
+        if self._is_ephemeral_action(commands):
+            reject_reason = self._publish_action(sender, commands, action_id)
+        elif self._action_executor is not None:
+            return self._handle_action_in_worker(sender, commands, action_id)
+        else:
+            reject_reason = self._apply_action(sender, commands, action_id)
+        if reject_reason is not None:
+            sender.send("reject",reason=reject_reason)
+        return reject_reason
+
+    async def _handle_action_in_worker(self, sender:Client, commands: list[dict[str, Any]],action_id:str):
+        # The client manager awaits this, so actions of a client are still applied in order
+        reject_reason = await asyncio.get_running_loop().run_in_executor(self._action_executor, self._apply_action, sender, commands, action_id)
+        if reject_reason is not None:
+            sender.send("reject",reason=reject_reason)
+        return reject_reason
+
+    def _apply_action(self, sender:Client, commands: list[dict[str, Any]],action_id:str) -> str|None:
+        '''
+        Apply the action in a transition. Returns the reason to reject it if it fails.
+        '''
+        self._thread.action_source = sender.id
+        def apply_commands():
+            # Deserialized in the transition, since applying a change modifies it and the transition may be retried
+            for command_dict in commands:
+                command = Change.deserialize(command_dict)
+                self._state_machine.apply_change(command)
         try:
-            with self._state_machine.record(action_source=sender.id,action_id=action_id):
-                for command_dict in commands:
-                    command = Change.deserialize(command_dict)
-                    self._state_machine.apply_change(command)
-
+            self._state_machine.run_transition(apply_commands,action_source=sender.id,action_id=action_id)
         except Exception as e:
-            sender.send("reject",reason=repr(e))
             tb = traceback.format_exc()
-            if ALREADY_LOGGED_ERROR_NOTE not in e.__notes__:
+            if ALREADY_LOGGED_ERROR_NOTE not in getattr(e, '__notes__', ()):
                 logger.warning(f"Error when handling action {action_id} from client {sender.id}:\n{tb}")
+            return repr(e)
+
+    def _is_ephemeral_action(self, commands: list[dict[str, Any]]) -> bool:
+        for command_dict in commands:
+            topic_name = command_dict.get('topic_name')
+            if not self._state_machine.has_topic(topic_name) or self._state_machine.get_topic(topic_name).is_stateful():
+                return False
+        return len(commands) > 0
+
+    def _publish_action(self, sender:Client, commands: list[dict[str, Any]],action_id:str) -> str|None:
+        '''
+        Publish an action that only changes non-stateful topics, without recording them (see StateMachine.publish).
+        Returns the reason to reject it if it fails.
+        '''
+        self._thread.action_source = sender.id
+        try:
+            for command_dict in commands:
+                self._state_machine.publish(Change.deserialize(command_dict),action_id,sender.id)
+        except Exception as e:
+            logger.warning(f"Error when handling action {action_id} from client {sender.id}:\n{traceback.format_exc()}")
+            return repr(e)
 
     async def _handle_request(self, sender:Client, service_name, args, request_id):
         """
         Handle a request from a client
         """
-        self._action_source = sender.id
+        self._thread.action_source = sender.id
         service = self._services[service_name]
         if service.pass_client_id:
             args["sender"] = sender.id
@@ -123,6 +192,12 @@ class TopicsyncServer:
         else:
             sender.send("response", response=response, request_id=request_id)
 
+    def _get_log_page(self, topic_name: str, before_seq: int|None = None, count: int|None = None):
+        """
+        Service for clients to fetch entries of a log topic older than the ones sent in init
+        """
+        return self.topic(topic_name, LogTopic).get_page(before_seq, count)
+
     """
     API
     """
@@ -194,6 +269,13 @@ class TopicsyncServer:
     def add_topic(self, topic_name, type: type[T],init_value=None,is_stateful=True,order_strict=True) -> T:
         return self._add_topic_to_list(topic_name, type, {'type':type.get_type_name(),'boundary_value':init_value,'is_stateful':is_stateful,'order_strict':order_strict})
 
+    def add_derived_topic(self, topic_name, compute: Callable, dependencies: List[Topic|str]|None = None) -> DerivedTopic:
+        '''
+        Add a read-only topic whose value is computed from other topics. See DerivedTopic.
+        '''
+        self._derived_topics[topic_name] = (compute, dependencies)
+        return self._add_topic_to_list(topic_name, DerivedTopic, {'type':'generic','boundary_value':None,'is_stateful':False,'order_strict':True,'derived':True}) # type: ignore
+
     def restore_topic(self, topic_name, type: type[T], serialized):
         return self._add_topic_to_list(topic_name, type, {
             'type': type.get_type_name(),
@@ -220,6 +302,14 @@ class TopicsyncServer:
             self._topic_list.pop(topic_name)
         logger.debug(f"Removed topic {topic_name}")
 
+    def set_rate_limit(self, topic_name: str, max_rate: float|None, conflate: bool = True):
+        '''
+        Send the changes of a topic to clients at most max_rate times per second. Changes made in between are sent
+        together. With conflate, a set or an emit drops the changes waiting before it. None removes the limit.
+        Meant for non-stateful topics like cursors and typing indicators, whose changes are published without transitions.
+        '''
+        self._client_manager.set_rate_limit(topic_name, None if max_rate is None else 1/max_rate, conflate)
+
     def undo(self,transition:Transition):
         self._state_machine.undo(transition)
 
@@ -227,8 +317,8 @@ class TopicsyncServer:
         self._state_machine.redo(transition)
 
     def phase(self):
-        return self._state_machine._phase
+        return self._state_machine.get_phase()
     
     def get_action_source(self):
-        return self._action_source
+        return getattr(self._thread, 'action_source', 0)
 
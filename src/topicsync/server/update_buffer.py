@@ -1,17 +1,86 @@
 
-from typing import Callable, DefaultDict, Dict, List
-from topicsync.change import Change
+import asyncio
+import time
+from typing import Callable, DefaultDict, Dict, List, Tuple
+from topicsync.change import Change, EventChangeTypes, SetChange
 from topicsync.state_machine.state_machine import StateMachine
 from topicsync.topic import DictTopic
 from topicsync.utils import Clock, astype
 import logging
 logger = logging.getLogger(__name__)
 
+class _RateLimiter:
+    '''
+    Sends the changes of a topic at most once per interval. Changes arriving within the interval are sent together
+    when it ends. With conflate, a SetChange or an EmitChange drops the changes waiting before it, since clients reach
+    the same state without them. The action ids of the dropped changes are acknowledged with empty updates.
+    '''
+    def __init__(self, topic_name: str, interval: float, conflate: bool, send_update: Callable[[List[Change],str],None],
+                 send_ack: Callable[[str,str],None]) -> None:
+        self.topic_name = topic_name
+        self.interval = interval
+        self.conflate = conflate
+        self._send_update = send_update
+        self._send_ack = send_ack
+        self._pending: List[Tuple[Change,str]] = []
+        self._dropped_action_ids: List[str] = []
+        self._last_sent = float('-inf')
+        self._timer: asyncio.TimerHandle|None = None
+
+    def add(self, change: Change, action_id: str) -> None:
+        now = time.monotonic()
+        if not self._pending and now - self._last_sent >= self.interval:
+            self._last_sent = now
+            self._send_update([change],action_id)
+            return
+        if self.conflate and isinstance(change,(SetChange,EventChangeTypes.EmitChange)):
+            self._dropped_action_ids += [pending_action_id for _, pending_action_id in self._pending if pending_action_id]
+            self._pending.clear()
+        self._pending.append((change,action_id))
+        if self._timer is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                # no loop to wait on
+                self.flush()
+                return
+            self._timer = loop.call_later(self._last_sent + self.interval - now, self.flush)
+
+    def flush(self) -> None:
+        if self._timer is not None:
+            # when flushed before the interval ends
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        self._last_sent = time.monotonic()
+        for action_id in self._dropped_action_ids:
+            self._send_ack(self.topic_name,action_id)
+        # consecutive changes of the same action go in one update
+        changes: List[Change] = []
+        for i, (change, action_id) in enumerate(self._pending):
+            changes.append(change)
+            if i == len(self._pending) - 1 or self._pending[i+1][1] != action_id:
+                self._send_update(changes,action_id)
+                changes = []
+        self._pending.clear()
+        self._dropped_action_ids.clear()
+
+    def clear(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._pending.clear()
+        self._dropped_action_ids.clear()
+
 class UpdateBuffer:
-    def __init__(self, state_machine: StateMachine, send_update: Callable[[List[Change],str],None]) -> None:
+    def __init__(self, state_machine: StateMachine, send_update: Callable[[List[Change],str],None],
+                 send_ack: Callable[[str,str],None] = lambda topic_name, action_id: None) -> None:
         self._state_machine = state_machine
         self._send_update = send_update
+        self._send_ack = send_ack
         self._to_send_later: DefaultDict[str, List[Change]] = DefaultDict(list)
+        self._rate_limiters: Dict[str, _RateLimiter] = {}
         self._clock = Clock(0.2)
         self._clock.on_tick += self.flush
 
@@ -22,12 +91,28 @@ class UpdateBuffer:
     async def run(self):
         await self._clock.run()
 
+    def set_rate_limit(self, topic_name: str, interval: float|None, conflate: bool = True) -> None:
+        '''
+        Send the changes of the topic at most once per interval seconds, see _RateLimiter. None removes the limit.
+        '''
+        limiter = self._rate_limiters.pop(topic_name,None)
+        if limiter is not None:
+            limiter.flush()
+            limiter.clear()
+        if interval is not None:
+            self._rate_limiters[topic_name] = _RateLimiter(topic_name,interval,conflate,self._send_update,self._send_ack)
+
     def add_changes(self, changes: List[Change], action_id:str) -> None:
         to_send_now = []
         for change in changes:
             if not self._state_machine.has_topic(change.topic_name):
                 continue
-            if self._state_machine.get_topic(change.topic_name).is_order_strict():
+            if self._rate_limiters and change.topic_name in self._rate_limiters:
+                # keep the order of this update's changes
+                self._send_update(to_send_now,action_id)
+                to_send_now = []
+                self._rate_limiters[change.topic_name].add(change,action_id)
+            elif self._state_machine.get_topic(change.topic_name).is_order_strict():
                 to_send_now.append(change)
             else:
                 self._to_send_later[change.topic_name].append(change)
@@ -35,12 +120,24 @@ class UpdateBuffer:
 
     def on_topic_remove(self, topic_name: str) -> None:
         self._to_send_later.pop(topic_name,None)
+        if topic_name in self._rate_limiters:
+            self._rate_limiters[topic_name].clear()
+
+    def flush(self, topic_name: str|None = None):
+        '''
+        Send the buffered changes. With topic_name, also send the changes the rate limiter of the topic holds back, for
+        example before a client subscribing to the topic gets its value.
+        '''
+        if topic_name in self._rate_limiters:
+            self._rate_limiters[topic_name].flush()
 
-    def flush(self):
         #merge changes with same topic name
         merged_changes: List[Change] = []
 
         for topic_name, changes in self._to_send_later.copy().items():
+            if not self._state_machine.has_topic(topic_name):
+                # removed by a transition running in another thread
+                continue
             merged_changes += self._state_machine.get_topic(topic_name).merge_changes(changes)
 
         #send changes
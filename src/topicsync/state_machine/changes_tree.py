@@ -3,7 +3,7 @@ The changes tree is for debugging purpose.
 '''
 
 from enum import Enum
-from typing import Callable, List
+from typing import Callable, Iterator, List
 from contextlib import contextmanager
 
 from topicsync.change import Change
@@ -16,6 +16,17 @@ class Tag(Enum):
     ERROR = 3
     INVERSED = 4
 
+def preorder_nodes(root):
+    '''
+    Iterate over the nodes of the subtree in preorder. Trees are traversed without recursion, since cascades of
+    changes can be deeper than the recursion limit.
+    '''
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(node.children))
+
 class Node:
     def __init__(self,parent:'Node|RootNode',change:Change,tag:Tag):
         self.is_root = False
@@ -25,11 +36,22 @@ class Node:
         self.tag = tag
 
     def serialize(self):
+        serialized = self._serialize_node()
+        stack = [(self,serialized['children'])]
+        while stack:
+            node,serialized_children = stack.pop()
+            for child in node.children:
+                serialized_child = child._serialize_node()
+                serialized_children.append(serialized_child)
+                stack.append((child,serialized_child['children']))
+        return serialized
+
+    def _serialize_node(self):
         change_dict = self.change.serialize()
         return {
             'name':f'{self.change.topic_name}\n{change_dict["type"]}',
             'change':str(change_dict),
-            'children':[c.serialize() for c in self.children],
+            'children':[],
             'tag':self.tag.name
         }
 
@@ -39,10 +61,10 @@ class RootNode(Node):
         self.children : List[Node] = []
         self.tag = Tag.AUTO
 
-    def serialize(self):
+    def _serialize_node(self):
         return {
             'name':'',
-            'children':[c.serialize() for c in self.children],
+            'children':[],
             'tag':self.tag.name
         }
 
@@ -63,11 +85,10 @@ class ChangesTree:
         self.cursor.children.append(node)
         return node
         
-    def preorder_traversal(self,root:Node|RootNode):
-        if not root.is_root:
-            yield root.change
-        for child in root.children:
-            yield from self.preorder_traversal(child)
+    def preorder_traversal(self,root:Node|RootNode) -> Iterator[Change]:
+        for node in preorder_nodes(root):
+            if not node.is_root:
+                yield node.change
 
     def __str__(self) -> str:
         return str([c.serialize() for c in self.preorder_traversal(self.root)])
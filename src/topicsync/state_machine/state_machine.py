@@ -1,6 +1,5 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from doctest import debug
 import enum
 import logging
 
@@ -8,13 +7,15 @@ from topicsync.state_machine.changes_tree import ChangesTree, Tag
 logger = logging.getLogger(__name__)
 import threading
 import traceback
-from typing import TYPE_CHECKING, TypeVar
+from typing import TYPE_CHECKING, Hashable, Iterable, TypeVar
 from contextlib import contextmanager, nullcontext
 from typing import Any, Callable, List
 
 from topicsync.change import EventChangeTypes, NullChange
+from topicsync import post_commit
+from topicsync.post_commit import PostCommitDispatcher, PostCommitCall
 from topicsync.topic import Topic, topic_factory, get_topic_type_from_str
-from topicsync.state_machine.transition_tree import TransitionTree
+from topicsync.state_machine.transition_tree import FlatTransitionTree, TransitionTree
 if TYPE_CHECKING:
     from topicsync.change import Change
 
@@ -38,24 +39,71 @@ class ErrorState(enum.Enum):
     RECOVERING = 1
     CRITICAL = 2
 
+class LockDomainConflict(Exception):
+    '''
+    Raised in a transition that needs a lock domain held by another transition, while it already holds other domains.
+    Waiting could deadlock, so the transition is rolled back instead. StateMachine.run_transition() runs it again in escalated mode.
+    '''
+    def __init__(self,domain:Hashable):
+        super().__init__(f'Lock domain {domain!r} is held by another transition')
+        self.domain = domain
+
+# changes that are not sent to clients
+_NOT_SENT_CHANGE_TYPES = (NullChange,EventChangeTypes.ReversedEmitChange)
+
 # this note is added to the exception when an error is already logged
 ALREADY_LOGGED_ERROR_NOTE = 'topicsync already logged the error'
 
+class _Recording:
+    '''
+    The state of the transition a thread is recording.
+    '''
+    __slots__ = ('phase','mode','error_state','changes_list','transition_tree','changes_tree','tasks_to_run_after_transition','tasks_to_run_before_end','post_commit_calls','domains','escalated','conflict')
+    def __init__(self,phase:Phase,escalated:bool):
+        self.phase = phase
+        self.mode = Mode.AUTO
+        self.error_state = ErrorState.NO_ERROR
+        self.changes_list : List[Change] = []
+        self.transition_tree : TransitionTree|FlatTransitionTree
+        self.changes_tree : ChangesTree
+        self.tasks_to_run_after_transition : List[Callable[[],None]] = []
+        self.tasks_to_run_before_end : dict[Callable[[],None],None] = {} # an ordered set
+        self.post_commit_calls : List[PostCommitCall]|None = None # dispatched if the transition commits
+        self.domains : set[Hashable] = set() # lock domains held by the transition
+        self.escalated = escalated
+        self.conflict : LockDomainConflict|None = None
+
+class _ThreadState(threading.local):
+    def __init__(self,get_topic:Callable[[str],Topic]):
+        self.recording : _Recording|None = None
+        # Without a debugger, transitions are recorded in this reusable flat tree instead of new tree objects
+        self.flat_transition_tree = FlatTransitionTree(get_topic)
+
 class StateMachine:
+    '''
+    Concurrency: every topic belongs to a lock domain, given by lock_domain_of(topic_name). A transition holds the lock
+    of each domain it changes until it ends, so transitions that change topics of disjoint domains can run in parallel
+    threads. Without lock_domain_of, all topics are in one domain and transitions run one at a time.
+    '''
     def __init__(self, 
             changes_callback:Callable[[List[Change],str], None]=lambda *args:None, 
             transition_callback: Callable[[Transition], None]=lambda *args:None,
             changes_tree_callback: Callable[[ChangesTree], None]|None=None, 
-            transition_tree_callback: Callable[[TransitionTree], None]|None=None
+            transition_tree_callback: Callable[[TransitionTree], None]|None=None,
+            lock_domain_of: Callable[[str], Hashable]|None=None,
+            post_commit_dispatcher: PostCommitDispatcher|None=None
         ):
 
-        self._phase: Phase = Phase.IDLE
-        self._mode : Mode = Mode.MANUAL
-        self._error_state : ErrorState = ErrorState.NO_ERROR
         self._state : dict[str,Topic] = {}
-        self._is_recording = False
-        self._lock = threading.RLock()
-        self._changes_list : List[Change] = []
+        self._thread = _ThreadState(self.get_topic)
+
+        # Lock domains
+        self._lock_domain_of = lock_domain_of
+        self._topic_domains : dict[str,Hashable] = {}
+        self._domain_locks : dict[Hashable,threading.RLock] = {}
+        self._single_domain_lock = self._domain_lock(None) # the domain of all topics without lock_domain_of
+        self._escalation_lock = threading.Lock() # only one transition at a time may wait while holding domains
+        self._callback_lock = threading.RLock() # callbacks are called by one transition at a time
 
         # Standard callbacks
         self._changes_callback = changes_callback
@@ -66,15 +114,15 @@ class StateMachine:
         self._transition_tree_callback = transition_tree_callback
         self._debug = changes_tree_callback is not None or transition_tree_callback is not None
 
+        # Runs the post-commit callbacks of actions (see Action.add_post_commit)
+        self._post_commit_dispatcher = post_commit_dispatcher if post_commit_dispatcher is not None else PostCommitDispatcher()
+        self._post_commit_callback_count = 0 # post-commit calls are queued only if there are callbacks
+
         self._max_recursive_depth = 1e4
-        self._transition_tree = None
-        self._tasks_to_run_after_transition: List[Callable[[],None]] = []
     
     T = TypeVar('T', bound=Topic)
     def add_topic(self,name:str,topic_type:type[T],is_stateful:bool = True,init_value:Any=None)->T:
-        topic = topic_type(name,self,is_stateful,init_value)
-        self._state[name] = topic
-        return topic
+        return self.register_topic(topic_type(name,self,is_stateful,init_value))
     
     def add_topic_s(self,name:str,topic_type:str,is_stateful:bool = True,init_value:Any=None,order_strict=True)->Topic:
         return self.register_topic(
@@ -88,192 +136,383 @@ class StateMachine:
 
     def register_topic(self, topic:Topic) -> Topic:
         self._state[topic.get_name()] = topic
+        topic._bind_actions()
         return topic
 
     def remove_topic(self,name:str):
-        del self._state[name]
+        self._state.pop(name)._unbind_actions()
 
     def get_topic(self,topic_name:str)->Topic:
         return self._state[topic_name]
     
     def has_topic(self,topic_name:str):
         return topic_name in self._state
+
+    def get_phase(self) -> Phase:
+        '''
+        The phase of the transition recorded by the current thread.
+        '''
+        recording = self._thread.recording
+        return recording.phase if recording is not None else Phase.IDLE
     
     @contextmanager
-    def record(self,action_source:int = 0,action_id:str = '',allow_reentry:bool = False,emit_transition:bool = True,phase:Phase = Phase.FORWARDING):
-        
-        with self._lock:
-            if self._is_recording:
-                if not allow_reentry:
-                    raise RuntimeError("Cannot call record while already recording")
-                else:
-                    # Already recording, just skip to yield
-                    yield
-                    return
+    def record(self,action_source:int = 0,action_id:str = '',allow_reentry:bool = False,emit_transition:bool = True,phase:Phase = Phase.FORWARDING,
+               domains:Iterable[Hashable] = (),escalate:bool = False):
+        '''
+        Record the changes made in the block as a transition.
+        Lock domains are acquired when the transition first changes one of their topics. Pass domains to acquire them
+        before the block runs, for example when the block reads topics before changing them.
+        In escalated mode, the transition can wait for any domain instead of raising LockDomainConflict.
+        '''
+        if self._thread.recording is not None:
+            if not allow_reentry:
+                raise RuntimeError("Cannot call record while already recording")
+            else:
+                # Already recording, just skip to yield
+                yield
+                return
             
         # Set up the recording
 
-            self._is_recording = True
-            self._phase = phase
-            self._mode = Mode.AUTO
-            self._error_state = ErrorState.NO_ERROR
-            self._changes_list = []
-            self._changes_tree = ChangesTree()
-            self._transition_tree = TransitionTree(self.get_topic,self._changes_list,self._changes_tree)
-            try:
-                yield
-            except Exception as e:
-                if self._error_state == ErrorState.CRITICAL:
-                    if self._debug:
-                        self._changes_tree.root.tag = Tag.ERROR
-                else:
-                    self._try_recover(e)
-                raise
+        recording = self._start_recording(phase,domains,escalate)
+        try:
+            yield
+            self._run_tasks_before_end(recording)
+        except Exception as e:
+            self._handle_recording_error(recording,e)
+            raise
+        else:
+            self._end_transition(recording,action_source,emit_transition)
+        finally:
+            self._finish_recording(recording,action_id)
+
+    def run_transition(self,body:Callable[[],Any],action_source:int = 0,action_id:str = '',domains:Iterable[Hashable] = ()):
+        '''
+        Call body in a transition. If the transition is rolled back because of a LockDomainConflict, body is called again
+        in a transition in escalated mode, so body must be safe to call again.
+        '''
+        try:
+            with self.record(action_source=action_source,action_id=action_id,domains=domains):
+                return body()
+        except LockDomainConflict as e:
+            logger.debug(f"Retrying transition in escalated mode: {e}")
+        with self.record(action_source=action_source,action_id=action_id,domains=domains,escalate=True):
+            return body()
+
+    def domain_lock_of(self,topic_name:str) -> threading.RLock:
+        '''
+        The lock of the topic's domain. Hold it to read the topic without seeing changes of unfinished transitions.
+        '''
+        return self._domain_lock(None if self._lock_domain_of is None else self._domain_of(topic_name))
+
+    def _domain_lock(self,domain:Hashable) -> threading.RLock:
+        lock = self._domain_locks.get(domain)
+        if lock is None:
+            lock = self._domain_locks.setdefault(domain,threading.RLock())
+        return lock
+
+    def _domain_of(self,topic_name:str) -> Hashable:
+        domain = self._topic_domains.get(topic_name,self)
+        if domain is self:
+            domain = self._topic_domains[topic_name] = self._lock_domain_of(topic_name) # type: ignore
+        return domain
+
+    def _acquire_domain(self,recording:_Recording,domain:Hashable):
+        lock = self._domain_lock(domain)
+        # A transition may wait only if it holds no domain, or if it is the escalated transition. So no two waiting
+        # transitions hold what the other waits for.
+        if recording.escalated or not recording.domains:
+            lock.acquire()
+        elif not lock.acquire(blocking=False):
+            # Remember it, in case a listener catches it
+            recording.conflict = LockDomainConflict(domain)
+            raise recording.conflict
+        recording.domains.add(domain)
+
+    def _acquire_domains(self,recording:_Recording,domains:List[Hashable]):
+        '''
+        Acquire all the domains before the transition changes anything. If one is held by another transition, release
+        the acquired ones and wait for that one first.
+        '''
+        while True:
+            for domain in domains:
+                if domain in recording.domains:
+                    continue
+                if recording.escalated or not recording.domains:
+                    self._domain_lock(domain).acquire()
+                elif not self._domain_lock(domain).acquire(blocking=False):
+                    self._release_domains(recording)
+                    domains = [domain] + [d for d in domains if d != domain]
+                    break
+                recording.domains.add(domain)
             else:
-                current_transition = list(self._transition_tree.preorder_traversal(self._transition_tree.root))
-                if len(current_transition) and emit_transition:
-                    new_transition = Transition(current_transition,action_source)
-                    self._transition_callback(new_transition)
-            finally:
-                # debug
+                return
 
-                if self._debug:
+    def _release_domains(self,recording:_Recording):
+        for domain in recording.domains:
+            self._domain_locks[domain].release()
+        recording.domains.clear()
+
+    def _start_recording(self,phase:Phase,domains:Iterable[Hashable] = (),escalate:bool = False) -> _Recording:
+        if escalate:
+            self._escalation_lock.acquire()
+        recording = _Recording(phase,escalate)
+        try:
+            if self._lock_domain_of is None:
+                # One domain for all topics, held during the whole recording
+                self._single_domain_lock.acquire()
+                recording.domains.add(None)
+            elif domains:
+                self._acquire_domains(recording,list(dict.fromkeys(domains)))
+        except:
+            if escalate:
+                self._escalation_lock.release()
+            raise
+
+        if self._debug:
+            recording.changes_tree = ChangesTree()
+            recording.transition_tree = TransitionTree(self.get_topic,recording.changes_list,recording.changes_tree)
+        else:
+            recording.transition_tree = self._thread.flat_transition_tree
+            recording.transition_tree.reset(recording.changes_list)
+        if self._post_commit_callback_count:
+            recording.post_commit_calls = post_commit.pending.queue = []
+        self._thread.recording = recording
+        return recording
+
+    def _handle_recording_error(self,recording:_Recording,exception:Exception):
+        recording.post_commit_calls = None # nothing is committed
+        if recording.error_state == ErrorState.CRITICAL:
+            if self._debug:
+                recording.changes_tree.root.tag = Tag.ERROR
+        else:
+            self._try_recover(recording,exception)
+            # The changes undone by the recovery may have scheduled tasks too
+            try:
+                self._run_tasks_before_end(recording)
+            except Exception:
+                logger.error("An error has occured in a task run after cleaning up the failed transition. The error was:\n" + str(traceback.format_exc()))
+
+    def _run_tasks_before_end(self,recording:_Recording):
+        tasks = recording.tasks_to_run_before_end
+        while tasks:
+            task = next(iter(tasks))
+            del tasks[task]
+            task()
+
+    def _end_transition(self,recording:_Recording,action_source,emit_transition:bool):
+        if recording.conflict is not None:
+            # A listener caught the LockDomainConflict. The transition still can't be completed.
+            self._handle_recording_error(recording,recording.conflict)
+            raise recording.conflict
+        current_transition = recording.transition_tree.to_list()
+        if len(current_transition) and emit_transition:
+            new_transition = Transition(current_transition,action_source)
+            with self._callback_lock:
+                self._transition_callback(new_transition)
+
+    def _finish_recording(self,recording:_Recording,action_id:str):
+        try:
+            # debug
+
+            if self._debug:
+                with self._callback_lock:
                     if self._changes_tree_callback is not None:
-                        self._changes_tree_callback(self._changes_tree)
+                        self._changes_tree_callback(recording.changes_tree)
                     if self._transition_tree_callback is not None:
-                        self._transition_tree_callback(self._transition_tree)
-                        
-                # discard NullChange, EmitChange, ReversedEmitChange
-                self._changes_list = [
-                    change for change in self._changes_list
-                    if not isinstance(change,NullChange|EventChangeTypes.ReversedEmitChange)]
-                if len(self._changes_list):
-                    self._changes_callback(self._changes_list,action_id)
-
-                # cleanup
-
-                self._is_recording = False
-                self._phase = Phase.IDLE
-                self._changes_list = []
-                self._transition_tree = None
-
-                for task in self._tasks_to_run_after_transition:
-                    task()
-                self._tasks_to_run_after_transition = []
-                
-
-        # unlock
-
-    def _try_recover(self,exception:Exception):
-        if self._error_state == ErrorState.CRITICAL:
+                        self._transition_tree_callback(recording.transition_tree)
+                    
+            # discard NullChange, EmitChange, ReversedEmitChange
+            changes_list = [
+                change for change in recording.changes_list
+                if not isinstance(change,_NOT_SENT_CHANGE_TYPES)]
+            if len(changes_list):
+                # Called before the domains are released, so changes of a domain are passed in the order they are applied
+                with self._callback_lock:
+                    self._changes_callback(changes_list,action_id)
+        finally:
+            # cleanup
+
+            self._thread.recording = None
+            post_commit.pending.queue = None
+            self._release_domains(recording)
+            if recording.escalated:
+                self._escalation_lock.release()
+
+        if recording.post_commit_calls:
+            self._post_commit_dispatcher.dispatch(recording.post_commit_calls)
+
+        for task in recording.tasks_to_run_after_transition:
+            task()
+
+    def _try_recover(self,recording:_Recording,exception:Exception):
+        if recording.error_state == ErrorState.CRITICAL:
             # Can't recover from critical error
             return
         
-        assert self._error_state == ErrorState.NO_ERROR
+        assert recording.error_state == ErrorState.NO_ERROR
         
-        logger.warning("An error has occured in the transition. Cleaning up. The error was:\n" + str(traceback.format_exc()))
+        if isinstance(exception,LockDomainConflict):
+            logger.debug(f"Rolling back the transition: {exception}")
+        else:
+            logger.warning("An error has occured in the transition. Cleaning up. The error was:\n" + str(traceback.format_exc()))
         exception.add_note(ALREADY_LOGGED_ERROR_NOTE)
-        self._error_state = ErrorState.RECOVERING
+        recording.error_state = ErrorState.RECOVERING
         try:
-            self._transition_tree.clear_subtree()
+            recording.transition_tree.clear_subtree()
         except Exception as e:
             logger.error("An error has occured while trying to clean up the failed transition. The state is now in an inconsistent state QAQ. The error was: \n" +str(traceback.format_exc()))
             e.add_note(ALREADY_LOGGED_ERROR_NOTE)
-            self._error_state = ErrorState.CRITICAL
+            recording.error_state = ErrorState.CRITICAL
             raise
         finally:
-            self._error_state = ErrorState.NO_ERROR
+            recording.error_state = ErrorState.NO_ERROR
 
     @contextmanager
     def enter_manual_mode(self):
-        original_mode = self._mode
-        self._mode = Mode.MANUAL
+        recording = self._thread.recording
+        original_mode = recording.mode
+        recording.mode = Mode.MANUAL
         try:
             yield
         except:
-            self._changes_tree.cursor.tag = Tag.ERROR
+            if self._debug:
+                recording.changes_tree.cursor.tag = Tag.ERROR
             raise
         finally:
-            self._mode = original_mode
+            recording.mode = original_mode
 
     def apply_change(self,change:Change):
-        
-        with self._lock:
-            
-            # Enter record context if not already in it
-            if not self._is_recording:
-                with self.record():
-                    self.apply_change(change)
-                return
-            
-            # Prevent infinite recursion
-            # if change.topic_name in self._apply_change_call_stack:
-            #     return
-            
-            # Apply the change
+        recording = self._thread.recording
 
-            topic = self.get_topic(change.topic_name)
+        # Enter record context if not already in it.
+        # Same as `with self.record(): self.apply_change(change)`, without the overhead of the context manager.
+        if recording is None:
+            recording = self._start_recording(Phase.FORWARDING)
+            try:
+                self._apply_change(recording,change)
+                if recording.tasks_to_run_before_end:
+                    self._run_tasks_before_end(recording)
+            except Exception as e:
+                self._handle_recording_error(recording,e)
+                raise
+            else:
+                self._end_transition(recording,0,True)
+            finally:
+                self._finish_recording(recording,'')
+            return
+
+        self._apply_change(recording,change)
+
+    def publish(self,change:Change,action_id:str='',action_source:int=0):
+        '''
+        Apply a change of a non-stateful topic without a transition. The change itself is not recorded, so there's no
+        rollback, history or undo of it. It is passed to changes_callback right away. Then, if the topic has listeners,
+        they are notified in a transition with action_id and action_source, so their changes are applied atomically.
+        If a transition is being recorded, the change is applied as part of it instead.
+        '''
+        if self._thread.recording is not None:
+            self.apply_change(change)
+            return
+        topic = self._state[change.topic_name]
+        if topic.is_stateful():
+            raise ValueError(f'Changes of the stateful topic {change.topic_name} must be applied in a transition')
+        with self.domain_lock_of(change.topic_name):
             old_value, new_value = topic.apply_change(change)
+            if not isinstance(change,_NOT_SENT_CHANGE_TYPES):
+                with self._callback_lock:
+                    self._changes_callback([change],action_id)
+        if not topic._has_listeners():
+            return
+        # After releasing the domain lock, since the transition acquires the domains it needs itself
+        with self.record(action_source=action_source,action_id=action_id):
+            topic.notify_listeners(False,change,old_value,new_value)
+            topic.notify_listeners(True,change,old_value,new_value)
+
+    def _apply_change(self,recording:_Recording,change:Change):
+        # Prevent infinite recursion
+        # if change.topic_name in self._apply_change_call_stack:
+        #     return
+        
+        if self._lock_domain_of is not None:
+            domain = self._domain_of(change.topic_name)
+            if domain not in recording.domains:
+                self._acquire_domain(recording,domain)
+
+        # Apply the change
 
-            self._changes_list.append(change)
+        topic = self.get_topic(change.topic_name)
+        old_value, new_value = topic.apply_change(change)
 
-            if not topic.is_stateful():
-                # Just notifying listeners and return
+        recording.changes_list.append(change)
+
+        if not topic.is_stateful():
+            # Just notifying listeners and return
+            if self._debug:
+                with recording.changes_tree.add_child_and_move_cursor(change,Tag.MANUAL):
+                    topic.notify_listeners(False,change,old_value,new_value)
+                    topic.notify_listeners(True,change,old_value,new_value)
+            else:
+                topic.notify_listeners(False,change,old_value,new_value)
+                topic.notify_listeners(True,change,old_value,new_value)
+            return
+
+        if recording.mode == Mode.MANUAL:
+            # If the transition is in manual mode, notify listeners without recording the change
+            with self.enter_manual_mode():
                 if self._debug:
-                    with self._changes_tree.add_child_and_move_cursor(change,Tag.MANUAL):
+                    with recording.changes_tree.add_child_and_move_cursor(change,Tag.MANUAL):
                         topic.notify_listeners(False,change,old_value,new_value)
                         topic.notify_listeners(True,change,old_value,new_value)
                 else:
                     topic.notify_listeners(False,change,old_value,new_value)
                     topic.notify_listeners(True,change,old_value,new_value)
                 return
+        
 
-            if self._mode == Mode.MANUAL:
-                # If the transition is in manual mode, notify listeners without recording the change
-                with self.enter_manual_mode():
-                    if self._debug:
-                        with self._changes_tree.add_child_and_move_cursor(change,Tag.MANUAL):
-                            topic.notify_listeners(False,change,old_value,new_value)
-                            topic.notify_listeners(True,change,old_value,new_value)
-                    else:
-                        topic.notify_listeners(False,change,old_value,new_value)
-                        topic.notify_listeners(True,change,old_value,new_value)
-                    return
-            
+        # If the transition is in auto mode, record the change and notify listeners
+        # The cursors are moved and restored inline instead of with context managers, since this is the hot path.
 
-            # If the transition is in auto mode, record the change and notify listeners
+        transition_tree = recording.transition_tree
+        parent_node = transition_tree.cursor
+        transition_tree.cursor = transition_tree.add_child(change)
+        if self._debug:
+            parent_changes_node = recording.changes_tree.cursor
+            recording.changes_tree.cursor = recording.changes_tree.add_child(change,Tag.AUTO)
+        try:
+            # Notify listeners of manual mode
+            original_mode = recording.mode
+            recording.mode = Mode.MANUAL
+            try:
+                topic.notify_listeners(False,change,old_value,new_value)
+            except Exception as e:
+                if self._debug:
+                    recording.changes_tree.cursor.tag = Tag.ERROR
+                # Can't recover from manual mode
+                recording.error_state = ErrorState.CRITICAL
+                logger.error("An error has occured while in manual mode. It can not be recovered. The error was: \n" +str(traceback.format_exc()))
+                e.add_note(ALREADY_LOGGED_ERROR_NOTE)
+                raise
+            finally:
+                recording.mode = original_mode
 
-            node = self._transition_tree.add_child(change)
-            with self._transition_tree.move_cursor(node):
-                with self._changes_tree.add_child_and_move_cursor(change,Tag.AUTO) if self._debug else nullcontext(): # debug
-                    
-                    # Notify listeners of manual mode
-                    with self.enter_manual_mode():
-                        try:
-                            topic.notify_listeners(False,change,old_value,new_value)
-                        except Exception as e:
-                            if debug:
-                                self._changes_tree.cursor.tag = Tag.ERROR
-                            # Can't recover from manual mode
-                            self._error_state = ErrorState.CRITICAL
-                            logger.error("An error has occured while in manual mode. It can not be recovered. The error was: \n" +str(traceback.format_exc()))
-                            e.add_note(ALREADY_LOGGED_ERROR_NOTE)
-                            raise
-
-                    # When undoing or redoing, listeners of auto mode are not notified
-                    # When recovering from an error, listeners of auto mode are not notified
-                    try:
-                        if self._phase == Phase.FORWARDING and self._error_state == ErrorState.NO_ERROR: 
-                            # Notify listeners of auto mode
-                            topic.notify_listeners(True,change,old_value,new_value)
-                    except Exception as e:
-                        if debug:
-                            self._changes_tree.cursor.tag = Tag.ERROR
-                        # Undo the subtree of changes which was caused in consequence of this change
-                        if topic.is_stateful():
-                            if self._error_state == ErrorState.NO_ERROR:
-                                self._try_recover(e)
-                        raise
+            # When undoing or redoing, listeners of auto mode are not notified
+            # When recovering from an error, listeners of auto mode are not notified
+            try:
+                if recording.phase == Phase.FORWARDING and recording.error_state == ErrorState.NO_ERROR: 
+                    # Notify listeners of auto mode
+                    topic.notify_listeners(True,change,old_value,new_value)
+            except Exception as e:
+                if self._debug:
+                    recording.changes_tree.cursor.tag = Tag.ERROR
+                # Undo the subtree of changes which was caused in consequence of this change
+                if recording.error_state == ErrorState.NO_ERROR:
+                    self._try_recover(recording,e)
+                raise
+        finally:
+            transition_tree.cursor = parent_node
+            if self._debug:
+                recording.changes_tree.cursor = parent_changes_node
 
 
     def undo(self, transition: Transition, action_source=0):
@@ -282,7 +521,8 @@ class StateMachine:
         with self.record(action_source=action_source,emit_transition=False,phase=Phase.UNDOING):
             # Revert the transition
             for change in reversed(transition.changes):
-                logger.debug("Undoing by change: " +str(change.inverse().serialize()))
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Undoing by change: " +str(change.inverse().serialize()))
                 self.apply_change(change.inverse())
     
     def redo(self, transition: Transition):
@@ -291,17 +531,30 @@ class StateMachine:
         with self.record(emit_transition=False,phase=Phase.REDOING):
             # Revert the transition
             for change in transition.changes:
-                logger.debug("Redoing change: " +str(change.serialize()))
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Redoing change: " +str(change.serialize()))
                 self.apply_change(change)
 
-    def do_after_transition(self,task): #TODO: thread safety?
+    def do_after_transition(self,task):
         '''
         Run a task after the current transition is done. Changes made by the task will be separately recorded as the next transition.
         Do nothing if undoing or redoing.
         '''
-        if self._phase == Phase.IDLE: 
+        recording = self._thread.recording
+        if recording is None: 
+            task()
+        elif recording.phase == Phase.FORWARDING:
+            recording.tasks_to_run_after_transition.append(task)
+        else:
+            return
+
+    def do_before_transition_ends(self,task):
+        '''
+        Run a task at the end of the current transition, in any phase. Changes made by the task are part of the transition.
+        A task added again before it runs is run only once. Run it now if not recording.
+        '''
+        recording = self._thread.recording
+        if recording is None:
             task()
-        elif self._phase == Phase.FORWARDING:
-            self._tasks_to_run_after_transition.append(task)
         else:
-            return
\ No newline at end of file
+            recording.tasks_to_run_before_end[task] = None
\ No newline at end of file
@@ -2,12 +2,12 @@
 The transition tree is used by StateMachine.record() to keep track of the changes in transitions.
 '''
 
-from typing import Callable, List
+from typing import Callable, Iterator, List
 from contextlib import contextmanager
 
 from topicsync.change import Change
 from topicsync.topic import Topic
-from topicsync.state_machine.changes_tree import ChangesTree, Tag
+from topicsync.state_machine.changes_tree import ChangesTree, Tag, preorder_nodes
 
 class Node:
     def __init__(self,parent:'Node|RootNode',change:Change,get_topic:Callable[[str],Topic],changes_list:List[Change],changes_tree:ChangesTree):
@@ -20,18 +20,29 @@ class Node:
         self.changes_tree = changes_tree # for debugging
 
     def clear_subtree(self):
-        for child in reversed(self.children):
-            child.clear_subtree()
-        if not self.is_root:
-            topic,inv_change = self.get_topic(self.change.topic_name),self.change.inverse()
+        '''
+        Undo the change of the node and all its descendants, and remove them from the tree.
+        Children are undone before their parent, the later ones first, which is the reverse of preorder.
+        '''
+        for node in reversed(list(preorder_nodes(self))):
+            if not node.is_root:
+                topic,inv_change = node.get_topic(node.change.topic_name),node.change.inverse()
 
-            with self.changes_tree.add_child_and_move_cursor(inv_change,Tag.INVERSED):
-                old, new = topic.apply_change(inv_change)
-                # Invoke the listeners of manual mode only
-                topic.notify_listeners(False,inv_change,old, new)
+                with node.changes_tree.add_child_and_move_cursor(inv_change,Tag.INVERSED):
+                    old, new = topic.apply_change(inv_change)
+                    # Invoke the listeners of manual mode only
+                    topic.notify_listeners(False,inv_change,old, new)
 
-            self.changes_list.append(inv_change)
-            self.parent.children.remove(self)
+                node.changes_list.append(inv_change)
+            node.children = []
+
+        if not self.is_root:
+            siblings = self.parent.children
+            # The cleared node is the cursor, which is the last child of its parent
+            if siblings and siblings[-1] is self:
+                siblings.pop()
+            else:
+                siblings.remove(self)
 
 
 class RootNode(Node):
@@ -56,11 +67,13 @@ class TransitionTree:
     def clear_subtree(self):
         self.cursor.clear_subtree()
         
-    def preorder_traversal(self,root:Node|RootNode):
-        if not root.is_root:
-            yield root.change
-        for child in root.children:
-            yield from self.preorder_traversal(child)
+    def preorder_traversal(self,root:Node|RootNode) -> Iterator[Change]:
+        for node in preorder_nodes(root):
+            if not node.is_root:
+                yield node.change
+
+    def to_list(self) -> List[Change]:
+        return list(self.preorder_traversal(self.root))
 
     def __str__(self) -> str:
         return str([c.serialize() for c in self.preorder_traversal(self.root)])
@@ -72,4 +85,42 @@ class TransitionTree:
         try:
             yield
         finally:
-            self.cursor = old_node
\ No newline at end of file
+            self.cursor = old_node
+
+class FlatTransitionTree:
+    '''
+    The TransitionTree used when no debugger is attached. It keeps no node objects: changes are added in preorder, so
+    the subtree of a change is the change and every change added after it. A node is the index of its change and the
+    root is -1. The state machine reuses one instance for all its transitions.
+    '''
+    def __init__(self,get_topic:Callable[[str],Topic]):
+        self.get_topic = get_topic
+        self.changes : List[Change] = []
+        self.changes_list : List[Change] = []
+        self.cursor = -1
+
+    def reset(self,changes_list:List[Change]):
+        self.changes = []
+        self.changes_list = changes_list
+        self.cursor = -1
+
+    def add_child(self,change:Change) -> int:
+        self.changes.append(change)
+        return len(self.changes) - 1
+
+    def clear_subtree(self):
+        start = max(self.cursor, 0)
+        while len(self.changes) > start:
+            change = self.changes[-1]
+            topic,inv_change = self.get_topic(change.topic_name),change.inverse()
+            old, new = topic.apply_change(inv_change)
+            # Invoke the listeners of manual mode only
+            topic.notify_listeners(False,inv_change,old, new)
+            self.changes_list.append(inv_change)
+            self.changes.pop()
+
+    def to_list(self) -> List[Change]:
+        return self.changes
+
+    def __str__(self) -> str:
+        return str([c.serialize() for c in self.changes])
\ No newline at end of file
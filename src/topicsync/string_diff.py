@@ -1,6 +1,8 @@
 from __future__ import annotations
 from dataclasses import dataclass
 
+from topicsync.rope import Rope
+
 # cursor stands between characters, it doesn't directly refer to a character
 # 0 is the first insertable position, right before the first character
 # an observation to help thinking: the ith cursor positions before the ith character
@@ -10,22 +12,34 @@ def _before(string, cursor) -> str:
 def _after(string, cursor) -> str:
     return string[cursor:]
 
-def _valid_pos(string: str) -> range:
+def _valid_pos(string: str | Rope) -> range:
     return range(0, len(string) + 1)
 
 
-def insert(old: str, pos: int, string: str) -> str:
+# insert() and delete() also accept a Rope, which is edited in place and returned
+def insert(old: str | Rope, pos: int, string: str) -> str | Rope:
     if pos not in _valid_pos(old):
         raise ValueError(f"Insertion invalid: invalid position {pos}. Insert position must between [0, len(old)]")
 
+    if isinstance(old, Rope):
+        old.insert(pos, string)
+        return old
+
     return _before(old, pos) + string + _after(old, pos)
 
 
-def delete(old: str, pos: int, string: str) -> str:
+def delete(old: str | Rope, pos: int, string: str) -> str | Rope:
     if pos not in _valid_pos(old):
         raise ValueError(f'Deletion invalid: invalid position {pos}. Delete position must between [0, len(old)]')
 
-    if not _after(old, pos).startswith(string):
+    if isinstance(old, Rope):
+        try:
+            old.delete(pos, string)
+        except ValueError:
+            raise ValueError(f"Deletion invalid: string '{string}' doesn't appear at position {pos}")
+        return old
+
+    if not old.startswith(string, pos):
         raise ValueError(f"Deletion invalid: string '{string}' doesn't appear at position {pos} of string '{old}'")
 
     return _before(old, pos) + _after(old, pos + len(string))
@@ -0,0 +1,202 @@
+'''
+Rebasing of string changes made on an old version of a StringTopic.
+
+Rebasing a change over the committed changes one by one costs O(K) for a client lagging K changes behind. Instead,
+the effect of a run of committed changes on positions is composed into a compact piecewise map. Maps of aligned
+power-of-two runs are cached, so rebasing over any K changes evaluates O(log K) cached maps.
+
+Three maps are kept for each run. They follow the rules of InsertChange._adjust and DeleteChange._adjust:
+- cursor: where an insertion point moves. Insertions at the same position don't move it, and it dies (the insertion
+  is dropped) if a deletion strictly surrounds it. Also used for the end of a deletion range.
+- start: where the start of a deletion range moves. Insertions at the same position move it.
+- char: where a character moves, or whether it has been deleted.
+'''
+from __future__ import annotations
+from bisect import bisect_right
+from typing import Dict, List, Tuple
+
+from topicsync.rope import Rope
+
+class _Map:
+    '''
+    A monotone map from positions (>= 0) to positions, made of pieces. Piece k covers positions from starts[k] to
+    starts[k+1] (exclusive). It either shifts positions by values[k] or maps them all to the constant values[k].
+    alive[k] is False if positions in the piece are killed.
+    '''
+    __slots__ = ('starts', 'values', 'consts', 'alive')
+
+    def __init__(self, pieces: List[Tuple[int, int, bool, bool]]):
+        self.starts: List[int] = []
+        self.values: List[int] = []
+        self.consts: List[bool] = []
+        self.alive: List[bool] = []
+        for start, value, const, alive in pieces:
+            self._add(start, value, const, alive)
+
+    def _add(self, start: int, value: int, const: bool, alive: bool):
+        if self.starts and self.starts[-1] == start:
+            # the previous piece is empty
+            self.starts.pop(); self.values.pop(); self.consts.pop(); self.alive.pop()
+        if self.starts and self.consts[-1] == const and self.values[-1] == value and self.alive[-1] == alive:
+            # same function as the previous piece
+            return
+        self.starts.append(start)
+        self.values.append(value)
+        self.consts.append(const)
+        self.alive.append(alive)
+
+    def __call__(self, position: int) -> Tuple[int, bool]:
+        k = bisect_right(self.starts, position) - 1
+        if self.consts[k]:
+            return self.values[k], self.alive[k]
+        return position + self.values[k], self.alive[k]
+
+    def then(self, other: _Map) -> _Map:
+        '''
+        Compose two maps. The result maps p to other(self(p)), and is alive if both are alive.
+        '''
+        result = _Map([])
+        n = len(self.starts)
+        for k in range(n):
+            start = self.starts[k]
+            if self.consts[k]:
+                value, alive = other(self.values[k])
+                result._add(start, value, True, self.alive[k] and alive)
+                continue
+            shift = self.values[k]
+            low = start + shift
+            high = self.starts[k + 1] + shift if k + 1 < n else None
+            j = bisect_right(other.starts, low) - 1
+            while j < len(other.starts) and (high is None or other.starts[j] < high):
+                piece_start = max(other.starts[j], low) - shift
+                alive = self.alive[k] and other.alive[j]
+                if other.consts[j]:
+                    result._add(piece_start, other.values[j], True, alive)
+                else:
+                    result._add(piece_start, shift + other.values[j], False, alive)
+                j += 1
+        return result
+
+_IDENTITY = _Map([(0, 0, False, True)])
+
+class _Transform:
+    __slots__ = ('cursor', 'start', 'char')
+
+    def __init__(self, cursor: _Map, start: _Map, char: _Map):
+        self.cursor = cursor
+        self.start = start
+        self.char = char
+
+    def then(self, other: _Transform) -> _Transform:
+        return _Transform(self.cursor.then(other.cursor), self.start.then(other.start), self.char.then(other.char))
+
+    @staticmethod
+    def from_op(op: Tuple) -> _Transform:
+        match op:
+            case ('insert', position, length) if length > 0:
+                left_biased = _Map([(0, 0, False, True), (position + 1, length, False, True)])
+                right_biased = _Map([(0, 0, False, True), (position, length, False, True)])
+                return _Transform(left_biased, right_biased, right_biased)
+            case ('delete', position, length) if length > 0:
+                return _Transform(
+                    _Map([(0, 0, False, True), (position + 1, position, True, False), (position + length, -length, False, True)]),
+                    _Map([(0, 0, False, True), (position + 1, position, True, True), (position + length, -length, False, True)]),
+                    _Map([(0, 0, False, True), (position, position, True, False), (position + length, -length, False, True)]),
+                )
+            case ('set',):
+                # Viewed as delete all and insert all. Insertions keep their content, deletions lose all characters.
+                return _Transform(_Map([(0, 0, True, True)]), _Map([(0, 0, True, True)]), _Map([(0, 0, True, False)]))
+            case _:
+                return _Transform(_IDENTITY, _IDENTITY, _IDENTITY)
+
+class StringTransform:
+    '''
+    The composed effect of the changes committed after some version of a string topic.
+    '''
+    def __init__(self, transforms: List[_Transform], value: str | Rope):
+        self._transforms = transforms
+        self._value = value
+
+    def _evaluate(self, map_name: str, position: int) -> Tuple[int, bool]:
+        alive = True
+        for transform in self._transforms:
+            position, piece_alive = getattr(transform, map_name)(position)
+            alive = alive and piece_alive
+        return position, alive
+
+    def map_insertion(self, position: int) -> Tuple[int, bool]:
+        '''
+        Return the new position of an insertion, and whether the insertion survives.
+        '''
+        return self._evaluate('cursor', position)
+
+    def map_deletion(self, position: int, deletion: str) -> Tuple[int, str]:
+        '''
+        Return the new position and the new deleted string of a deletion.
+        Raise ValueError if a character of the deletion that still exists doesn't match the current value.
+        '''
+        start, _ = self._evaluate('start', position)
+        end, _ = self._evaluate('cursor', position + len(deletion))
+        end = max(start, end)
+        if isinstance(self._value, Rope):
+            new_deletion = self._value.substring(start, end)
+        else:
+            new_deletion = self._value[start:end]
+
+        for i, char in enumerate(deletion):
+            new_position, alive = self._evaluate('char', position + i)
+            if alive and not (start <= new_position < end and new_deletion[new_position - start] == char):
+                raise ValueError(f"Deletion invalid: string '{deletion}' doesn't appear at position {position} of the base version")
+        return start, new_deletion
+
+class RebaseEngine:
+    '''
+    Keeps the committed changes of a string topic as position operations, and caches composed transforms of aligned
+    runs of them. Level j caches runs of 2**j changes starting at multiples of 2**j (absolute change indices).
+    '''
+    MAX_LEVEL = 12
+
+    def __init__(self):
+        self._ops: List[Tuple] = []
+        self._first_index = 0 # absolute index of self._ops[0]
+        self._levels: List[Dict[int, _Transform]] = [{} for _ in range(self.MAX_LEVEL + 1)]
+
+    def append(self, op: Tuple):
+        '''
+        Record a committed change, given as ('insert', position, length), ('delete', position, length) or ('set',).
+        '''
+        self._ops.append(op)
+
+    def discard_before(self, index: int):
+        '''
+        Forget changes with absolute index less than index.
+        '''
+        if index <= self._first_index:
+            return
+        del self._ops[:index - self._first_index]
+        self._first_index = index
+        for level, blocks in enumerate(self._levels):
+            for block in [block for block in blocks if block << level < index]:
+                del blocks[block]
+
+    def _block(self, level: int, block: int) -> _Transform:
+        if level == 0:
+            return _Transform.from_op(self._ops[block - self._first_index])
+        blocks = self._levels[level]
+        if block not in blocks:
+            blocks[block] = self._block(level - 1, block * 2).then(self._block(level - 1, block * 2 + 1))
+        return blocks[block]
+
+    def transform(self, start: int, value: str | Rope) -> StringTransform:
+        '''
+        The transform of the changes from absolute index start to the latest one.
+        '''
+        end = self._first_index + len(self._ops)
+        transforms = []
+        while start < end:
+            level = 0
+            while level < self.MAX_LEVEL and start % (2 << level) == 0 and start + (2 << level) <= end:
+                level += 1
+            transforms.append(self._block(level, start >> level))
+            start += 1 << level
+        return StringTransform(transforms, value)
@@ -1,15 +1,24 @@
 from __future__ import annotations
 
+import array
 import base64
 from calendar import c
 import collections
 import copy
-import json
 import logging
+import time
 logger = logging.getLogger(__name__)
-from typing import TYPE_CHECKING, Any, Callable, Generic, Iterable, List, TypeVar, Dict
-from topicsync.change import DictChangeTypes, EventChangeTypes, GenericChangeTypes, Change, IntChangeTypes, InvalidChangeError, ListChangeTypes, StringChangeTypes, SetChangeTypes, FloatChangeTypes, default_topic_value, type_validator
-from topicsync.utils import Action, camel_to_snake
+from typing import TYPE_CHECKING, Any, Callable, Generic, Iterable, List, Tuple, TypeVar, Dict
+from topicsync.change import ArrayChangeTypes, CounterChangeTypes, DictChangeTypes, EventChangeTypes, GenericChangeTypes, Change, IntChangeTypes, InvalidChangeError, ListChangeTypes, LogChangeTypes, StringChangeTypes, SetChangeTypes, FloatChangeTypes, VersionTooOldError, default_topic_value, set_type_validator, operand_type_validator
+from topicsync.change import SetChange, PathSetChange, PathInsertChange, PathRemoveChange
+from topicsync.utils import Action, camel_to_snake, canonical_key
+from topicsync.indexed_set import IndexedSet
+from topicsync.block_list import BlockList
+from topicsync.log_buffer import LogBuffer
+from topicsync.dict_index import DictIndex
+from topicsync.rope import Rope
+from topicsync.string_rebase import RebaseEngine, StringTransform
+from topicsync import string_diff, json_pointer, numeric_array
 import abc
 
 if TYPE_CHECKING:
@@ -32,9 +41,12 @@ class Topic(metaclass = abc.ABCMeta):
     def __init__(self,name,state_machine:StateMachine,is_stateful:bool = True,init_value=None,order_strict:bool=False):
         self._name = name
         self._validators : List[Callable[[Any,Change],bool]] = []
+        self._pre_validators : List[Callable[[Any,Change],bool]] = []
         self._state_machine = state_machine
         self._is_stateful = is_stateful
         self._order_strict = order_strict
+        self._revision = 0 # bumped on every applied change, used to detect a stale cached value
+        self._value_is_shared = False # the value is a snapshot held by a SetChange or a post-commit call, copied before it is modified
 
         if init_value is not None:
             self._value = init_value
@@ -52,6 +64,38 @@ class Topic(metaclass = abc.ABCMeta):
         - after: the new value
         """
     
+    def _bind_actions(self):
+        '''
+        Called when the topic is added to its state machine. Lets the actions of the topic count their post-commit
+        callbacks in the state machine and dispatch with its dispatcher.
+        '''
+        for value in vars(self).values():
+            if isinstance(value, Action) and value._owner is None:
+                value._owner = self
+                value._count_post_commit_callbacks(len(value._post_commit_callbacks))
+
+    def _unbind_actions(self):
+        '''
+        Called when the topic is removed from its state machine.
+        '''
+        for value in vars(self).values():
+            if isinstance(value, Action) and value._owner is self:
+                value._count_post_commit_callbacks(-len(value._post_commit_callbacks))
+                value._owner = None
+
+    def _has_listeners(self) -> bool:
+        return any(isinstance(value, Action) and value.num_callbacks for value in vars(self).values())
+
+    def _share_value(self,value) -> bool:
+        '''
+        If value is the value of the topic, mark it as shared so it's copied before the next change, and return True.
+        Only lists and dicts are shared, since the copy before a change is shallow.
+        '''
+        if value is not self._value or type(value) not in (list, dict):
+            return False
+        self._value_is_shared = True
+        return True
+
     def _validate_change_and_get_result(self,change:Change):
         '''
         Validate the change and return the new value. Raise InvalidChangeException if the change is invalid.
@@ -83,6 +127,12 @@ class Topic(metaclass = abc.ABCMeta):
         In client, it is deserialized as a SetChange.
         '''
         return {"topic_name": self.get_name(), "value": self.get()}
+
+    def get_revision(self):
+        '''
+        A counter that increases every time a change is applied to the topic. Anything derived from the value can be cached until the revision changes.
+        '''
+        return self._revision
     
     def add_validator(self,validator:Callable[[Any,Change],bool]):
         '''
@@ -90,11 +140,22 @@ class Topic(metaclass = abc.ABCMeta):
         '''
         self._validators.append(validator)
 
+    def add_pre_validator(self,validator:Callable[[Any,Change],bool]):
+        '''
+        Add a validator that takes the current value and the change as arguments, and is called before the change is applied. It returns True if the change is valid and False otherwise.
+        Prefer it over add_validator when the change itself is enough to decide: a rejected change is never applied, so nothing has to be reverted.
+        '''
+        self._pre_validators.append(validator)
+
     def apply_change_external(self, change:Change):
         '''
         Call this when the user or the app wants to change the value of the topic. The change is then be executed by the state machine.
+        Changes of non-stateful topics made outside a transition are published without one (see StateMachine.publish).
         '''
-        self._state_machine.apply_change(change)     
+        if self._is_stateful:
+            self._state_machine.apply_change(change)
+        else:
+            self._state_machine.publish(change)
 
     def set_to_default(self):
         '''
@@ -119,20 +180,30 @@ class Topic(metaclass = abc.ABCMeta):
 
         Note that only the state machine is allowed to call this method.
         '''
-        tmp = change.serialize()
-        tmp.pop('topic_type')
-        tmp.pop('topic_name')
-        tmp.pop('id')
-        printed = '\t'
-        for s in [f'{k}:{v}' for k,v in tmp.items()]:
-            printed += s
-            printed += ', '
-        
-        logger.debug(f'{self._name} changed: {printed}')
+        if logger.isEnabledFor(logging.DEBUG):
+            printed = ''.join(f'{k}:{v}, ' for k,v in change.serialize().items() if k not in ('topic_type','topic_name','id'))
+            logger.debug(f'{self._name} changed: \t{printed}')
+
+        for validator in self._pre_validators:
+            if not validator(self._value,change):
+                raise InvalidChangeError(change,'Validator failed')
+
+        if self._value_is_shared and not isinstance(change, SetChange):
+            # Changes other than SetChange only modify the top-level container in place. Path changes copy the
+            # containers along the path themselves.
+            self._value = copy.copy(self._value)
+            self._value_is_shared = False
 
         old_value = self._value
-        new_value = self._validate_change_and_get_result(change)
+        # Bump before validating: a failed change may have touched a mutable value before being reverted.
+        self._revision += 1
+        try:
+            new_value = self._validate_change_and_get_result(change)
+        finally:
+            # Applying records things like resolved positions and removed items in the change
+            change.invalidate_serialized()
         self._value = new_value
+        self._value_is_shared = isinstance(change, (SetChange, PathSetChange)) and new_value is change.value
         return old_value,new_value
 
     def notify_listeners(self,auto:bool,change:Change, old_value, new_value):
@@ -148,6 +219,13 @@ class Topic(metaclass = abc.ABCMeta):
 
     def is_stateful(self):
         return self._is_stateful
+
+    def set_observed(self, observed:bool):
+        '''
+        Called by the client manager when the first client subscribes to the topic (observed=True) or the last one
+        unsubscribes. Override it to keep the value up to date only while someone needs it.
+        '''
+        pass
     
     def is_order_strict(self):
         return self._order_strict
@@ -230,34 +308,324 @@ class GenericTopic(Topic,Generic[T]):
         change = GenericChangeTypes.SetChange(self._name,value)
         self.apply_change_external(change)
 
+    def get_path(self, path: str|List):
+        return copy.deepcopy(json_pointer.get(self._value, _to_tokens(path)))
+
+    def set_path(self, path: str|List, value):
+        '''
+        Set the value at a JSON pointer path like "/players/0/x", or a list of tokens like ['players', 0, 'x'].
+        '''
+        change = GenericChangeTypes.PathSetChange(self._name,_to_pointer(path),value)
+        self.apply_change_external(change)
+
+    def insert_path(self, path: str|List, value):
+        change = GenericChangeTypes.PathInsertChange(self._name,_to_pointer(path),value)
+        self.apply_change_external(change)
+
+    def remove_path(self, path: str|List):
+        change = GenericChangeTypes.PathRemoveChange(self._name,_to_pointer(path))
+        self.apply_change_external(change)
+
+    def merge_changes(self, changes: List[Change]):
+        return merge_path_changes(changes)
+
+class DerivedTopic(GenericTopic):
+    '''
+    A read-only topic whose value is computed from other topics.
+
+    With dependencies (topics or topic names), compute(*values) is called with their values. Without, compute(get)
+    is called with a function that returns the value of a topic or topic name, and the topics it reads are the
+    dependencies. Dependencies are noticed through their on_set, so event topics can't be dependencies.
+
+    The value is computed lazily and memoized by the revisions of the dependencies. While the topic is observed
+    (see set_observed), it is recomputed at most once at the end of each transition that changes a dependency, and
+    the new value is applied as a SetChange so clients receive it.
+    The topic is not stateful: its changes follow from the changes of the dependencies, so they are not recorded
+    for undo.
+    '''
+    def __init__(self,name,state_machine:StateMachine,is_stateful:bool=False,init_value=None,order_strict=True,
+                 compute:Callable|None=None,dependencies:Iterable[Topic|str]|None=None):
+        super().__init__(name,state_machine,False,init_value,order_strict)
+        self._compute = compute
+        self._dependencies = None if dependencies is None else list(dependencies)
+        self._computed = None
+        self._versions : Tuple[Tuple[Topic,int],...]|None = None # the dependencies and their revisions when _computed was computed
+        self._watched : List[Topic] = [] # dependencies whose on_set is listened to, while observed
+        self._observers = 0 # the client manager and the observed derived topics depending on this one
+        self._observed = False
+        self._refreshing = False
+        self.add_pre_validator(lambda value, change: self._refreshing)
+
+    @classmethod
+    def get_type_name(cls):
+        # Clients see it as a generic topic
+        return 'generic'
+
+    def set_compute(self, compute:Callable, dependencies:Iterable[Topic|str]|None=None):
+        self._compute = compute
+        self._dependencies = None if dependencies is None else list(dependencies)
+        self._versions = None
+        if self._observed:
+            self._state_machine.do_before_transition_ends(self._refresh)
+
+    def set(self, value):
+        raise InvalidChangeError(GenericChangeTypes.SetChange(self._name,value),'Derived topics are read-only')
+
+    def get(self):
+        return copy.deepcopy(self._get_computed())
+
+    def get_revision(self):
+        if not self._observed:
+            # Derived topics depending on this one compare revisions to notice changes
+            self._get_computed()
+        return self._revision
+
+    def set_observed(self, observed:bool):
+        self._observers += 1 if observed else -1
+        if (self._observers > 0) == self._observed:
+            return
+        if observed:
+            # Nobody has received the value, so it is brought up to date without a change
+            self._get_computed()
+            self._observed = True
+            self._watch([topic for topic, _ in self._versions or ()])
+        else:
+            self._observed = False
+            self._watch([])
+
+    def _resolve(self, dependency:Topic|str) -> Topic:
+        return dependency if isinstance(dependency, Topic) else self._state_machine.get_topic(dependency)
+
+    def _is_stale(self):
+        if self._versions is None:
+            return True
+        for topic, revision in self._versions:
+            if topic.get_revision() != revision:
+                return True
+        return False
+
+    def _get_computed(self):
+        if not self._is_stale() or self._compute is None:
+            return self._computed
+
+        if self._dependencies is not None:
+            topics = [self._resolve(dependency) for dependency in self._dependencies]
+            value = self._compute(*[topic.get() for topic in topics])
+        else:
+            topics = []
+            def get(dependency:Topic|str):
+                topic = self._resolve(dependency)
+                if topic not in topics:
+                    topics.append(topic)
+                return topic.get()
+            value = self._compute(get)
+
+        self._computed = value
+        self._versions = tuple((topic, topic.get_revision()) for topic in topics)
+        if self._observed:
+            self._watch(topics)
+        else:
+            self._value = value
+            self._revision += 1
+        return value
+
+    def _watch(self, topics:List[Topic]):
+        # Derived dependencies are observed too, so they apply their changes and notify this topic
+        for topic in self._watched:
+            if topic not in topics:
+                topic.on_set.remove(self._on_dependency_changed)
+                topic.set_observed(False)
+        for topic in topics:
+            if topic not in self._watched:
+                topic.on_set.add_manual(self._on_dependency_changed)
+                topic.set_observed(True)
+        self._watched = topics
+
+    def _on_dependency_changed(self, value):
+        self._state_machine.do_before_transition_ends(self._refresh)
+
+    def _refresh(self):
+        if not self._observed:
+            return
+        value = self._get_computed()
+        if value != self._value:
+            self._refreshing = True
+            try:
+                self.apply_change_external(GenericChangeTypes.SetChange(self._name,value))
+            finally:
+                self._refreshing = False
+
 class StringTopic(Topic):
     '''
     String topic
     '''
     def __init__(self,name,state_machine:StateMachine,is_stateful:bool=True,init_value=None,order_strict=True):
         super().__init__(name,state_machine,is_stateful,init_value,order_strict)
-        self.add_validator(type_validator(str))
+        self.add_pre_validator(set_type_validator(str))
 
         self.version = f"{name}_init"
+        # Maps a version to the absolute index of the change that produced it. Absolute indices keep counting after old changes are dropped.
         self.version_to_index: Dict[str, int] = {f"{name}_init": -1}
         self.changes: List[Change] = []
 
+        # History retention. self.changes[0] has absolute index self._first_index.
+        # The checkpoint is the oldest version changes_from() accepts.
+        self.checkpoint_version = self.version
+        self._first_index = 0
+        self._change_info: List[Tuple[str, float, int]] = [] # (result version, time, estimated size) of each change in self.changes
+        self._history_bytes = 0
+        self._max_changes: int|None = None
+        self._max_age: float|None = None
+        self._max_bytes: int|None = None
+        self._rebase_engine = RebaseEngine()
+
+    def set_history_limit(self, max_changes: int|None = None, max_age: float|None = None, max_bytes: int|None = None):
+        '''
+        Limit the change history kept for rebasing concurrent changes. None means unlimited.
+
+        Args:
+            - max_changes: The maximum number of changes.
+            - max_age: The maximum age of a change in seconds.
+            - max_bytes: The maximum estimated size of the changes.
+
+        When a limit is exceeded, the oldest changes are dropped until the history is within 3/4 of the limit, so the
+        history is compacted once in a while instead of on every change.
+        Changes based on a dropped version are rejected with VersionTooOldError and the client should resync.
+        '''
+        self._max_changes = max_changes
+        self._max_age = max_age
+        self._max_bytes = max_bytes
+        self._compact()
+
+    def enable_rope(self):
+        '''
+        Store the value in a rope, so inserting and deleting cost O(log n) instead of copying the whole string.
+        A flat string is only built when the value is read. Recommended for large documents.
+        '''
+        if not isinstance(self._value, Rope):
+            self._value = Rope(self._value)
+
+    def is_rope_enabled(self):
+        return isinstance(self._value, Rope)
+
+    def get(self):
+        return str(self._value)
+
     def get_init_message(self):
         return super().get_init_message() | {'id': self.version} # client-side SetChange uses 'id' as version
 
     def _validate_change_and_get_result(self,change:Change):
         result_version = change.exchange_topic_version(self.version, self)
-        result = super()._validate_change_and_get_result(change)
-        self.version_to_index[result_version] = len(self.changes)
-        self.changes.append(change)
+        current = self._value
+        use_rope = isinstance(current, Rope)
+        if use_rope and isinstance(change, StringChangeTypes.SetChange):
+            # SetChange works on flat strings
+            self._value = str(current)
+        try:
+            result = super()._validate_change_and_get_result(change)
+        except InvalidChangeError:
+            if isinstance(change, StringChangeTypes.SetChange):
+                self._value = current
+            raise
+        if use_rope and isinstance(result, str):
+            result = Rope(result)
+        self._append_history(change, result_version, time.time())
         self.version = result_version
         return result
 
+    @staticmethod
+    def _estimate_change_size(change:Change) -> int:
+        match change:
+            case StringChangeTypes.InsertChange():
+                return 100 + len(change.insertion)
+            case StringChangeTypes.DeleteChange():
+                return 100 + len(change.deletion)
+            case StringChangeTypes.SetChange():
+                return 100 + len(change.value) + len(change.old_value or '')
+            case _:
+                return 100
+
+    def _append_history(self, change:Change, result_version:str, timestamp:float):
+        size = self._estimate_change_size(change)
+        self.version_to_index[result_version] = self._first_index + len(self.changes)
+        self.changes.append(change)
+        self._change_info.append((result_version, timestamp, size))
+        match change:
+            case StringChangeTypes.InsertChange():
+                self._rebase_engine.append(('insert', change.position, len(change.insertion)))
+            case StringChangeTypes.DeleteChange():
+                self._rebase_engine.append(('delete', change.position, len(change.deletion)))
+            case _:
+                self._rebase_engine.append(('set',))
+        self._history_bytes += size
+        self._compact()
+
+    def _compact(self):
+        '''
+        Drop the oldest changes if the history exceeds a limit.
+        '''
+        n = len(self.changes)
+        drop = 0
+        if self._max_changes is not None and n > self._max_changes:
+            drop = max(drop, n - self._max_changes * 3 // 4)
+        if self._max_age is not None and n > 0:
+            now = time.time()
+            if now - self._change_info[0][1] > self._max_age:
+                while drop < n and now - self._change_info[drop][1] > self._max_age * 3 / 4:
+                    drop += 1
+        if self._max_bytes is not None and self._history_bytes > self._max_bytes:
+            remaining = self._history_bytes - sum(info[2] for info in self._change_info[:drop])
+            while drop < n and remaining > self._max_bytes * 3 / 4:
+                remaining -= self._change_info[drop][2]
+                drop += 1
+        if drop == 0:
+            return
+
+        # The last dropped version becomes the new checkpoint. Forget the old checkpoint and the other dropped versions.
+        # Undo and redo reuse versions, so a version is forgotten only if it still points at the dropped change.
+        self._forget_version(self.checkpoint_version, self._first_index - 1)
+        for i, (version, _, _) in enumerate(self._change_info[:drop - 1]):
+            self._forget_version(version, self._first_index + i)
+        self._history_bytes -= sum(info[2] for info in self._change_info[:drop])
+        self.checkpoint_version = self._change_info[drop - 1][0]
+        del self.changes[:drop]
+        del self._change_info[:drop]
+        self._first_index += drop
+        self._rebase_engine.discard_before(self._first_index)
+
+    def _forget_version(self, version:str, index:int):
+        if self.version_to_index.get(version) == index:
+            del self.version_to_index[version]
+
+    def notify_listeners(self,auto:bool,change:Change, old_value, new_value):
+        if isinstance(new_value, Rope) and (self.on_set.num_callbacks or self.on_set2.num_callbacks):
+            # The rope was edited in place, listeners get flat strings
+            new_value = str(new_value)
+            if isinstance(change, StringChangeTypes.InsertChange):
+                old_value = string_diff.delete(new_value, change.position, change.insertion)
+            elif isinstance(change, StringChangeTypes.DeleteChange):
+                old_value = string_diff.insert(new_value, change.position, change.deletion)
+            else:
+                old_value = str(old_value)
+        super().notify_listeners(auto,change,old_value,new_value)
+
     def changes_from(self, version: str) -> Iterable[Change]:
         '''
-        This method will throw if version isn't valid (isn't recorded by the topic)
+        This method will throw if version isn't valid (isn't recorded by the topic).
+        If the version may have been dropped by history compaction, VersionTooOldError is raised.
+        '''
+        if version not in self.version_to_index and self._first_index > 0:
+            raise VersionTooOldError(self._name, version, self.checkpoint_version)
+        return self.changes[self.version_to_index[version] + 1 - self._first_index:]
+
+    def transform_from(self, version: str) -> StringTransform:
+        '''
+        The composed effect of the changes after the version, used to rebase changes made on that version.
+        Throws like changes_from().
         '''
-        return self.changes[self.version_to_index[version] + 1:]
+        if version not in self.version_to_index and self._first_index > 0:
+            raise VersionTooOldError(self._name, version, self.checkpoint_version)
+        return self._rebase_engine.transform(self.version_to_index[version] + 1, self._value)
     
     def merge_changes(self,changes:List[Change]):
         stack = collections.deque[Change]()
@@ -301,17 +669,41 @@ class StringTopic(Topic):
         self.set(b64)
 
     def to_binary(self):
-        return base64.b64decode(self._value)
+        return base64.b64decode(self.get())
 
     def serialize_additional(self):
         return {'version': self.version,
                 'version_to_index': self.version_to_index,
-                'changes': [change.serialize() for change in self.changes]}
+                'changes': [change.serialize() for change in self.changes],
+                'versions': [info[0] for info in self._change_info],
+                'use_rope': self.is_rope_enabled(),
+                'first_index': self._first_index,
+                'checkpoint_version': self.checkpoint_version}
 
     def restore_additional(self, data):
         self.version = data['version']
-        self.version_to_index = data['version_to_index']
-        self.changes = [Change.deserialize(change) for change in data['changes']]
+        self.version_to_index = {}
+        self.changes = []
+        self._rebase_engine = RebaseEngine()
+        self._change_info = []
+        self._history_bytes = 0
+        self._first_index = data.get('first_index', 0)
+        self.checkpoint_version = data.get('checkpoint_version', f"{self._name}_init")
+        self.version_to_index[self.checkpoint_version] = self._first_index - 1
+        self._rebase_engine.discard_before(self._first_index)
+
+        versions = data.get('versions')
+        if versions is None:
+            # Serialized without the versions of the changes. A change whose version was reused by undo has none.
+            index_to_version = {index: version for version, index in data['version_to_index'].items()}
+            versions = [index_to_version.get(self._first_index + i) for i in range(len(data['changes']))]
+        now = time.time()
+        for change, version in zip(data['changes'], versions):
+            self._append_history(Change.deserialize(change), version, now)
+        self.version_to_index.pop(None, None) # type: ignore
+
+        if data.get('use_rope', False):
+            self.enable_rope()
 
         
 class IntTopic(Topic):
@@ -320,7 +712,7 @@ class IntTopic(Topic):
     '''
     def __init__(self,name,state_machine:StateMachine,is_stateful:bool=True,init_value=None,order_strict=True):
         super().__init__(name,state_machine,is_stateful,init_value,order_strict)
-        self.add_validator(type_validator(int))
+        self.add_pre_validator(operand_type_validator(int))
     
     def set(self, value:int):
         if value == self._value:
@@ -356,6 +748,44 @@ class IntTopic(Topic):
         return stack
     
         
+class CounterTopic(Topic):
+    '''
+    Counter that many clients add to concurrently, like votes or likes. Adds commute, so the topic is never order
+    strict: the server buffers its changes and sends subscribers one summed change per flush window. Every add is still
+    its own transition, so each client's contribution can be undone.
+    '''
+    def __init__(self,name,state_machine:StateMachine,is_stateful:bool=True,init_value=None,order_strict=False):
+        super().__init__(name,state_machine,is_stateful,init_value,order_strict=False)
+        self.add_pre_validator(operand_type_validator(int))
+
+    def set(self, value:int):
+        if value == self._value:
+            return
+        change = CounterChangeTypes.SetChange(self._name,value)
+        self.apply_change_external(change)
+
+    def add(self, value:int=1):
+        change = CounterChangeTypes.AddChange(self._name,value)
+        self.apply_change_external(change)
+
+    def merge_changes(self,changes:List[Change]):
+        base: CounterChangeTypes.SetChange|None = None
+        total = 0
+        for change in changes:
+            if isinstance(change, CounterChangeTypes.SetChange):
+                base = change
+                total = 0
+            elif isinstance(change, CounterChangeTypes.AddChange):
+                total += change.value
+            else:
+                raise Exception(f'Unsupported change type {type(change)} for {self.__class__.__name__}')
+        if not changes:
+            return []
+        last_id = changes[-1].id
+        if base is not None:
+            return [CounterChangeTypes.SetChange(self._name,base.value + total,base.old_value,last_id)]
+        return [CounterChangeTypes.AddChange(self._name,total,last_id)]
+
 class FloatTopic(Topic):
     '''
     Int topic
@@ -363,7 +793,7 @@ class FloatTopic(Topic):
     def __init__(self,name,state_machine:StateMachine,is_stateful:bool=True,init_value=None,order_strict=True):
         super().__init__(name,state_machine,is_stateful,init_value,order_strict)
         
-        self.add_validator(type_validator(float,int))
+        self.add_pre_validator(operand_type_validator(float,int))
         self.on_set = Action()
     
     def set(self, value:float):
@@ -376,14 +806,180 @@ class FloatTopic(Topic):
         change = FloatChangeTypes.AddChange(self._name,value)
         self.apply_change_external(change)
 
+class ArrayTopic(Topic):
+    '''
+    Numeric array, like a simulation state. The value is an array.array on the server, and {"dtype": ..., "data": <base64>}
+    on the wire (see numeric_array), which is also what get() returns. Use to_array() or to_list() to read the numbers.
+    Changes to a slice only send the items of the slice.
+    '''
+    def __init__(self,name,state_machine:StateMachine,is_stateful:bool=True,init_value=None,order_strict=True):
+        super().__init__(name,state_machine,is_stateful,init_value,order_strict)
+        self.add_pre_validator(set_type_validator(dict))
+        self.on_update = Action()
+        """args:
+        - start: the first changed index
+        - stop: the index after the last changed index
+        """
+        self._value = numeric_array.to_array(self._value)
+
+    def get(self):
+        return numeric_array.encode(self._value)
+
+    def get_dtype(self):
+        return numeric_array.dtype_of(self._value)
+
+    def to_array(self):
+        return array.array(self._value.typecode, self._value)
+
+    def to_list(self):
+        return self._value.tolist()
+
+    def _validate_change_and_get_result(self,change:Change):
+        if not isinstance(change, ArrayChangeTypes.SetChange):
+            return super()._validate_change_and_get_result(change)
+        # SetChange works on the wire form
+        current = self._value
+        self._value = numeric_array.encode(current)
+        try:
+            return numeric_array.to_array(super()._validate_change_and_get_result(change))
+        except ValueError as e:
+            self._value = current
+            raise InvalidChangeError(change, str(e)) from e
+        except:
+            self._value = current
+            raise
+
+    def _items(self, values) -> array.array:
+        return array.array(self._value.typecode, values)
+
+    def set(self, value):
+        values = numeric_array.to_array(value, self.get_dtype())
+        if values == self._value:
+            return
+        change = ArrayChangeTypes.SetChange(self._name,numeric_array.encode(values))
+        self.apply_change_external(change)
+
+    def set_slice(self, start:int, values):
+        '''
+        Overwrite the items from start with values.
+        '''
+        change = ArrayChangeTypes.SetSliceChange(self._name,start,numeric_array.encode_data(self._items(values)))
+        self.apply_change_external(change)
+
+    def add_range(self, start:int, stop:int, value):
+        '''
+        Add value to every item in [start, stop).
+        '''
+        change = ArrayChangeTypes.AddRangeChange(self._name,start,stop,value)
+        self.apply_change_external(change)
+
+    def add_slice(self, start:int, values):
+        '''
+        Add values to the items from start element-wise.
+        '''
+        change = ArrayChangeTypes.AddSliceChange(self._name,start,numeric_array.encode_data(self._items(values)))
+        self.apply_change_external(change)
+
+    def __len__(self):
+        return len(self._value)
+
+    def __getitem__(self, key):
+        return self._value[key]
+
+    def merge_changes(self, changes: List[Change]):
+        merged: List[Change] = []
+        for change in changes:
+            previous = merged[-1] if merged else None
+            if isinstance(change, ArrayChangeTypes.SetChange):
+                # Overwrite all previous changes
+                merged = [change]
+                continue
+            if isinstance(change, ArrayChangeTypes.SetSliceChange) and isinstance(previous, ArrayChangeTypes.SetSliceChange):
+                combined = self._merge_slices(previous, change)
+                if combined is not None:
+                    merged[-1] = combined
+                    continue
+            if isinstance(change, ArrayChangeTypes.AddRangeChange) and isinstance(previous, ArrayChangeTypes.AddRangeChange) \
+                    and (previous.start, previous.stop) == (change.start, change.stop):
+                merged[-1] = ArrayChangeTypes.AddRangeChange(self._name,change.start,change.stop,previous.value + change.value,change.id)
+                continue
+            merged.append(change)
+        return merged
+
+    def _merge_slices(self, first: ArrayChangeTypes.SetSliceChange, second: ArrayChangeTypes.SetSliceChange):
+        '''
+        Merge two slice changes if their slices overlap or touch. The second one wins where they overlap.
+        '''
+        first_values = numeric_array.decode_data(first.data, self._value.typecode)
+        second_values = numeric_array.decode_data(second.data, self._value.typecode)
+        first_stop = first.start + len(first_values)
+        second_stop = second.start + len(second_values)
+        if second.start > first_stop or first.start > second_stop:
+            return None
+        start = min(first.start, second.start)
+        values = self._items([0]) * (max(first_stop, second_stop) - start)
+        values[first.start - start:first_stop - start] = first_values
+        values[second.start - start:second_stop - start] = second_values
+        return ArrayChangeTypes.SetSliceChange(self._name,start,numeric_array.encode_data(values),second.id)
+
+    def notify_listeners(self,auto:bool,change:Change, old_value, new_value):
+        super().notify_listeners(auto,change,old_value,new_value)
+        match change:
+            case ArrayChangeTypes.SetChange():
+                self.on_update.invoke(auto,0,len(new_value))
+            case ArrayChangeTypes.SetSliceChange() | ArrayChangeTypes.AddRangeChange() | ArrayChangeTypes.AddSliceChange():
+                self.on_update.invoke(auto,change.start,change.stop)
+            case _:
+                raise Exception(f'Unsupported change type {type(change)} for {self.__class__.__name__}')
+
 class SetTopic(Topic):
-    
+    '''
+    Set topic. The value is a list on the wire, and an IndexedSet on the server so append, remove and contains are O(1).
+    '''
     def __init__(self,name,state_machine:StateMachine,is_stateful:bool=True,init_value=None,order_strict=True):
         super().__init__(name,state_machine,is_stateful,init_value,order_strict)
-        self.add_validator(type_validator(list))
+        self.add_pre_validator(set_type_validator(list))
         self.on_append = Action()
         self.on_remove = Action()
-    
+        self._value = IndexedSet(self._value)
+
+    def get(self):
+        return copy.deepcopy(self._as_list(self._value))
+
+    @staticmethod
+    def _as_list(value):
+        return value.to_list() if isinstance(value, IndexedSet) else value
+
+    def add_validator(self, validator:Callable[[Any,Change],bool]):
+        '''
+        The validator gets the new value as a list, like the value on the wire.
+        '''
+        super().add_validator(lambda new_value, change: validator(self._as_list(new_value), change))
+
+    def _validate_change_and_get_result(self,change:Change):
+        current = self._value
+        if isinstance(change, SetChangeTypes.SetChange) and isinstance(current, IndexedSet):
+            # SetChange works on lists
+            self._value = current.to_list()
+        try:
+            result = super()._validate_change_and_get_result(change)
+        except InvalidChangeError:
+            if isinstance(change, SetChangeTypes.SetChange):
+                self._value = current
+            raise
+        if not isinstance(result, IndexedSet):
+            result = IndexedSet(result)
+            if isinstance(change, SetChangeTypes.SetChange) and len(result) != len(change.value):
+                # Send the value without the duplicates, so clients get the same value as the server
+                change.value = result.to_list()
+        return result
+
+    def apply_change(self, change:Change):
+        # Append and remove edit the IndexedSet in place. Keep a copy of the old value only if a listener needs it.
+        old_list = self._value.to_list() if self.on_set2.num_callbacks and isinstance(self._value, IndexedSet) else None
+        old_value, new_value = super().apply_change(change)
+        return (old_list if old_list is not None else old_value), new_value
+
     def set(self, value):
         if value == self._value:
             return
@@ -397,6 +993,13 @@ class SetTopic(Topic):
     def remove(self, item):
         change = SetChangeTypes.RemoveChange(self._name,item)
         self.apply_change_external(change)        
+
+    def update(self, append_items:Iterable=(), remove_items:Iterable=()):
+        '''
+        Append and remove many items in one change.
+        '''
+        change = SetChangeTypes.UpdateChange(self._name,list(append_items),list(remove_items))
+        self.apply_change_external(change)
     
     def __len__(self):
         return len(self._value)
@@ -407,22 +1010,30 @@ class SetTopic(Topic):
     def __contains__(self, item):
         return item in self._value
 
-    def notify_listeners(self,auto:bool,change:Change, old_value:list, new_value:list):
-        super().notify_listeners(auto,change,old_value,new_value)
+    def notify_listeners(self,auto:bool,change:Change, old_value, new_value):
+        if self.on_set.num_callbacks or self.on_set2.num_callbacks:
+            super().notify_listeners(auto,change,self._as_list(old_value),self._as_list(new_value))
         match change:
             case SetChangeTypes.SetChange():
-                old_value_set = set(map(json.dumps,old_value))
-                new_value_set = set(map(json.dumps,new_value))
-                removed_items = old_value_set - new_value_set
-                added_items = new_value_set - old_value_set
-                for item in removed_items:
-                    self.on_remove.invoke(auto,json.loads(item))
-                for item in added_items:
-                    self.on_append.invoke(auto,json.loads(item))
+                old_items = old_value if isinstance(old_value, IndexedSet) else IndexedSet(old_value)
+                new_items = new_value if isinstance(new_value, IndexedSet) else IndexedSet(new_value)
+                # iterate in insertion order so listeners see a deterministic order
+                new_keys, old_keys = new_items.keys(), old_items.keys()
+                for key in old_keys:
+                    if key not in new_keys:
+                        self.on_remove.invoke(auto,old_items.get_by_key(key))
+                for key in new_keys:
+                    if key not in old_keys:
+                        self.on_append.invoke(auto,new_items.get_by_key(key))
             case SetChangeTypes.AppendChange():
                 self.on_append.invoke(auto,change.item)
             case SetChangeTypes.RemoveChange():
                 self.on_remove.invoke(auto,change.item)
+            case SetChangeTypes.UpdateChange():
+                for item in change.remove_items:
+                    self.on_remove.invoke(auto,item)
+                for item in change.append_items:
+                    self.on_append.invoke(auto,item)
             case _:
                 raise Exception(f'Unsupported change type {type(change)} for {self.__class__.__name__}')
             
@@ -431,14 +1042,104 @@ class ListTopic(Topic):
     def unique_validator(new_value,change):
         '''
         Validator that prevents the list from having repeated items.
+        Adding it with add_validator turns on require_unique_items() instead, which doesn't scan the whole list on every change.
         '''
         return len(set(new_value)) == len(new_value)
 
     def __init__(self,name,state_machine:StateMachine,is_stateful:bool=True,init_value=None,order_strict=True):
         super().__init__(name,state_machine,is_stateful,init_value,order_strict)
-        self.add_validator(type_validator(list))
+        self.add_pre_validator(set_type_validator(list))
         self.on_insert = Action()
         self.on_pop = Action()
+        self._index_items = False
+        self._item_counts: collections.Counter|None = None
+
+    def enable_blocked_list(self, index_items: bool = False):
+        '''
+        Store the value in a BlockList, so inserting and popping at any position cost O(log n) instead of O(n).
+        With index_items=True, remove() finds the item without scanning the list. Recommended for large lists.
+        '''
+        self._index_items = index_items
+        self._value = BlockList(self._value, index_items)
+
+    def is_blocked_list_enabled(self):
+        return isinstance(self._value, BlockList)
+
+    def add_validator(self, validator:Callable[[Any,Change],bool]):
+        if validator is ListTopic.unique_validator:
+            self.require_unique_items()
+            return
+        super().add_validator(validator)
+
+    def require_unique_items(self):
+        '''
+        Reject changes that would make the list have repeated items. The topic counts its items, so a change is checked
+        in O(1) per inserted item. Only a SetChange checks the whole new value.
+        '''
+        if self._item_counts is not None:
+            return
+        self._item_counts = collections.Counter(canonical_key(item) for item in self._value)
+        self.add_pre_validator(self._unique_pre_validator)
+
+    def _unique_pre_validator(self, old_value, change:Change):
+        match change:
+            case ListChangeTypes.InsertChange():
+                return canonical_key(change.item) not in self._item_counts
+            case ListChangeTypes.ExtendChange():
+                keys = {canonical_key(item) for item in change.items}
+                return len(keys) == len(change.items) and self._item_counts.keys().isdisjoint(keys)
+            case ListChangeTypes.SetChange():
+                return len({canonical_key(item) for item in change.value}) == len(change.value)
+        return True
+
+    def _count_items(self, change:Change, new_value):
+        match change:
+            case ListChangeTypes.InsertChange():
+                self._item_counts[canonical_key(change.item)] += 1
+            case ListChangeTypes.ExtendChange():
+                self._item_counts.update(canonical_key(item) for item in change.items)
+            case ListChangeTypes.PopChange():
+                self._uncount(change.item)
+            case ListChangeTypes.PopRangeChange():
+                for item in change.items:
+                    self._uncount(item)
+            case _:
+                self._item_counts = collections.Counter(canonical_key(item) for item in new_value)
+
+    def _uncount(self, item):
+        key = canonical_key(item)
+        self._item_counts[key] -= 1
+        if self._item_counts[key] <= 0:
+            del self._item_counts[key]
+
+    def get(self):
+        return copy.deepcopy(self._as_list(self._value))
+
+    @staticmethod
+    def _as_list(value):
+        return value.to_list() if isinstance(value, BlockList) else value
+
+    def _validate_change_and_get_result(self,change:Change):
+        current = self._value
+        use_block_list = isinstance(current, BlockList)
+        if use_block_list and isinstance(change, ListChangeTypes.SetChange):
+            # SetChange works on lists
+            self._value = current.to_list()
+        try:
+            result = super()._validate_change_and_get_result(change)
+        except InvalidChangeError:
+            if isinstance(change, ListChangeTypes.SetChange):
+                self._value = current
+            raise
+        if use_block_list and not isinstance(result, BlockList):
+            result = BlockList(result, self._index_items)
+        return result
+
+    def apply_change(self, change:Change):
+        old_value, new_value = super().apply_change(change)
+        if self._item_counts is not None:
+            self._count_items(change, new_value)
+        return old_value, new_value
 
     def merge_changes(self, changes: List[Change]):
         stack: collections.deque[Change] = collections.deque()
@@ -474,6 +1175,17 @@ class ListTopic(Topic):
         change = ListChangeTypes.PopChange(self._name,position)
         self.apply_change_external(change)  
 
+    def extend(self, items:Iterable, position:int=-1):
+        '''
+        Insert many items before the position in one change. The default position -1 appends them.
+        '''
+        change = ListChangeTypes.ExtendChange(self._name,list(items),position)
+        self.apply_change_external(change)
+
+    def pop_range(self, position:int, count:int):
+        change = ListChangeTypes.PopRangeChange(self._name,position,count)
+        self.apply_change_external(change)
+
     def remove(self, item):
         position = self._value.index(item)
         change = ListChangeTypes.PopChange(self._name,position)
@@ -496,7 +1208,8 @@ class ListTopic(Topic):
         self.pop(position)
     
     def notify_listeners(self,auto:bool,change:Change, old_value:list, new_value:list):
-        super().notify_listeners(auto,change,old_value,new_value)
+        if self.on_set.num_callbacks or self.on_set2.num_callbacks:
+            super().notify_listeners(auto,change,self._as_list(old_value),self._as_list(new_value))
         match change:
             case ListChangeTypes.SetChange():
                 # pop all and insert all
@@ -508,19 +1221,246 @@ class ListTopic(Topic):
                 self.on_insert.invoke(auto,change.item,change.position)
             case ListChangeTypes.PopChange():
                 self.on_pop.invoke(auto,change.item,change.position)
+            case ListChangeTypes.ExtendChange():
+                for i,item in enumerate(change.items):
+                    self.on_insert.invoke(auto,item,change.position + i)
+            case ListChangeTypes.PopRangeChange():
+                for i,item in reversed(list(enumerate(change.items))):
+                    self.on_pop.invoke(auto,item,change.position + i)
             case _:
                 raise Exception(f'Unsupported change type {type(change)} for {self.__class__.__name__}')
 
+    def serialize_additional(self):
+        return {'use_block_list': self.is_blocked_list_enabled(), 'index_items': self._index_items}
+
+    def restore_additional(self, data):
+        if data is not None and data.get('use_block_list', False):
+            self.enable_blocked_list(data.get('index_items', False))
+
+class LogTopic(Topic):
+    '''
+    Append-only log, such as the history of a chat room. Only the newest max_entries entries are kept, and a subscribing
+    client only receives the newest init_size entries. Every entry has a sequence number. Older entries that are still
+    kept can be fetched with get_page(), which clients call through the `_topicsync/log_page` service.
+    '''
+    DEFAULT_MAX_ENTRIES = 10000
+    DEFAULT_INIT_SIZE = 100
+
+    def __init__(self,name,state_machine:StateMachine,is_stateful:bool=True,init_value=None,order_strict=True):
+        super().__init__(name,state_machine,is_stateful,init_value,order_strict)
+        self.add_pre_validator(set_type_validator(list))
+        self.on_append = Action()
+        """args:
+        - item: the appended entry
+        - seq: the sequence number of the entry
+        """
+        self.on_pop = Action()
+        self._max_entries: int|None = self.DEFAULT_MAX_ENTRIES
+        self._init_size = self.DEFAULT_INIT_SIZE
+        self._value = LogBuffer(self._value, 0, self._max_entries)
+
+    def set_capacity(self, max_entries: int|None):
+        '''
+        Set the number of entries kept on the server. None means unlimited. Older entries are dropped.
+        '''
+        self._max_entries = max_entries
+        self._value.set_max_entries(max_entries)
+        self._revision += 1
+
+    def set_init_size(self, init_size: int):
+        '''
+        Set the number of newest entries sent to a client when it subscribes.
+        '''
+        self._init_size = init_size
+        self._revision += 1
+
+    def get(self):
+        return copy.deepcopy(self._value.to_list())
+
+    def get_first_seq(self):
+        '''
+        The sequence number of the oldest kept entry.
+        '''
+        return self._value.first_seq
+
+    def get_next_seq(self):
+        '''
+        The sequence number the next appended entry will get.
+        '''
+        return self._value.next_seq
+
+    def get_init_message(self):
+        page = self.get_page(None, self._init_size)
+        return {"topic_name": self.get_name(), "value": page['items'], "first_seq": page['first_seq']}
+
+    def get_page(self, before_seq: int|None = None, count: int|None = None):
+        '''
+        Get at most count entries right before the entry before_seq (or the newest entries if before_seq is None).
+        Returns the entries and the sequence number of the first one.
+        '''
+        if before_seq is None:
+            before_seq = self._value.next_seq
+        if count is None:
+            count = self._init_size
+        start_seq = min(max(before_seq - count, self._value.first_seq), before_seq)
+        return {'items': copy.deepcopy(self._value.page(start_seq, before_seq)), 'first_seq': start_seq}
+
+    def _validate_change_and_get_result(self,change:Change):
+        current = self._value
+        if isinstance(change, LogChangeTypes.SetChange):
+            if self._max_entries is not None and isinstance(change.value, list) and len(change.value) > self._max_entries:
+                # Clients get only the entries the server keeps
+                change.value = change.value[len(change.value) - self._max_entries:]
+            if isinstance(current, LogBuffer):
+                # SetChange works on lists
+                self._value = current.to_list()
+        try:
+            result = super()._validate_change_and_get_result(change)
+        except InvalidChangeError:
+            if isinstance(change, LogChangeTypes.SetChange):
+                self._value = current
+            raise
+        if not isinstance(result, LogBuffer):
+            # The new entries keep the sequence numbers of the replaced ones, which clients still count from
+            result = LogBuffer(result, current.first_seq if isinstance(current, LogBuffer) else 0, self._max_entries)
+        return result
+
+    def merge_changes(self, changes: List[Change]):
+        merged: List[Change] = []
+        for change in changes:
+            if isinstance(change, LogChangeTypes.SetChange):
+                # Overwrite all previous changes
+                merged = [change]
+            elif isinstance(change, LogChangeTypes.AppendChange) and merged and isinstance(merged[-1], LogChangeTypes.AppendChange):
+                # Batch consecutive appends. Create a new change since the old one is kept in the history.
+                merged[-1] = LogChangeTypes.AppendChange(self._name, merged[-1].items + change.items, change.id)
+            else:
+                merged.append(change)
+        return merged
+
+    def set(self, value):
+        if value == self._value:
+            return
+        change = LogChangeTypes.SetChange(self._name,value)
+        self.apply_change_external(change)
+
+    def append(self, item):
+        change = LogChangeTypes.AppendChange(self._name,[item])
+        self.apply_change_external(change)
+
+    def extend(self, items):
+        change = LogChangeTypes.AppendChange(self._name,list(items))
+        self.apply_change_external(change)
+
+    def pop(self, count:int=1):
+        change = LogChangeTypes.PopChange(self._name,count)
+        self.apply_change_external(change)
+
+    def __len__(self):
+        return len(self._value)
+
+    def __iter__(self):
+        return self._value.__iter__()
+
+    def notify_listeners(self,auto:bool,change:Change, old_value, new_value):
+        if self.on_set.num_callbacks or self.on_set2.num_callbacks:
+            super().notify_listeners(auto,change,list(old_value),list(new_value))
+        match change:
+            case LogChangeTypes.SetChange():
+                # pop all and append all
+                old_first_seq = old_value.first_seq if isinstance(old_value, LogBuffer) else 0
+                for i,item in reversed(list(enumerate(old_value))):
+                    self.on_pop.invoke(auto,item,old_first_seq + i)
+                for i,item in enumerate(new_value):
+                    self.on_append.invoke(auto,item,new_value.first_seq + i)
+            case LogChangeTypes.AppendChange():
+                first_seq = new_value.next_seq - len(change.items)
+                for i,item in enumerate(change.items):
+                    self.on_append.invoke(auto,item,first_seq + i)
+            case LogChangeTypes.PopChange():
+                for i,item in reversed(list(enumerate(change.items))):
+                    self.on_pop.invoke(auto,item,new_value.next_seq + i)
+            case _:
+                raise Exception(f'Unsupported change type {type(change)} for {self.__class__.__name__}')
+
+    def serialize_additional(self):
+        return {'first_seq': self._value.first_seq, 'max_entries': self._max_entries, 'init_size': self._init_size}
+
+    def restore_additional(self, data):
+        if data is None:
+            return
+        self._max_entries = data['max_entries']
+        self._init_size = data['init_size']
+        self._value = LogBuffer(self._value, data['first_seq'], self._max_entries)
+
 class DictTopic(Topic):
     def __init__(self,name,state_machine:StateMachine,is_stateful:bool=True,init_value=None,order_strict=True):
         super().__init__(name,state_machine,is_stateful,init_value,order_strict)
-        self.add_validator(type_validator(dict))
+        self.add_pre_validator(set_type_validator(dict))
         self.on_set = Action()
         self.on_set2 = Action()
         self.on_add = Action()
         self.on_remove = Action()
         self.on_change_value = Action()
-    
+        self._indexes: Dict[str, DictIndex] = {}
+
+    _VALUE_INDEX = '_value'
+
+    def enable_value_index(self):
+        '''
+        Index the keys by their values, so remove() finds the key in O(1) instead of scanning the dict.
+        '''
+        self.add_index(self._VALUE_INDEX, lambda value: value)
+
+    def add_index(self, name: str, key: str | Callable[[Any], Any]):
+        '''
+        Add a secondary index, which can be queried with find(). key is the name of a field of the values, or a function
+        computing the indexed value from a value. The index is kept up to date on every change.
+        '''
+        index = DictIndex(key)
+        index.rebuild(self._value)
+        self._indexes[name] = index
+
+    def find(self, index_name: str, value) -> List:
+        '''
+        Get the keys whose indexed value equals value.
+        '''
+        return self._indexes[index_name].find(value)
+
+    def apply_change(self, change:Change):
+        old_value, new_value = super().apply_change(change)
+        if self._indexes:
+            self._update_indexes(change, new_value)
+        return old_value, new_value
+
+    def _update_indexes(self, change:Change, new_value:dict):
+        for index in self._indexes.values():
+            match change:
+                case DictChangeTypes.SetChange():
+                    index.rebuild(new_value)
+                case DictChangeTypes.AddChange() | DictChangeTypes.ChangeValueChange():
+                    index.set(change.key, change.value)
+                case DictChangeTypes.PopChange():
+                    index.discard(change.key)
+                case DictChangeTypes.UpdateChange():
+                    for key in change.pop_keys:
+                        index.discard(key)
+                    for key, value in change.values.items():
+                        index.set(key, value)
+                case PathSetChange() | PathInsertChange() | PathRemoveChange():
+                    tokens = json_pointer.split(change.path)
+                    if not tokens:
+                        index.rebuild(new_value)
+                    elif tokens[0] in new_value:
+                        index.set(tokens[0], new_value[tokens[0]])
+                    else:
+                        index.discard(tokens[0])
+                case _:
+                    index.rebuild(new_value)
+
+    def merge_changes(self, changes: List[Change]):
+        return merge_path_changes(changes)
+
     def set(self, value):
         if value == self._value:
             return
@@ -532,8 +1472,16 @@ class DictTopic(Topic):
         self.apply_change_external(change)
 
     def remove(self, value):
-        self._value:Dict
-        key = list(self._value.keys())[list(self._value.values()).index(value)]
+        '''
+        Remove an entry with the value. Raise ValueError if there is none.
+        '''
+        value_index = self._indexes.get(self._VALUE_INDEX)
+        if value_index is not None:
+            key = next(iter(value_index.find(value)), None)
+        else:
+            key = next((key for key, item in self._value.items() if item == value), None)
+        if key is None:
+            raise ValueError(f'{value!r} is not in topic {self._name}')
         change = DictChangeTypes.PopChange(self._name,key)
         self.apply_change_external(change)
 
@@ -547,6 +1495,32 @@ class DictTopic(Topic):
         change = DictChangeTypes.ChangeValueChange(self._name,key,value)
         self.apply_change_external(change)
 
+    def update(self, values:dict|None=None, pop_keys:Iterable=()):
+        '''
+        Add or change the values of many keys, and pop many keys, in one change.
+        '''
+        change = DictChangeTypes.UpdateChange(self._name,dict(values) if values is not None else {},list(pop_keys))
+        self.apply_change_external(change)
+
+    def get_path(self, path: str|List):
+        return copy.deepcopy(json_pointer.get(self._value, _to_tokens(path)))
+
+    def set_path(self, path: str|List, value):
+        '''
+        Set the value at a JSON pointer path like "/entity1/position/x", or a list of tokens like ['entity1', 'position', 'x'].
+        Unlike change_value, only the changed part is sent and recorded.
+        '''
+        change = DictChangeTypes.PathSetChange(self._name,_to_pointer(path),value)
+        self.apply_change_external(change)
+
+    def insert_path(self, path: str|List, value):
+        change = DictChangeTypes.PathInsertChange(self._name,_to_pointer(path),value)
+        self.apply_change_external(change)
+
+    def remove_path(self, path: str|List):
+        change = DictChangeTypes.PathRemoveChange(self._name,_to_pointer(path))
+        self.apply_change_external(change)
+
     def __getitem__(self, key):
         return self._value[key]
     
@@ -563,27 +1537,73 @@ class DictTopic(Topic):
         super().notify_listeners(auto,change,old_value,new_value)
         match change:
             case DictChangeTypes.SetChange():
-                old_keys = set(old_value.keys())
-                new_keys = set(new_value.keys())
-                removed_keys = old_keys - new_keys
-                added_keys = new_keys - old_keys
-                remained_keys = old_keys & new_keys
-                for key in removed_keys:
-                    self.on_remove.invoke(auto,key)
-                for key in added_keys:
-                    self.on_add.invoke(auto,key,new_value[key])
-                for key in remained_keys:
-                    if old_value[key] != new_value[key]:
-                        self.on_change_value.invoke(auto,key,new_value[key])
+                self._notify_set(auto,old_value,new_value)
             case DictChangeTypes.AddChange():
                 self.on_add.invoke(auto,change.key,change.value)
             case DictChangeTypes.PopChange():
                 self.on_remove.invoke(auto,change.key)
             case DictChangeTypes.ChangeValueChange():
                 self.on_change_value.invoke(auto,change.key,change.value)
+            case DictChangeTypes.UpdateChange():
+                for key in change.pop_keys:
+                    self.on_remove.invoke(auto,key)
+                for key, value in change.values.items():
+                    if key in change.old_values:
+                        self.on_change_value.invoke(auto,key,value)
+                    else:
+                        self.on_add.invoke(auto,key,value)
+            case PathSetChange() | PathInsertChange() | PathRemoveChange():
+                tokens = json_pointer.split(change.path)
+                if not tokens:
+                    self._notify_set(auto,old_value,new_value)
+                elif len(tokens) > 1 or (isinstance(change, PathSetChange) and change.existed):
+                    self.on_change_value.invoke(auto,tokens[0],new_value[tokens[0]])
+                elif isinstance(change, PathRemoveChange):
+                    self.on_remove.invoke(auto,tokens[0])
+                else:
+                    self.on_add.invoke(auto,tokens[0],new_value[tokens[0]])
             case _:
                 raise Exception(f'Unsupported change type {type(change)} for {self.__class__.__name__}')
+
+    def _notify_set(self,auto:bool,old_value:dict,new_value:dict):
+        old_keys = set(old_value.keys())
+        new_keys = set(new_value.keys())
+        removed_keys = old_keys - new_keys
+        added_keys = new_keys - old_keys
+        remained_keys = old_keys & new_keys
+        for key in removed_keys:
+            self.on_remove.invoke(auto,key)
+        for key in added_keys:
+            self.on_add.invoke(auto,key,new_value[key])
+        for key in remained_keys:
+            if old_value[key] != new_value[key]:
+                self.on_change_value.invoke(auto,key,new_value[key])
  
+def _to_pointer(path: str|List) -> str:
+    return path if isinstance(path, str) else json_pointer.join(path)
+
+def _to_tokens(path: str|List) -> List[str]:
+    return json_pointer.split(path) if isinstance(path, str) else [str(token) for token in path]
+
+def merge_path_changes(changes: List[Change]) -> List[Change]:
+    '''
+    Merge changes of a topic that supports path changes. A SetChange overwrites all previous changes. A PathSetChange
+    overwrites the previous PathSetChanges at or under its path, as long as only PathSetChanges are in between, because
+    they never move list items.
+    '''
+    merged: List[Change] = []
+    for change in changes:
+        if isinstance(change, SetChange):
+            merged = []
+        elif isinstance(change, PathSetChange):
+            tokens = json_pointer.split(change.path)
+            start = len(merged)
+            while start > 0 and isinstance(merged[start - 1], PathSetChange):
+                start -= 1
+            merged[start:] = [previous for previous in merged[start:] if not json_pointer.is_prefix(tokens, json_pointer.split(previous.path))]
+        merged.append(change)
+    return merged
+
 def merge_dicts(*dicts:dict):
     '''
     The order of the dicts is important. The last dict will override the previous ones.
@@ -646,5 +1666,8 @@ all_topic_types = {
     'set': SetTopic,
     'dict': DictTopic,
     'list': ListTopic,
+    'log': LogTopic,
+    'counter': CounterTopic,
+    'array': ArrayTopic,
     'event': EventTopic
 }
\ No newline at end of file
@@ -1,7 +1,9 @@
 import asyncio
 import json
+import threading
 from typing import Any, Callable, Dict, List, Optional, Tuple
 import typing
+from topicsync import post_commit
 
 class EventWithData(asyncio.Event):
     def __init__(self):
@@ -44,7 +46,9 @@ class Action:
         self._auto_callbacks:List[Callable] = []
         self._manual_callbacks:List[Callable] = []
         self._raw_callbacks:List[Callable] = []
+        self._post_commit_callbacks:List[Tuple[Callable,bool]] = []
         self.num_callbacks = 0
+        self._owner = None # the topic of the action, set when the topic is added to a state machine
 
     def __add__(self,callback:Callable):
         '''
@@ -79,6 +83,17 @@ class Action:
         self._raw_callbacks.append(callback)
         self.num_callbacks += 1
 
+    def add_post_commit(self,callback:Callable,batch:bool=False):
+        '''
+        Add a callback that is called after the transition commits, by the PostCommitDispatcher of the state machine.
+        It gets copies of the arguments, since the values may change before it runs. Coroutine functions are supported.
+        With batch, it is called once per transition with a list of the (args, kwargs) of each call.
+        The topic's own value is not copied: the topic copies it before its next change instead (see Topic._share_value).
+        '''
+        self._post_commit_callbacks.append((callback,batch))
+        self.num_callbacks += 1
+        self._count_post_commit_callbacks(1)
+
     def remove(self,callback:Callable):
         if callback in self._manual_callbacks:
             self._manual_callbacks.remove(callback)
@@ -86,6 +101,9 @@ class Action:
             self._auto_callbacks.remove(callback)
         elif callback in self._raw_callbacks:
             self._raw_callbacks.remove(callback)
+        elif callback in [c for c,_ in self._post_commit_callbacks]:
+            self._post_commit_callbacks = [(c,batch) for c,batch in self._post_commit_callbacks if c != callback]
+            self._count_post_commit_callbacks(-1)
         else:
             raise ValueError("Callback not found")
         self.num_callbacks -= 1
@@ -98,8 +116,29 @@ class Action:
             returns.append(callback(*args,**kwargs))
         for callback in self._raw_callbacks:
             returns.append(callback(auto,*args,**kwargs))
+        if self._post_commit_callbacks and not auto:
+            # Once per change, since listeners of manual mode are notified in every phase
+            self._queue_post_commit(args,kwargs)
         return returns
 
+    def _count_post_commit_callbacks(self,delta:int):
+        if self._owner is not None and self._owner._state_machine is not None:
+            self._owner._state_machine._post_commit_callback_count += delta
+
+    def _queue_post_commit(self,args:tuple,kwargs:dict):
+        args = tuple(post_commit.snapshot(arg,self._owner) for arg in args)
+        kwargs = {key:post_commit.snapshot(value,self._owner) for key,value in kwargs.items()}
+        queue = post_commit.pending.queue
+        calls = queue if queue is not None else []
+        for callback,batch in self._post_commit_callbacks:
+            calls.append((callback,batch,args,kwargs))
+        if queue is None:
+            # Not in a transition of a state machine counting the callback
+            if self._owner is not None and self._owner._state_machine is not None:
+                self._owner._state_machine._post_commit_dispatcher.dispatch(calls)
+            else:
+                post_commit.default_dispatcher.dispatch(calls)
+
 import weakref
 _KT = typing.TypeVar("_KT") #  key type
 _VT = typing.TypeVar("_VT") #  value type
@@ -122,6 +161,17 @@ class WeakKeyDict(weakref.WeakValueDictionary[_KT, _VT]):
         self._remove = new_remove
 
     
+def canonical_key(item) -> typing.Hashable:
+    '''
+    A hashable key of a JSON-like item, such that equal items have equal keys.
+    Hashable items are their own key. Lists and dicts are keyed by their canonical JSON.
+    '''
+    try:
+        hash(item)
+        return item
+    except TypeError:
+        return ('_json', json.dumps(item, sort_keys=True))
+
 def camel_to_snake(name):
     return ''.join(['_'+c.lower() if c.isupper() else c for c in name]).lstrip('_')
 
@@ -136,14 +186,36 @@ class IdGenerator:
     instance = None
     @staticmethod
     def generate_id():
+        return render_id(IdGenerator.generate_number())
+    @staticmethod
+    def generate_number():
+        '''
+        The compact form of a new server id. render_id() turns it into the string sent on the wire.
+        '''
         if IdGenerator.instance is None:
             IdGenerator.instance = IdGenerator()
         return IdGenerator.instance()
     def __init__(self):
         self._id = 0
+        self._lock = threading.Lock() # transitions may run in parallel threads
     def __call__(self):
-        self._id += 1
-        return '0_'+str(self._id) # 0 means server
+        with self._lock:
+            self._id += 1
+            return self._id
+
+def compact_id(id):
+    '''
+    Server ids ('0_' + number, 0 means server) are kept as the number. Other ids, like the ones generated by clients, are kept as strings.
+    '''
+    if isinstance(id,str) and id.startswith('0_') and id[2:].isascii() and id[2:].isdigit() and id[2] != '0':
+        return int(id[2:])
+    return id
+
+def render_id(id):
+    '''
+    The wire form of an id kept by compact_id().
+    '''
+    return f'0_{id}' if isinstance(id,int) else id
 
 class SimpleAction:
     '''
@@ -0,0 +1,82 @@
+import array
+import unittest
+from topicsync.state_machine.state_machine import StateMachine
+from topicsync.topic import ArrayTopic
+from topicsync.change import ArrayChangeTypes, Change, InvalidChangeError
+from topicsync import HistoryManager, numeric_array
+
+class TestArrayTopic(unittest.TestCase):
+    def test_changes(self):
+        changes_list = []
+        machine = StateMachine(changes_callback=lambda changes,_:changes_list.append(changes))
+        a = machine.add_topic('a', ArrayTopic, init_value=[0.0] * 6)
+        updates = []
+        a.on_update += lambda start, stop: updates.append((start, stop))
+
+        a.set_slice(1, [1.5, 2.5])
+        a.add_range(2, 5, 1)
+        a.add_slice(4, [0.25, 0.5])
+        self.assertEqual(a.to_list(), [0.0, 1.5, 3.5, 1.0, 1.25, 0.5])
+        self.assertEqual(updates, [(1, 3), (2, 5), (4, 6)])
+        self.assertEqual(a.get_dtype(), 'float64')
+
+        serialized = changes_list[0][0].serialize()
+        self.assertEqual(serialized['data'], numeric_array.encode_data(array.array('d', [1.5, 2.5])))
+        self.assertEqual(Change.deserialize(serialized), changes_list[0][0])
+
+        with self.assertRaises(InvalidChangeError):
+            a.set_slice(5, [1.0, 2.0])
+        with self.assertRaises(InvalidChangeError):
+            a.add_range(-1, 2, 1)
+        self.assertEqual(a.to_list(), [0.0, 1.5, 3.5, 1.0, 1.25, 0.5])
+
+    def test_int_dtype(self):
+        machine = StateMachine()
+        a = machine.add_topic('a', ArrayTopic, init_value={'dtype': 'uint8', 'data': ''})
+        a.set([1, 2, 255])
+        self.assertEqual(a.get(), {'dtype': 'uint8', 'data': 'AQL/'})
+        with self.assertRaises(InvalidChangeError):
+            a.add_range(0, 3, 1) # 255 + 1 overflows
+        self.assertEqual(a.to_list(), [1, 2, 255])
+        a.add_range(0, 2, 3)
+        self.assertEqual(a.to_list(), [4, 5, 255])
+        with self.assertRaises(InvalidChangeError):
+            a.apply_change(ArrayChangeTypes.SetChange('a', {'dtype': 'complex', 'data': ''}))
+        self.assertEqual(a.to_list(), [4, 5, 255])
+
+    def test_merge_changes(self):
+        machine = StateMachine()
+        a = machine.add_topic('a', ArrayTopic, init_value=[0.0] * 10)
+        data = lambda values: numeric_array.encode_data(array.array('d', values))
+        changes = [
+            ArrayChangeTypes.SetSliceChange('a', 2, data([1, 1, 1])),
+            ArrayChangeTypes.SetSliceChange('a', 4, data([2, 2])),
+            ArrayChangeTypes.SetSliceChange('a', 0, data([3, 3])),
+            ArrayChangeTypes.SetSliceChange('a', 9, data([4])),
+            ArrayChangeTypes.AddRangeChange('a', 0, 3, 1),
+            ArrayChangeTypes.AddRangeChange('a', 0, 3, 2),
+        ]
+        merged = a.merge_changes(changes)
+        self.assertEqual(len(merged), 3)
+        self.assertEqual((merged[0].start, numeric_array.decode_data(merged[0].data, 'd').tolist()), (0, [3, 3, 1, 1, 2, 2]))
+        self.assertEqual(merged[0].id, changes[2].id)
+        self.assertIs(merged[1], changes[3])
+        self.assertEqual(merged[2].value, 3)
+
+    def test_undo_redo(self):
+        history = HistoryManager()
+        machine = StateMachine(transition_callback=history.add_transition)
+        history.set_server(machine)
+        a = machine.add_topic('a', ArrayTopic, init_value=[0.1, 0.2, 0.3])
+        a.add_slice(0, [0.7, 0.7])
+        a.set([1.0])
+        a.set_slice(0, [2.0])
+        history.undo()
+        history.undo()
+        self.assertEqual(a.to_list(), [0.1 + 0.7, 0.2 + 0.7, 0.3])
+        history.undo()
+        self.assertEqual(a.to_list(), [0.1, 0.2, 0.3])
+        history.redo()
+        history.redo()
+        history.redo()
+        self.assertEqual(a.to_list(), [2.0])
@@ -81,4 +81,65 @@ class TestChangeDeserialize(unittest.TestCase):
         
     def test_dict_change_value(self):
         change = DictChangeTypes.ChangeValueChange('topic', 'k', 'v10', 'v')
-        self._test_deserializable(change)
\ No newline at end of file
+        self._test_deserializable(change)
+
+    def test_dict_path_set(self):
+        change = DictChangeTypes.PathSetChange('topic', '/k/0/x', {'y': 1})
+        self._test_deserializable(change)
+
+    def test_dict_path_insert(self):
+        change = DictChangeTypes.PathInsertChange('topic', '/k/-', 2)
+        self._test_deserializable(change)
+
+    def test_generic_path_remove(self):
+        change = GenericChangeTypes.PathRemoveChange('topic', '/a~1b')
+        self._test_deserializable(change)
+
+    def test_list_extend(self):
+        change = ListChangeTypes.ExtendChange('topic', [1, 2], 3)
+        self._test_deserializable(change)
+
+    def test_list_pop_range(self):
+        change = ListChangeTypes.PopRangeChange('topic', 3, 2)
+        self._test_deserializable(change)
+
+    def test_dict_update(self):
+        change = DictChangeTypes.UpdateChange('topic', {'k': 'v'}, ['p'])
+        self._test_deserializable(change)
+
+    def test_set_update(self):
+        change = SetChangeTypes.UpdateChange('topic', [1], [[2]])
+        self._test_deserializable(change)
+
+    def test_compact_ids(self):
+        change = StringChangeTypes.InsertChange('topic', '0_12', 0, 'a', id='0_34')
+        self.assertEqual((change._id, change._topic_version), (34, 12))
+        self.assertEqual(change.serialize()['id'], '0_34')
+        self.assertEqual(change.serialize()['topic_version'], '0_12')
+        for client_id in ('3_34', '0_034', '0_'):
+            self.assertEqual(IntChangeTypes.AddChange('topic', 1, client_id).serialize()['id'], client_id)
+        self._test_deserializable(change)
+
+    def test_no_instance_dict(self):
+        for change_types in type_name_to_change_types.values():
+            for change_class in change_types.types.values():
+                self.assertEqual(change_class.__dictoffset__, 0, change_class.__qualname__)
+
+    def test_serialize_is_memoized_until_applied(self):
+        from topicsync.state_machine.state_machine import StateMachine
+        from topicsync.topic import ListTopic
+        machine = StateMachine()
+        machine.add_topic('topic', ListTopic, init_value=[1, 2])
+        change = ListChangeTypes.InsertChange('topic', 3, -1)
+        self.assertIs(change.serialize(), change.serialize())
+        self.assertEqual(change.serialize()['position'], -1)
+        machine.apply_change(change)
+        self.assertEqual(change.serialize()['position'], 2)
+        change.id = '5_1'
+        self.assertEqual(change.serialize()['id'], '5_1')
+
+    def test_deserialize_defaults(self):
+        change = Change.deserialize({'topic_name': 'topic', 'topic_type': 'event', 'type': 'emit'})
+        self.assertEqual(change.args, {})
+        with self.assertRaises(KeyError):
+            Change.deserialize({'topic_type': 'list', 'type': 'pop', 'position': 0})
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import threading
+import unittest
+from topicsync.change import GenericChangeTypes
+from topicsync.server.client_manager import Client, ClientManager
+from topicsync.state_machine.state_machine import StateMachine
+from topicsync.topic import DictTopic, GenericTopic, IntTopic
+
+class TestGroupCommit(unittest.TestCase):
+    def _manager(self, group_commit):
+        machine = StateMachine()
+        machine.add_topic('_topicsync/topic_list', DictTopic)
+        manager = ClientManager(machine, group_commit)
+        machine._changes_callback = manager.send_update_or_buffer
+        a = machine.add_topic('a', IntTopic)
+        b = machine.add_topic('b', IntTopic)
+        clients = []
+        for client_id, topics in ((1, ['a']), (2, ['a', 'b'])):
+            clients.append(manager._clients.setdefault(client_id, Client(client_id, None, manager._sending_queue)))
+            for topic_name in topics:
+                manager._subscriptions[topic_name].add(client_id)
+        return manager, clients, a, b
+
+    def _sent(self, manager, group):
+        messages = []
+        while not manager._sending_queue.empty():
+            messages.append(manager._sending_queue.get_nowait())
+        if group:
+            messages = manager._group_updates(messages)
+        return [(client.id, json.loads(message)) for client, message in messages]
+
+    def test_updates_are_batched_per_client(self):
+        manager, clients, a, b = self._manager(True)
+        with manager._state_machine.record(action_id='x'):
+            a.add(1)
+        b.add(2)
+        clients[1].send('reject', reason='r')
+        a.add(3)
+        sent = self._sent(manager, True)
+
+        self.assertEqual([(client_id, message['type']) for client_id, message in sent], [(2, 'update_batch'), (2, 'reject'), (1, 'update_batch'), (2, 'update')])
+        self.assertEqual([(update['action_id'], len(update['changes'])) for update in sent[0][1]['args']['updates']], [('x', 1), ('', 1)])
+        self.assertEqual([update['changes'][0]['value'] for update in sent[2][1]['args']['updates']], [1, 3])
+        self.assertEqual(sent[3][1]['args']['changes'][0]['value'], 3)
+
+    def test_subscribe_doesnt_block_the_loop(self):
+        manager, clients, a, b = self._manager(False)
+        locked, release = threading.Event(), threading.Event()
+        def transition():
+            with manager._state_machine.domain_lock_of('b'):
+                locked.set()
+                release.wait()
+        thread = threading.Thread(target=transition)
+        thread.start()
+        locked.wait()
+
+        async def main():
+            subscribing = asyncio.get_running_loop().create_task(manager._handle_subscribe(clients[0], 'b'))
+            await asyncio.sleep(0.01)
+            self.assertNotIn(1, manager._subscriptions['b'])
+            release.set()
+            await subscribing
+        asyncio.run(main())
+        thread.join()
+        self.assertIn(1, manager._subscriptions['b'])
+        self.assertEqual([message['type'] for _, message in self._sent(manager, False)], ['init'])
+
+    def test_without_group_commit(self):
+        manager, clients, a, b = self._manager(False)
+        a.add(1)
+        a.add(3)
+        self.assertEqual([(client_id, message['type']) for client_id, message in self._sent(manager, False)], [(1, 'update'), (2, 'update')] * 2)
+
+
+class TestEphemeral(unittest.TestCase):
+    def test_publish(self):
+        transitions = []
+        machine = StateMachine(transition_callback=transitions.append)
+        machine.add_topic('_topicsync/topic_list', DictTopic)
+        manager = ClientManager(machine)
+        machine._changes_callback = manager.send_update_or_buffer
+        cursor = machine.add_topic('cursor', GenericTopic, is_stateful=False)
+        a = machine.add_topic('a', IntTopic)
+        cursor.on_set.add_auto(lambda value: a.set(value))
+        client = manager._clients.setdefault(1, Client(1, None, manager._sending_queue))
+        manager._subscriptions['cursor'].add(1)
+        manager.set_rate_limit('cursor', 0.05)
+
+        async def main():
+            for i in range(1, 4):
+                machine.publish(GenericChangeTypes.SetChange('cursor', i), f'p{i}')
+            await asyncio.sleep(0.1)
+        asyncio.run(main())
+
+        sent = []
+        while not manager._sending_queue.empty():
+            sent.append(json.loads(manager._sending_queue.get_nowait()[1])['args'])
+        self.assertEqual([(args['action_id'], [change['value'] for change in args['changes']]) for args in sent],
+                         [('p1', [1]), ('p2', []), ('p3', [3])])
+        # only the changes of the listener are recorded
+        self.assertEqual(len(transitions), 3)
+        self.assertEqual(a.get(), 3)
+        with self.assertRaises(ValueError):
+            machine.publish(GenericChangeTypes.SetChange('a', 1))
+
+    def test_listeners_run_in_a_transition(self):
+        transitions, updates = [], []
+        machine = StateMachine(changes_callback=lambda changes, action_id: updates.append((action_id, [change.topic_name for change in changes])),
+                               transition_callback=transitions.append)
+        cursor = machine.add_topic('cursor', GenericTopic, is_stateful=False)
+        a = machine.add_topic('a', IntTopic)
+        def on_set(value):
+            a.add(1)
+            if value < 0:
+                raise ValueError()
+            a.add(1)
+        cursor.on_set.add_auto(on_set)
+
+        machine.publish(GenericChangeTypes.SetChange('cursor', 1), 'p1', 7)
+        self.assertEqual(updates, [('p1', ['cursor']), ('p1', ['a', 'a'])])
+        self.assertEqual([transition.action_source for transition in transitions], [7])
+        self.assertEqual(a.get(), 2)
+
+        # the changes of the listeners are rolled back together
+        with self.assertRaises(ValueError):
+            machine.publish(GenericChangeTypes.SetChange('cursor', -1), 'p2', 7)
+        self.assertEqual(a.get(), 2)
+        self.assertEqual(len(transitions), 1)
+
+    def test_subscribe_flushes_rate_limit(self):
+        machine = StateMachine()
+        machine.add_topic('_topicsync/topic_list', DictTopic)
+        manager = ClientManager(machine)
+        machine._changes_callback = manager.send_update_or_buffer
+        cursor = machine.add_topic('cursor', GenericTopic, is_stateful=False)
+        clients = [manager._clients.setdefault(client_id, Client(client_id, None, manager._sending_queue)) for client_id in (1, 2)]
+        manager._subscriptions['cursor'].add(1)
+        manager.set_rate_limit('cursor', 0.05)
+
+        async def main():
+            for i in range(1, 3):
+                machine.publish(GenericChangeTypes.SetChange('cursor', i), f'p{i}')
+            manager._handle_subscribe(clients[1], 'cursor')
+            await asyncio.sleep(0.1)
+        asyncio.run(main())
+
+        sent = []
+        while not manager._sending_queue.empty():
+            client, message = manager._sending_queue.get_nowait()
+            sent.append((client.id, json.loads(message)['type']))
+        # the held back change is sent before the new subscriber gets the value, and not again after
+        self.assertEqual(sent, [(1, 'update'), (1, 'update'), (2, 'init')])
+
+class TestIngressCoalescing(unittest.TestCase):
+    def test_superseded_sets_are_dropped(self):
+        machine = StateMachine()
+        machine.add_topic('_topicsync/topic_list', DictTopic)
+        manager = ClientManager(machine)
+        machine.add_topic_s('slider', 'int', order_strict=False)
+        machine.add_topic('strict', IntTopic)
+        handled = []
+        manager.register_message_handler('action', lambda sender, commands, action_id: handled.append(action_id))
+        manager.register_message_handler('other', lambda sender: handled.append('other'))
+
+        def action(action_id, topic_name, value):
+            return json.dumps({'type': 'action', 'args': {'action_id': action_id, 'commands': [
+                {'topic_name': topic_name, 'topic_type': 'int', 'type': 'set', 'value': value}]}})
+        class Comm:
+            async def messages(self):
+                for message in [action('a1', 'slider', 1), action('a2', 'slider', 2), action('a3', 'strict', 1), action('a4', 'strict', 2),
+                                action('a5', 'slider', 3), json.dumps({'type': 'other', 'args': {}}), action('a6', 'slider', 4)]:
+                    yield message
+            async def send(self, message):
+                pass
+        asyncio.run(manager.handle_client(Comm()))
+
+        self.assertEqual(handled, ['a3', 'a4', 'a5', 'other', 'a6'])
+        acks = []
+        while not manager._sending_queue.empty():
+            acks.append(json.loads(manager._sending_queue.get_nowait()[1])['args'])
+        self.assertEqual(acks, [{'changes': [], 'action_id': 'a1'}, {'changes': [], 'action_id': 'a2'}])
+
+    def test_dropped_actions_when_the_last_is_rejected(self):
+        machine = StateMachine()
+        machine.add_topic('_topicsync/topic_list', DictTopic)
+        manager = ClientManager(machine)
+        machine.add_topic_s('slider', 'int', order_strict=False)
+        handled = []
+        def handle_action(sender, commands, action_id):
+            handled.append(action_id)
+            if commands[0]['value'] > 2:
+                return 'too large'
+        manager.register_message_handler('action', handle_action)
+
+        class Comm:
+            async def messages(self):
+                for value in range(1, 5):
+                    yield json.dumps({'type': 'action', 'args': {'action_id': f'a{value}', 'commands': [
+                        {'topic_name': 'slider', 'topic_type': 'int', 'type': 'set', 'value': value}]}})
+            async def send(self, message):
+                pass
+        asyncio.run(manager.handle_client(Comm()))
+
+        # the latest dropped action is handled in place of the rejected ones
+        self.assertEqual(handled, ['a4', 'a3', 'a2'])
+        acks = []
+        while not manager._sending_queue.empty():
+            acks.append(json.loads(manager._sending_queue.get_nowait()[1])['args']['action_id'])
+        self.assertEqual(acks, ['a1'])
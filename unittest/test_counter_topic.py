@@ -0,0 +1,47 @@
+import unittest
+from topicsync.state_machine.state_machine import StateMachine
+from topicsync.topic import CounterTopic, DictTopic
+from topicsync.change import CounterChangeTypes
+from topicsync.server.update_buffer import UpdateBuffer
+from topicsync import HistoryManager
+
+class TestCounterTopic(unittest.TestCase):
+    def test_updates_are_summed_per_flush(self):
+        sent = []
+        machine = StateMachine(changes_callback=lambda changes, action_id: buffer.add_changes(changes, action_id))
+        machine.add_topic('_topicsync/topic_list', DictTopic)
+        buffer = UpdateBuffer(machine, lambda changes, action_id: sent.append((changes, action_id)))
+        votes = machine.add_topic_s('votes', 'counter', order_strict=True)
+        self.assertFalse(votes.is_order_strict())
+
+        for _ in range(100):
+            votes.add()
+        votes.add(-3)
+        self.assertEqual(votes.get(), 97)
+        self.assertTrue(all(changes == [] for changes, _ in sent))
+
+        buffer.flush()
+        changes, action_id = sent[-1]
+        self.assertEqual(action_id, 'clock')
+        self.assertEqual(changes, [CounterChangeTypes.AddChange('votes', 97, changes[0].id)])
+
+    def test_merge_changes(self):
+        machine = StateMachine()
+        votes = machine.add_topic('votes', CounterTopic)
+        changes = [CounterChangeTypes.AddChange('votes', 2), CounterChangeTypes.SetChange('votes', 10, 2), CounterChangeTypes.AddChange('votes', 5)]
+        self.assertEqual(votes.merge_changes(changes), [CounterChangeTypes.SetChange('votes', 15, 2, changes[-1].id)])
+        self.assertEqual(votes.merge_changes([]), [])
+
+    def test_undo_one_contribution(self):
+        history = HistoryManager()
+        machine = StateMachine(transition_callback=history.add_transition)
+        history.set_server(machine)
+        votes = machine.add_topic('votes', CounterTopic)
+        votes.add(1)
+        votes.add(10)
+        votes.add(100)
+        history.undo()
+        history.undo()
+        self.assertEqual(votes.get(), 1)
+        history.redo()
+        self.assertEqual(votes.get(), 11)
@@ -0,0 +1,90 @@
+import unittest
+from topicsync.server.server import TopicsyncServer
+from topicsync.state_machine.state_machine import StateMachine
+from topicsync.topic import DerivedTopic, IntTopic, ListTopic
+from topicsync.change import GenericChangeTypes, InvalidChangeError
+
+class TestDerivedTopic(unittest.TestCase):
+    def _machine(self):
+        changes_list = []
+        machine = StateMachine(changes_callback=lambda changes,_:changes_list.append([change.topic_name for change in changes]))
+        a = machine.add_topic('a', IntTopic)
+        b = machine.add_topic('b', ListTopic)
+        return machine, changes_list, a, b
+
+    def test_lazy(self):
+        machine, changes_list, a, b = self._machine()
+        calls = []
+        def compute(a, b):
+            calls.append((a, b))
+            return a + len(b)
+        derived = machine.add_topic('d', DerivedTopic)
+        derived.set_compute(compute, ['a', b])
+        a.add(1)
+        b.insert(5)
+        self.assertEqual(calls, [])
+        self.assertEqual(derived.get(), 2)
+        self.assertEqual(derived.get(), 2)
+        self.assertEqual(calls, [(1, [5])])
+        self.assertEqual(changes_list, [['a'], ['b']])
+        with self.assertRaises(InvalidChangeError):
+            derived.set(3)
+        with self.assertRaises(InvalidChangeError):
+            machine.apply_change(GenericChangeTypes.SetChange('d', 3))
+
+    def test_observed(self):
+        machine, changes_list, a, b = self._machine()
+        calls = []
+        def compute(get):
+            calls.append(None)
+            return get(a) if get('a') < 10 else get(b)
+        derived = DerivedTopic('d', machine, compute=compute)
+        machine.register_topic(derived)
+        twice = machine.add_topic('twice', DerivedTopic)
+        twice.set_compute(lambda value: value * 2, [derived])
+        derived.set_observed(True)
+        twice.set_observed(True)
+        self.assertEqual(len(calls), 1)
+
+        with machine.record():
+            a.add(1)
+            a.add(2)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(changes_list[-1], ['a', 'a', 'd', 'twice'])
+        self.assertEqual(twice.get(), 6)
+
+        # b is not a dependency until a >= 10
+        b.insert(1)
+        self.assertEqual(len(calls), 2)
+        a.add(10)
+        self.assertEqual(derived.get(), [1])
+        b.insert(2)
+        self.assertEqual(changes_list[-1], ['b', 'd', 'twice'])
+        self.assertEqual(twice.get(), [1, 2, 1, 2])
+
+        # rolled back changes refresh it again
+        with self.assertRaises(ValueError):
+            with machine.record():
+                b.insert(3)
+                derived.get()
+                raise ValueError()
+        self.assertEqual(changes_list[-1], ['b', 'b'])
+        self.assertEqual(derived.get(), [1, 2])
+
+        # still observed by twice
+        derived.set_observed(False)
+        a.add(-20)
+        self.assertEqual(changes_list[-1], ['a', 'd', 'twice'])
+        self.assertEqual(twice.get(), -14)
+        twice.set_observed(False)
+        a.add(1)
+        self.assertEqual(changes_list[-1], ['a'])
+        self.assertEqual(twice.get(), -12)
+
+    def test_server_reuses_the_name(self):
+        server = TopicsyncServer()
+        a = server.add_topic('a', IntTopic)
+        server.add_derived_topic('b', lambda a: a * 2, [a])
+        server.remove_topic('b')
+        b = server.add_topic('b', IntTopic)
+        self.assertIsInstance(b, IntTopic)
@@ -0,0 +1,172 @@
+import unittest
+from topicsync.state_machine.state_machine import StateMachine
+from topicsync.topic import DictTopic, GenericTopic
+from topicsync.change import DictChangeTypes, InvalidChangeError
+from topicsync import HistoryManager
+
+class TestDictIndex(unittest.TestCase):
+    def test_remove_by_value(self):
+        for use_index in (False, True):
+            machine = StateMachine()
+            a = machine.add_topic('a', DictTopic, init_value={'x': 1, 'y': [2], 'z': 1})
+            if use_index:
+                a.enable_value_index()
+            a.remove([2])
+            a.remove(1)
+            self.assertEqual(a.get(), {'z': 1})
+            with self.assertRaises(ValueError):
+                a.remove(3)
+
+    def test_indexes_follow_changes(self):
+        history = HistoryManager()
+        machine = StateMachine(transition_callback=history.add_transition)
+        history.set_server(machine)
+        sessions = machine.add_topic('sessions', DictTopic, init_value={'s1': {'user': 'alice'}})
+        sessions.enable_value_index()
+        sessions.add_index('by_user', 'user')
+        sessions.add_index('by_name_length', lambda value: len(value['user']) if isinstance(value, dict) else None)
+
+        sessions.add('s2', {'user': 'bob'})
+        sessions.add('s3', {'user': 'alice'})
+        sessions.add('s4', 'not a dict')
+        self.assertEqual(sessions.find('by_user', 'alice'), ['s1', 's3'])
+        self.assertEqual(sessions.find('by_name_length', 3), ['s2'])
+
+        sessions.change_value('s1', {'user': 'carol'})
+        self.assertEqual(sessions.find('by_user', 'alice'), ['s3'])
+        self.assertEqual(sessions.find('by_user', 'carol'), ['s1'])
+
+        sessions.remove({'user': 'alice'})
+        sessions.remove('not a dict')
+        self.assertEqual(sessions.find('by_user', 'alice'), [])
+
+        sessions.set({'s5': {'user': 'bob'}})
+        self.assertEqual(sessions.find('by_user', 'bob'), ['s5'])
+        self.assertEqual(sessions.find('by_user', 'carol'), [])
+
+        history.undo()
+        history.undo()
+        history.undo()
+        self.assertEqual(sessions.find('by_user', 'alice'), ['s3'])
+        self.assertEqual(sessions.find('by_user', 'bob'), ['s2'])
+        self.assertEqual(sessions.find('_value', {'user': 'carol'}), ['s1'])
+
+class TestPathChanges(unittest.TestCase):
+    def test_path_changes(self):
+        history = HistoryManager()
+        changes_list = []
+        machine = StateMachine(changes_callback=lambda changes,_:changes_list.append(changes), transition_callback=history.add_transition)
+        history.set_server(machine)
+        entities = machine.add_topic('entities', DictTopic, init_value={'e1': {'pos': {'x': 1, 'y': 2}, 'tags': ['a']}})
+        events = []
+        entities.on_add += lambda key, value: events.append(('add', key))
+        entities.on_remove += lambda key: events.append(('remove', key))
+        entities.on_change_value += lambda key, value: events.append(('change_value', key))
+        before = entities['e1']
+
+        entities.set_path('/e1/pos/x', 5)
+        entities.insert_path(['e1', 'tags', '-'], 'b')
+        entities.remove_path('/e1/tags/0')
+        entities.set_path('/e2', {'pos': None})
+        entities.remove_path('/e2')
+        self.assertEqual(entities.get(), {'e1': {'pos': {'x': 5, 'y': 2}, 'tags': ['b']}})
+        self.assertEqual(entities.get_path('/e1/pos'), {'x': 5, 'y': 2})
+        self.assertEqual(changes_list[0][0].serialize(), {'topic_name': 'entities', 'topic_type': 'dict', 'type': 'path_set', 'path': '/e1/pos/x', 'value': 5, 'id': changes_list[0][0].id})
+        self.assertEqual(changes_list[1][0].path, '/e1/tags/1')
+        self.assertEqual(events, [('change_value', 'e1')] * 3 + [('add', 'e2'), ('remove', 'e2')])
+        # nested values are copied along the path instead of mutated
+        self.assertEqual(before, {'pos': {'x': 1, 'y': 2}, 'tags': ['a']})
+
+        with self.assertRaises(InvalidChangeError):
+            entities.set_path('/e1/missing/x', 1)
+        with self.assertRaises(InvalidChangeError):
+            entities.remove_path('/e1/tags/3')
+
+        for _ in range(5):
+            history.undo()
+        self.assertEqual(entities.get(), {'e1': {'pos': {'x': 1, 'y': 2}, 'tags': ['a']}})
+        for _ in range(5):
+            history.redo()
+        self.assertEqual(entities.get(), {'e1': {'pos': {'x': 5, 'y': 2}, 'tags': ['b']}})
+
+    def test_generic_topic(self):
+        machine = StateMachine()
+        a = machine.add_topic('a', GenericTopic, init_value=[{'x': 0}])
+        a.set_path('/0/x', 1)
+        a.insert_path('/0', 'first')
+        self.assertEqual(a.get(), ['first', {'x': 1}])
+        a.set_path('', {'new': True})
+        a.set_path('/new', False)
+        self.assertEqual(a.get(), {'new': False})
+
+    def test_merge_changes(self):
+        machine = StateMachine()
+        a = machine.add_topic('a', DictTopic, init_value={'e': {'x': 0, 'l': []}})
+        changes = [
+            DictChangeTypes.PathSetChange('a', '/e/x', 1),
+            DictChangeTypes.PathSetChange('a', '/e/y', 1),
+            DictChangeTypes.PathSetChange('a', '/e/x', 2),
+            DictChangeTypes.PathInsertChange('a', '/e/l/0', 1),
+            DictChangeTypes.PathSetChange('a', '/e/y', 2),
+            DictChangeTypes.PathSetChange('a', '/e/l/0', 5),
+            DictChangeTypes.PathSetChange('a', '/e/l', []),
+        ]
+        merged = a.merge_changes(changes)
+        self.assertEqual(merged, [changes[1], changes[2], changes[3], changes[4], changes[6]])
+        merged = a.merge_changes(changes + [DictChangeTypes.SetChange('a', {})])
+        self.assertEqual(len(merged), 1)
+
+class TestDictUpdate(unittest.TestCase):
+    def test_update(self):
+        history = HistoryManager()
+        machine = StateMachine(transition_callback=history.add_transition)
+        history.set_server(machine)
+        a = machine.add_topic('a', DictTopic, init_value={'x': 1, 'y': 2, 'z': 3})
+        a.add_index('by_value', lambda value: value)
+        events = []
+        a.on_add += lambda key, value: events.append(('add', key, value))
+        a.on_remove += lambda key: events.append(('remove', key))
+        a.on_change_value += lambda key, value: events.append(('change_value', key, value))
+
+        a.update({'x': 10, 'w': 4}, pop_keys=['y'])
+        self.assertEqual(a.get(), {'x': 10, 'z': 3, 'w': 4})
+        self.assertEqual(events, [('remove', 'y'), ('change_value', 'x', 10), ('add', 'w', 4)])
+        self.assertEqual(a.find('by_value', 10), ['x'])
+        self.assertEqual(a.find('by_value', 2), [])
+        with self.assertRaises(InvalidChangeError):
+            a.update(pop_keys=['y'])
+        with self.assertRaises(InvalidChangeError):
+            a.update({'x': 0}, pop_keys=['x'])
+
+        history.undo()
+        self.assertEqual(a.get(), {'x': 1, 'y': 2, 'z': 3})
+        self.assertEqual(a.find('by_value', 2), ['y'])
+        history.redo()
+        self.assertEqual(a.get(), {'x': 10, 'z': 3, 'w': 4})
+
+class TestSetChangeSharing(unittest.TestCase):
+    def test_snapshots_are_not_modified(self):
+        history = HistoryManager()
+        changes_list = []
+        machine = StateMachine(changes_callback=lambda changes,_:changes_list.append(changes), transition_callback=history.add_transition)
+        history.set_server(machine)
+        a = machine.add_topic('a', DictTopic, init_value={'x': {'y': 1}})
+        value = {'x': {'y': 2}}
+        a.set(value)
+        value['x']['y'] = 3
+        set_change = changes_list[-1][0]
+        self.assertIs(a._value, set_change.value)
+
+        a.add('z', 0)
+        a.set_path('/x/y', 4)
+        a.change_value('z', 1)
+        self.assertEqual(set_change.value, {'x': {'y': 2}})
+        self.assertEqual(a.get(), {'x': {'y': 4}, 'z': 1})
+
+        for _ in range(4):
+            history.undo()
+        self.assertEqual(a.get(), {'x': {'y': 1}})
+        history.redo()
+        a.pop('x')
+        self.assertEqual(set_change.value, {'x': {'y': 2}})
+        self.assertEqual(set_change.inverse().value, {'x': {'y': 1}})
@@ -0,0 +1,91 @@
+import unittest
+from topicsync.state_machine.state_machine import StateMachine
+from topicsync.topic import DictTopic, IntTopic, ListTopic, StringTopic
+from topicsync import HistoryManager
+
+class TestHistoryManager(unittest.TestCase):
+    def _machine(self, history):
+        machine = StateMachine(transition_callback=history.add_transition)
+        history.set_server(machine)
+        return machine
+
+    def test_max_transitions(self):
+        history = HistoryManager(max_transitions=2)
+        a = self._machine(history).add_topic('a', IntTopic)
+        for _ in range(5):
+            a.add(1)
+        for _ in range(5):
+            history.undo()
+        self.assertEqual(a.get(), 3)
+        history.redo()
+        a.add(10)
+        history.redo()
+        self.assertEqual(a.get(), 14)
+
+    def test_max_bytes(self):
+        history = HistoryManager(max_bytes=300)
+        a = self._machine(history).add_topic('a', StringTopic)
+        for _ in range(10):
+            a.set('x' * 100)
+            a.set('')
+        for _ in range(10):
+            history.undo()
+        self.assertEqual(a.get(), 'x' * 100)
+
+    def test_merge(self):
+        history = HistoryManager(merge_interval=60)
+        machine = self._machine(history)
+        a = machine.add_topic('a', StringTopic)
+        b = machine.add_topic('b', IntTopic)
+        for char in 'hello':
+            a.insert(len(a.get()), char)
+        b.add(1)
+        a.insert(5, '!')
+        history.undo()
+        self.assertEqual(a.get(), 'hello')
+        history.undo()
+        history.undo()
+        self.assertEqual((a.get(), b.get()), ('', 0))
+        history.redo()
+        a.insert(5, '?')
+        a.insert(6, '?')
+        history.undo()
+        self.assertEqual(a.get(), 'hello')
+
+    def test_per_source(self):
+        history = HistoryManager(per_source=True)
+        machine = self._machine(history)
+        a = machine.add_topic('a', ListTopic)
+        for source in (1, 2, 1):
+            with machine.record(action_source=source):
+                a.insert(source)
+        history.undo(1)
+        self.assertEqual(a.get(), [1, 2])
+        history.undo(2)
+        self.assertEqual(a.get(), [1])
+        history.redo(2)
+        self.assertEqual(a.get(), [1, 2])
+
+        history.discard_source(2)
+        history.undo(2)
+        self.assertEqual(a.get(), [1, 2])
+        self.assertNotIn(2, history._histories)
+
+    def test_spill_to_disk(self):
+        history = HistoryManager(max_transitions=1, spill_to_disk=True)
+        machine = self._machine(history)
+        a = machine.add_topic('a', DictTopic)
+        b = machine.add_topic('b', ListTopic, init_value=[0])
+        for i in range(5):
+            a.add(str(i), {'x': i})
+            b.pop()
+            b.insert(i)
+        self.assertIsNotNone(history._histories[None].spill_file)
+        for _ in range(15):
+            history.undo()
+        self.assertEqual((a.get(), b.get()), ({}, [0]))
+        self.assertIsNone(history._histories[None].spill_file)
+        for _ in range(15):
+            history.redo()
+        self.assertEqual(b.get(), [4])
+        self.assertEqual(a.get()['4'], {'x': 4})
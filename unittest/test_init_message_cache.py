@@ -0,0 +1,76 @@
+import json
+import unittest
+from topicsync.server.client_manager import ClientManager
+from topicsync.server.init_message_cache import InitMessageCache
+from topicsync.state_machine.state_machine import StateMachine
+from topicsync.topic import DictTopic, ListTopic, StringTopic
+from topicsync.utils import make_message
+
+class TestInitMessageCache(unittest.TestCase):
+    def _counting_cache(self, max_entries=256):
+        calls = []
+        def encode(*args, **kwargs):
+            calls.append(kwargs['topic_name'])
+            return make_message(*args, **kwargs)
+        return InitMessageCache(encode, max_entries), calls
+
+    def test_reuse_until_changed(self):
+        machine = StateMachine()
+        a = machine.add_topic('a', ListTopic, init_value=[1, 2])
+        cache, calls = self._counting_cache()
+
+        first = cache.get(a)
+        self.assertIs(cache.get(a), first)
+        self.assertEqual(calls, ['a'])
+        self.assertEqual(json.loads(first), {'type': 'init', 'args': {'topic_name': 'a', 'value': [1, 2]}})
+
+        a.insert(3)
+        second = cache.get(a)
+        self.assertEqual(calls, ['a', 'a'])
+        self.assertEqual(json.loads(second)['args']['value'], [1, 2, 3])
+
+    def test_string_topic_version(self):
+        machine = StateMachine()
+        a = machine.add_topic('a', StringTopic, init_value='abc')
+        cache, calls = self._counting_cache()
+
+        cache.get(a)
+        a.insert(3, 'd')
+        message = json.loads(cache.get(a))['args']
+        self.assertEqual(message['value'], 'abcd')
+        self.assertEqual(message['id'], a.version)
+
+    def test_recreated_topic(self):
+        machine = StateMachine()
+        a = machine.add_topic('a', StringTopic, init_value='old')
+        cache, calls = self._counting_cache()
+        cache.get(a)
+
+        machine.remove_topic('a')
+        a = machine.add_topic('a', StringTopic, init_value='new')
+        self.assertEqual(json.loads(cache.get(a))['args']['value'], 'new')
+
+    def test_lru_eviction(self):
+        machine = StateMachine()
+        topics = [machine.add_topic(name, StringTopic) for name in 'abc']
+        cache, calls = self._counting_cache(max_entries=2)
+
+        cache.get(topics[0])
+        cache.get(topics[1])
+        cache.get(topics[0])
+        cache.get(topics[2]) # evicts b
+        self.assertEqual(len(cache), 2)
+
+        cache.get(topics[0])
+        cache.get(topics[1])
+        self.assertEqual(calls, ['a', 'b', 'c', 'b'])
+
+    def test_discarded_on_topic_removal(self):
+        machine = StateMachine()
+        topic_list = machine.add_topic('_topicsync/topic_list', DictTopic)
+        manager = ClientManager(machine)
+        topic_list.add('a', {})
+        a = machine.add_topic('a', StringTopic)
+        manager._init_message_cache.get(a)
+        topic_list.pop('a')
+        self.assertEqual(len(manager._init_message_cache), 0)
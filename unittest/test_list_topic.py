@@ -0,0 +1,160 @@
+import random
+import unittest
+from topicsync.state_machine.state_machine import StateMachine
+from topicsync.topic import ListTopic
+from topicsync.block_list import BlockList
+from topicsync.change import InvalidChangeError
+from topicsync import HistoryManager
+
+class TestBlockList(unittest.TestCase):
+    def test_random_edits(self):
+        random.seed(0)
+        for index_items in (False, True):
+            expected = list(range(1500))
+            blocks = BlockList(expected, index_items)
+            for _ in range(3000):
+                if expected and random.random() < 0.45:
+                    position = random.randrange(-len(expected), len(expected))
+                    self.assertEqual(blocks.pop(position), expected.pop(position))
+                else:
+                    position = random.randrange(-len(expected) - 2, len(expected) + 3)
+                    item = random.randrange(100)
+                    blocks.insert(position, item)
+                    expected.insert(position, item)
+            self.assertEqual(blocks, expected)
+            self.assertEqual(len(blocks), len(expected))
+            for item in range(100):
+                self.assertEqual(item in blocks, item in expected)
+                if item in expected:
+                    self.assertEqual(blocks.index(item), expected.index(item))
+            for position in range(-len(expected), len(expected), 37):
+                self.assertEqual(blocks[position], expected[position])
+
+    def test_errors(self):
+        blocks = BlockList([{'a': 1}], index_items=True)
+        self.assertEqual(blocks.index({'a': 1}), 0)
+        with self.assertRaises(ValueError):
+            blocks.index({'a': 2})
+        blocks.pop()
+        with self.assertRaises(IndexError):
+            blocks.pop()
+        self.assertEqual(blocks, [])
+
+class TestListTopic(unittest.TestCase):
+    def test_blocked_list(self):
+        machine = StateMachine()
+        a = machine.add_topic('a', ListTopic, init_value=[1, 2, 3])
+        a.enable_blocked_list(index_items=True)
+        events = []
+        a.on_insert += lambda item, position: events.append(('insert', item, position))
+        a.on_pop += lambda item, position: events.append(('pop', item, position))
+
+        a.insert(0, 0)
+        a.insert(4)
+        a.remove(2)
+        self.assertEqual(a.get(), [0, 1, 3, 4])
+        self.assertEqual(a[1], 1)
+        self.assertEqual(events, [('insert', 0, 0), ('insert', 4, 4), ('pop', 2, 2)])
+
+        a.set([5, 6])
+        self.assertTrue(a.is_blocked_list_enabled())
+        a.pop(0)
+        self.assertEqual(a.get(), [6])
+        with self.assertRaises(InvalidChangeError):
+            a.set(1)
+        self.assertTrue(a.is_blocked_list_enabled())
+
+    def test_serialize(self):
+        machine = StateMachine()
+        a = machine.add_topic('a', ListTopic, init_value=['x', 'y'])
+        a.enable_blocked_list()
+        data = a.serialize()
+        self.assertEqual(data['basic'][1], ['x', 'y'])
+
+        restored = ListTopic.deserialize(data, machine)
+        self.assertTrue(restored.is_blocked_list_enabled())
+        self.assertEqual(restored.get(), ['x', 'y'])
+
+    def test_undo_redo(self):
+        history = HistoryManager()
+        machine = StateMachine(transition_callback=history.add_transition)
+        history.set_server(machine)
+        a = machine.add_topic('a', ListTopic, init_value=[1])
+        a.enable_blocked_list()
+        a.insert(2)
+        a.set([5])
+        a.pop()
+        history.undo()
+        self.assertEqual(a.get(), [5])
+        history.undo()
+        self.assertEqual(a.get(), [1, 2])
+        history.undo()
+        self.assertEqual(a.get(), [1])
+        history.redo()
+        history.redo()
+        history.redo()
+        self.assertEqual(a.get(), [])
+
+class TestBulkListChanges(unittest.TestCase):
+    def test_extend_and_pop_range(self):
+        for blocked in (False, True):
+            history = HistoryManager()
+            machine = StateMachine(transition_callback=history.add_transition)
+            history.set_server(machine)
+            a = machine.add_topic('a', ListTopic, init_value=[1, 2])
+            if blocked:
+                a.enable_blocked_list()
+            events = []
+            a.on_insert += lambda item, position: events.append(('insert', item, position))
+            a.on_pop += lambda item, position: events.append(('pop', item, position))
+
+            a.extend([3, 4])
+            a.extend(['a', 'b'], 1)
+            a.pop_range(2, 3)
+            self.assertEqual(a.get(), [1, 'a', 4])
+            self.assertEqual(events, [('insert', 3, 2), ('insert', 4, 3), ('insert', 'a', 1), ('insert', 'b', 2),
+                                      ('pop', 3, 4), ('pop', 2, 3), ('pop', 'b', 2)])
+            with self.assertRaises(InvalidChangeError):
+                a.pop_range(1, 3)
+
+            history.undo()
+            self.assertEqual(a.get(), [1, 'a', 'b', 2, 3, 4])
+            history.undo()
+            history.undo()
+            self.assertEqual(a.get(), [1, 2])
+            history.redo()
+            self.assertEqual(a.get(), [1, 2, 3, 4])
+
+    def test_unique_validator_runs_once(self):
+        machine = StateMachine()
+        a = machine.add_topic('a', ListTopic, init_value=[1])
+        a.add_validator(ListTopic.unique_validator)
+        with self.assertRaises(InvalidChangeError):
+            a.extend([2, 1])
+        self.assertEqual(a.get(), [1])
+
+    def test_unique_items(self):
+        history = HistoryManager()
+        machine = StateMachine(transition_callback=history.add_transition)
+        history.set_server(machine)
+        a = machine.add_topic('a', ListTopic, init_value=[1, [2]])
+        a.enable_blocked_list()
+        a.add_validator(ListTopic.unique_validator)
+        for edit in (lambda: a.insert([2]), lambda: a.extend([3, 3]), lambda: a.set([4, 4])):
+            with self.assertRaises(InvalidChangeError):
+                edit()
+        self.assertEqual(a.get(), [1, [2]])
+        self.assertTrue(a.is_blocked_list_enabled())
+
+        a.pop(1)
+        a.insert([2])
+        a.pop_range(0, 2)
+        a.extend([1, 2])
+        a.set([5])
+        a.insert(1)
+        history.undo()
+        history.undo()
+        a.insert(5)
+        with self.assertRaises(InvalidChangeError):
+            a.insert(1)
+        self.assertEqual(a.get(), [1, 2, 5])
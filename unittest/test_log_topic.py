@@ -0,0 +1,100 @@
+import unittest
+from topicsync.state_machine.state_machine import StateMachine
+from topicsync.topic import LogTopic
+from topicsync.change import Change, InvalidChangeError, LogChangeTypes
+from topicsync import HistoryManager
+
+class TestLogTopic(unittest.TestCase):
+    def test_capacity_and_pages(self):
+        machine = StateMachine()
+        a = machine.add_topic('a', LogTopic)
+        a.set_capacity(1000)
+        a.set_init_size(10)
+        a.extend(range(1500))
+        a.append(1500)
+        self.assertEqual(len(a), 1000)
+        self.assertEqual(a.get_first_seq(), 501)
+        self.assertEqual(a.get_next_seq(), 1501)
+
+        init = a.get_init_message()
+        self.assertEqual(init['value'], list(range(1491, 1501)))
+        self.assertEqual(init['first_seq'], 1491)
+
+        self.assertEqual(a.get_page(1491, 5), {'items': [1486, 1487, 1488, 1489, 1490], 'first_seq': 1486})
+        self.assertEqual(a.get_page(503, 5), {'items': [501, 502], 'first_seq': 501})
+        self.assertEqual(a.get_page(100, 5), {'items': [], 'first_seq': 100})
+
+        with self.assertRaises(InvalidChangeError):
+            a.set(1)
+        self.assertEqual((len(a), a.get_first_seq()), (1000, 501))
+
+    def test_listeners(self):
+        machine = StateMachine()
+        a = machine.add_topic('a', LogTopic, init_value=['x'])
+        events = []
+        a.on_append += lambda item, seq: events.append(('append', item, seq))
+        a.on_pop += lambda item, seq: events.append(('pop', item, seq))
+        a.extend(['y', 'z'])
+        a.pop(2)
+        self.assertEqual(events, [('append', 'y', 1), ('append', 'z', 2), ('pop', 'z', 2), ('pop', 'y', 1)])
+        with self.assertRaises(InvalidChangeError):
+            a.pop(2)
+        self.assertEqual(a.get(), ['x'])
+
+    def test_merge_changes(self):
+        machine = StateMachine()
+        a = machine.add_topic('a', LogTopic)
+        changes = [LogChangeTypes.AppendChange('a', [1]), LogChangeTypes.AppendChange('a', [2, 3]), LogChangeTypes.PopChange('a', 1), LogChangeTypes.AppendChange('a', [4])]
+        merged = a.merge_changes(changes)
+        self.assertEqual([change.serialize()['type'] for change in merged], ['append', 'pop', 'append'])
+        self.assertEqual(merged[0].items, [1, 2, 3])
+        self.assertEqual(merged[0].id, changes[1].id)
+        self.assertEqual(changes[0].items, [1])
+
+        merged = a.merge_changes(changes + [LogChangeTypes.SetChange('a', [5]), LogChangeTypes.AppendChange('a', [6])])
+        self.assertEqual([change.serialize()['type'] for change in merged], ['set', 'append'])
+
+    def test_set(self):
+        changes_list = []
+        machine = StateMachine(changes_callback=lambda changes,_:changes_list.append(changes))
+        a = machine.add_topic('a', LogTopic)
+        a.set_capacity(3)
+        a.extend(range(5))
+        a.set([10, 11, 12, 13])
+        self.assertEqual(changes_list[-1][0].serialize()['value'], [11, 12, 13])
+        self.assertEqual(a.get(), [11, 12, 13])
+        self.assertEqual((a.get_first_seq(), a.get_next_seq()), (2, 5))
+
+    def test_serialize(self):
+        machine = StateMachine()
+        a = machine.add_topic('a', LogTopic)
+        a.set_capacity(3)
+        a.extend(range(5))
+        restored = StateMachine().restore_topic('log', a.serialize())
+        self.assertEqual(restored.get(), [2, 3, 4])
+        self.assertEqual(restored.get_first_seq(), 2)
+        restored.append(5)
+        self.assertEqual(restored.get(), [3, 4, 5])
+        self.assertEqual(restored.get_first_seq(), 3)
+
+        change = Change.deserialize(LogChangeTypes.AppendChange('a', [1]).serialize())
+        self.assertIsInstance(change, LogChangeTypes.AppendChange)
+
+    def test_undo_redo(self):
+        history = HistoryManager()
+        machine = StateMachine(transition_callback=history.add_transition)
+        history.set_server(machine)
+        a = machine.add_topic('a', LogTopic, init_value=[1])
+        a.append(2)
+        a.set([5])
+        a.pop()
+        history.undo()
+        self.assertEqual(a.get(), [5])
+        history.undo()
+        self.assertEqual(a.get(), [1, 2])
+        history.undo()
+        self.assertEqual(a.get(), [1])
+        history.redo()
+        history.redo()
+        history.redo()
+        self.assertEqual(a.get(), [])
@@ -0,0 +1,108 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import unittest
+from topicsync.post_commit import PostCommitDispatcher
+from topicsync.state_machine.state_machine import StateMachine
+from topicsync.topic import DictTopic, EventTopic, IntTopic, ListTopic
+
+class TestPostCommit(unittest.TestCase):
+    def test_after_commit(self):
+        machine = StateMachine()
+        a = machine.add_topic('a', DictTopic)
+        b = machine.add_topic('b', IntTopic)
+        calls = []
+        a.on_add.add_post_commit(lambda key, value: calls.append((key, value)))
+        b.on_set.add_post_commit(calls.append, batch=True)
+
+        value = {'x': 1}
+        with machine.record():
+            a.add('k', value)
+            b.add(1)
+            b.add(2)
+            self.assertEqual(calls, [])
+        value['x'] = 2
+        self.assertEqual(calls, [('k', {'x': 1}), [((1,), {}), ((3,), {})]])
+
+        with self.assertRaises(ValueError):
+            with machine.record():
+                a.add('k2', 0)
+                raise ValueError()
+        self.assertEqual(len(calls), 2)
+
+        b.on_set.remove(calls.append)
+        b.add(1)
+        self.assertEqual(len(calls), 2)
+
+    def test_executor_keeps_order(self):
+        executor = ThreadPoolExecutor(4)
+        machine = StateMachine(post_commit_dispatcher=PostCommitDispatcher(executor=executor))
+        a = machine.add_topic('a', IntTopic)
+        values = []
+        a.on_set.add_post_commit(values.append)
+        for _ in range(200):
+            a.add(1)
+        executor.shutdown(wait=True)
+        self.assertEqual(values, list(range(1, 201)))
+
+    def test_coroutine(self):
+        async def main():
+            machine = StateMachine(post_commit_dispatcher=PostCommitDispatcher(loop=asyncio.get_running_loop()))
+            a = machine.add_topic('a', IntTopic)
+            values = []
+            async def on_set(value):
+                await asyncio.sleep(0)
+                values.append(value)
+            a.on_set.add_post_commit(on_set)
+            a.add(1)
+            a.add(2)
+            self.assertEqual(values, [])
+            for _ in range(10):
+                await asyncio.sleep(0)
+            return values
+        self.assertEqual(asyncio.run(main()), [1, 3])
+
+    def test_outside_transition(self):
+        async def main():
+            machine = StateMachine()
+            event = machine.add_topic('event', EventTopic, is_stateful=False)
+            emitted = []
+            async def on_emit(**args):
+                await asyncio.sleep(0)
+                emitted.append(args)
+            event.on_emit.add_post_commit(on_emit)
+            event.emit(x=1)
+            for _ in range(10):
+                await asyncio.sleep(0)
+            return emitted
+        self.assertEqual(asyncio.run(main()), [{'x': 1}])
+
+    def test_topic_value_is_not_copied(self):
+        machine = StateMachine()
+        a = machine.add_topic('a', ListTopic)
+        values = []
+        a.on_set.add_post_commit(values.append)
+        a.set([1, 2])
+        self.assertIs(values[0], a._value)
+        a.insert(3)
+        self.assertEqual(values[0], [1, 2])
+        self.assertEqual(values[1], [1, 2, 3])
+
+    def test_callbacks_are_counted_per_machine(self):
+        machine, other = StateMachine(), StateMachine()
+        a = machine.add_topic('a', IntTopic)
+        a.on_set.add_post_commit(print)
+        self.assertEqual(machine._post_commit_callback_count, 1)
+        self.assertEqual(other._post_commit_callback_count, 0)
+        machine.remove_topic('a')
+        self.assertEqual(machine._post_commit_callback_count, 0)
+
+    def test_publish(self):
+        machine = StateMachine()
+        a = machine.add_topic('a', DictTopic, is_stateful=False)
+        b = machine.add_topic('b', IntTopic)
+        batches = []
+        a.on_add.add_post_commit(batches.append, batch=True)
+        a.on_set.add_auto(lambda value: b.add(1))
+        a.set({'x': 1, 'y': 2})
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(sorted(batches[0], key=lambda call: call[0]), [(('x', 1), {}), (('y', 2), {})])
@@ -0,0 +1,84 @@
+import random
+import unittest
+from topicsync.rope import Rope
+from topicsync.state_machine.state_machine import StateMachine
+from topicsync.topic import StringTopic
+from topicsync.change import StringChangeTypes, InvalidChangeError
+
+class TestRope(unittest.TestCase):
+    def test_random_edits(self):
+        random.seed(0)
+        text = 'hello world' * 100
+        rope = Rope(text)
+        for _ in range(2000):
+            pos = random.randint(0, len(text))
+            if random.random() < 0.5:
+                insertion = random.choice(['a', 'bc', 'def' * 300])
+                rope.insert(pos, insertion)
+                text = text[:pos] + insertion + text[pos:]
+            else:
+                deletion = text[pos:pos + random.randint(0, 700)]
+                rope.delete(pos, deletion)
+                text = text[:pos] + text[pos + len(deletion):]
+            self.assertEqual(len(rope), len(text))
+        self.assertEqual(str(rope), text)
+        self.assertEqual(rope.substring(100, 1000), text[100:1000])
+
+    def test_delete_mismatch(self):
+        rope = Rope('abcdef')
+        with self.assertRaises(ValueError):
+            rope.delete(2, 'cx')
+        self.assertEqual(str(rope), 'abcdef')
+
+class TestRopeStringTopic(unittest.TestCase):
+    def test_insert_delete(self):
+        topic = StringTopic('test', None, init_value='abcd')
+        topic.enable_rope()
+        topic.apply_change(StringChangeTypes.InsertChange('test', topic.version, 2, 'xy'))
+        topic.apply_change(StringChangeTypes.DeleteChange('test', topic.version, 0, 'ab'))
+        self.assertEqual(topic.get(), 'xycd')
+        self.assertTrue(topic.is_rope_enabled())
+
+        with self.assertRaises(InvalidChangeError):
+            topic.apply_change(StringChangeTypes.DeleteChange('test', topic.version, 0, 'ab'))
+        self.assertEqual(topic.get(), 'xycd')
+
+    def test_set_keeps_rope(self):
+        topic = StringTopic('test', None, init_value='abcd')
+        topic.enable_rope()
+        change = StringChangeTypes.SetChange('test', 'new value')
+        topic.apply_change(change)
+        self.assertEqual(change.old_value, 'abcd')
+        self.assertEqual(topic.get(), 'new value')
+        self.assertTrue(topic.is_rope_enabled())
+
+        with self.assertRaises(InvalidChangeError):
+            topic.apply_change(StringChangeTypes.SetChange('test', 1))
+        self.assertEqual(topic.get(), 'new value')
+        self.assertTrue(topic.is_rope_enabled())
+
+    def test_listeners_and_undo(self):
+        transitions = []
+        machine = StateMachine(transition_callback=transitions.append)
+        topic = machine.add_topic('topic', StringTopic, init_value='abcde')
+        topic.enable_rope()
+        values = []
+        topic.on_set2 += lambda old, new: values.append((old, new))
+
+        with machine.record():
+            topic.insert(2, 'xxx')
+            topic.delete(1, 'bxx')
+        self.assertEqual(values, [('abcde', 'abxxxcde'), ('abxxxcde', 'axcde')])
+
+        machine.undo(transitions[0])
+        self.assertEqual(topic.get(), 'abcde')
+        machine.redo(transitions[0])
+        self.assertEqual(topic.get(), 'axcde')
+
+    def test_serialize(self):
+        topic = StringTopic('test', None, init_value='abcd')
+        topic.enable_rope()
+        topic.apply_change(StringChangeTypes.InsertChange('test', topic.version, 4, 'e'))
+        restored = StringTopic.deserialize(topic.serialize(), None)
+        self.assertTrue(restored.is_rope_enabled())
+        self.assertEqual(restored.get(), 'abcde')
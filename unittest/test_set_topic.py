@@ -0,0 +1,107 @@
+import unittest
+from topicsync.state_machine.state_machine import StateMachine
+from topicsync.topic import SetTopic
+from topicsync.indexed_set import IndexedSet
+from topicsync.change import InvalidChangeError, SetChangeTypes
+from topicsync import HistoryManager
+
+class TestSetTopic(unittest.TestCase):
+    def test_append_remove(self):
+        changes_list = []
+        machine = StateMachine(changes_callback=lambda changes,_:changes_list.append(changes))
+        a = machine.add_topic('a', SetTopic, init_value=[1, 'x'])
+        a.append({'name': 'bob', 'id': 2})
+        a.append([3, 4])
+        a.remove('x')
+        self.assertEqual(a.get(), [1, {'name': 'bob', 'id': 2}, [3, 4]])
+        self.assertIn({'id': 2, 'name': 'bob'}, a)
+        self.assertNotIn('x', a)
+        self.assertEqual(len(a), 3)
+        self.assertEqual(changes_list[-1][0].serialize()['item'], 'x')
+
+    def test_invalid_changes(self):
+        machine = StateMachine()
+        a = machine.add_topic('a', SetTopic, init_value=[{'a': 1}])
+        with self.assertRaises(InvalidChangeError):
+            a.append({'a': 1})
+        with self.assertRaises(InvalidChangeError):
+            a.remove(2)
+        self.assertEqual(a.get(), [{'a': 1}])
+        with self.assertRaises(InvalidChangeError):
+            a.set(1)
+        self.assertIsInstance(a._value, IndexedSet)
+
+        seen = []
+        a.add_validator(lambda value, change: seen.append(value) or len(value) < 2)
+        with self.assertRaises(InvalidChangeError):
+            a.append(2)
+        self.assertEqual(seen, [[{'a': 1}, 2]])
+        self.assertEqual(a.get(), [{'a': 1}])
+
+    def test_set_with_duplicates(self):
+        sent = []
+        machine = StateMachine(changes_callback=lambda changes, action_id: sent.extend(change.serialize() for change in changes))
+        a = machine.add_topic('a', SetTopic)
+        a.set([1, 1, 2])
+        self.assertEqual(a.get(), [1, 2])
+        self.assertEqual(sent[0]['value'], [1, 2])
+
+    def test_listeners(self):
+        machine = StateMachine()
+        a = machine.add_topic('a', SetTopic, init_value=[1, 2, 3])
+        events = []
+        a.on_append += lambda item: events.append(('append', item))
+        a.on_remove += lambda item: events.append(('remove', item))
+        a.on_set2 += lambda old, new: events.append(('set', old, new))
+
+        a.remove(2)
+        self.assertEqual(events, [('set', [1, 2, 3], [1, 3]), ('remove', 2)])
+
+        events.clear()
+        a.set([3, [4], 5])
+        self.assertEqual(events, [('set', [1, 3], [3, [4], 5]), ('remove', 1), ('append', [4]), ('append', 5)])
+
+    def test_set_change_old_value(self):
+        machine = StateMachine()
+        a = machine.add_topic('a', SetTopic, init_value=[1, 2])
+        change = SetChangeTypes.SetChange('a', [2, 3])
+        a.apply_change(change)
+        self.assertEqual(change.serialize()['old_value'], [1, 2])
+        self.assertEqual(a.get(), [2, 3])
+
+    def test_undo_redo(self):
+        history = HistoryManager()
+        machine = StateMachine(transition_callback=history.add_transition)
+        history.set_server(machine)
+        a = machine.add_topic('a', SetTopic, init_value=[1])
+        a.append(2)
+        a.set([5])
+        a.remove(5)
+        history.undo()
+        self.assertEqual(a.get(), [5])
+        history.undo()
+        self.assertEqual(a.get(), [1, 2])
+        history.undo()
+        self.assertEqual(a.get(), [1])
+        history.redo()
+        history.redo()
+        history.redo()
+        self.assertEqual(a.get(), [])
+
+    def test_update(self):
+        history = HistoryManager()
+        machine = StateMachine(transition_callback=history.add_transition)
+        history.set_server(machine)
+        a = machine.add_topic('a', SetTopic, init_value=[1, 2, 3])
+        events = []
+        a.on_append += lambda item: events.append(('append', item))
+        a.on_remove += lambda item: events.append(('remove', item))
+        a.update(append_items=[4, [5]], remove_items=[1, 3])
+        self.assertEqual(a.get(), [2, 4, [5]])
+        self.assertEqual(events, [('remove', 1), ('remove', 3), ('append', 4), ('append', [5])])
+        for append_items, remove_items in [([2], []), ([6, 6], []), ([], [7]), ([], [2, 2])]:
+            with self.assertRaises(InvalidChangeError):
+                a.update(append_items, remove_items)
+        self.assertEqual(a.get(), [2, 4, [5]])
+        history.undo()
+        self.assertEqual(sorted(a.get()), [1, 2, 3])
@@ -1,7 +1,7 @@
 import unittest
 from topicsync.state_machine import state_machine
 from topicsync.state_machine.state_machine import StateMachine
-from topicsync.topic import EventTopic, StringTopic
+from topicsync.topic import EventTopic, IntTopic, StringTopic
 from topicsync.change import InvalidChangeError
 
 class StateMachineTransition(unittest.TestCase):
@@ -124,6 +124,26 @@ class StateMachineTransition(unittest.TestCase):
         self.assertEqual(b.get(), '')
         self.assertEqual(list(map(lambda change: change.topic_name,changes_list[-1])),['a', 'a'])
 
+    def test_pre_validator(self):
+        changes_list = []
+        machine = StateMachine(changes_callback=lambda changes,_:changes_list.append(changes))
+        a=machine.add_topic('a',StringTopic)
+        seen = []
+        a.add_pre_validator(lambda old,change: seen.append(old) or change.value != 'test')
+        a.set('world')
+        with self.assertRaises(InvalidChangeError):
+            a.set('test')
+        self.assertEqual(a.get(), 'world')
+        self.assertEqual(seen, ['', 'world'])
+        self.assertEqual(a.get_revision(), 1)
+
+        n=machine.add_topic('n',IntTopic)
+        with self.assertRaises(InvalidChangeError):
+            n.add(0.5)
+        with self.assertRaises(InvalidChangeError):
+            a.set(1)
+        self.assertEqual((n.get(), a.get()), (0, 'world'))
+
     def test_fail_set_with_except(self):
         changes_list = []
         machine = StateMachine(changes_callback=lambda changes,_:changes_list.append(changes))
@@ -228,6 +248,39 @@ class StateMachineTransition(unittest.TestCase):
         self.assertEqual(e.get(), 'newe')
         self.assertEqual(list(map(lambda change: change.topic_name,changes_list[-1])),['a', 'd', 'e', 'b'])
 
+    def test_debug_and_flat_recording_match(self):
+        results = []
+        for debug in (False, True):
+            changes_list = []
+            transitions = []
+            trees = []
+            machine = StateMachine(changes_callback=lambda changes,_:changes_list.append(changes),
+                                   transition_callback=transitions.append,
+                                   transition_tree_callback=trees.append if debug else None)
+            a=machine.add_topic('a',StringTopic)
+            b=machine.add_topic('b',StringTopic)
+            c=machine.add_topic('c',StringTopic)
+            d=machine.add_topic('d',StringTopic)
+            a.on_set.add_auto(lambda value: d.set('newd'))
+            a.on_set.add_auto(lambda value: b.set('newb'))
+            def b_on_set(value):
+                try:
+                    c.set('newc')
+                except InvalidChangeError:
+                    pass
+            b.on_set.add_auto(b_on_set)
+            c.on_set.add_auto(lambda value: d.set('x'))
+            c.add_validator(lambda new,change: change.value != 'newc')
+            a.set('newa')
+            a.set('again')
+            results.append((
+                [[change.topic_name for change in changes] for changes in changes_list],
+                [[change.topic_name for change in transition.changes] for transition in transitions],
+                (a.get(), b.get(), c.get(), d.get())))
+            self.assertEqual(len(trees), 2 if debug else 0)
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0][1], [['a', 'd', 'b'], ['a']])
+
     def test_recreate_topic(self):
         changes_list = []
         machine = StateMachine(changes_callback=lambda changes,_:changes_list.append(changes))
@@ -388,4 +441,93 @@ class RunAfterTransition(unittest.TestCase):
         self.assertEqual(a.get(),'hello')
         self.assertEqual(b.get(),'hello world')
         self.assertEqual(c.get(),'hello !')
-        self.assertEqual(list(map(lambda change: change.topic_name,changes_list[5])),['c'])
\ No newline at end of file
+        self.assertEqual(list(map(lambda change: change.topic_name,changes_list[5])),['c'])
+
+
+class LockDomains(unittest.TestCase):
+
+    def test_parallel_transitions(self):
+        import threading
+        changes_list = []
+        machine = StateMachine(changes_callback=lambda changes,_:changes_list.append(changes),lock_domain_of=lambda name: name.split('/')[0])
+        a=machine.add_topic('room1/a',IntTopic)
+        b=machine.add_topic('room2/b',IntTopic)
+        c=machine.add_topic('room1/c',IntTopic)
+        a_changed, b_changed = threading.Event(), threading.Event()
+
+        def change_a():
+            with machine.record():
+                a.add(1)
+                a_changed.set()
+                # room1 is held until the transition ends
+                self.assertTrue(b_changed.wait(5))
+        thread = threading.Thread(target=change_a)
+        thread.start()
+        self.assertTrue(a_changed.wait(5))
+
+        # room2 is not held, so this doesn't wait for the other transition
+        b.add(1)
+        b_changed.set()
+        # room1 is held, so this waits
+        c.add(1)
+        thread.join()
+        self.assertEqual([changes[0].topic_name for changes in changes_list],['room2/b','room1/a','room1/c'])
+
+    def test_conflict(self):
+        import threading
+        changes_list = []
+        machine = StateMachine(changes_callback=lambda changes,_:changes_list.append(changes),lock_domain_of=lambda name: name.split('/')[0])
+        a=machine.add_topic('room1/a',IntTopic)
+        b=machine.add_topic('room2/b',IntTopic)
+        b.on_set.add_auto(lambda value: a.add(value))
+        a_changed, release_a = threading.Event(), threading.Event()
+
+        def change_a():
+            with machine.record():
+                a.add(1)
+                a_changed.set()
+                release_a.wait(5)
+        thread = threading.Thread(target=change_a)
+        thread.start()
+        self.assertTrue(a_changed.wait(5))
+
+        # Holding room2, the transition can't wait for room1
+        with self.assertRaises(state_machine.LockDomainConflict):
+            b.add(10)
+        self.assertEqual(b.get(),0)
+        self.assertEqual([change.serialize()['value'] for change in changes_list[-1]],[10,-10])
+
+        # Escalated, it waits
+        threading.Timer(0.05,release_a.set).start()
+        machine.run_transition(lambda: b.add(10))
+        thread.join()
+        self.assertEqual((a.get(),b.get()),(11,10))
+
+class DeepTransitionTree(unittest.TestCase):
+
+    def test_deep_and_wide_trees(self):
+        from topicsync.state_machine.changes_tree import ChangesTree
+        from topicsync.state_machine.transition_tree import TransitionTree
+        from topicsync.change import IntChangeTypes
+        machine = StateMachine()
+        a = machine.add_topic('a',IntTopic)
+        for depth,width in ((5000,1),(1,5000)):
+            changes_list = []
+            changes_tree = ChangesTree()
+            tree = TransitionTree(machine.get_topic,changes_list,changes_tree)
+            for i in range(depth):
+                for j in range(width):
+                    change = IntChangeTypes.AddChange('a',1)
+                    a.apply_change(change)
+                    node = tree.add_child(change)
+                    changes_node = changes_tree.add_child(change)
+                tree.cursor = node
+                changes_tree.cursor = changes_node
+            self.assertEqual(len(tree.to_list()),depth*width)
+            self.assertEqual(len(changes_tree.serialize()['children']),1 if depth > 1 else width)
+
+            tree.cursor = tree.root
+            tree.clear_subtree()
+            self.assertEqual(a.get(),0)
+            self.assertEqual(tree.root.children,[])
+            self.assertEqual(len(changes_list),depth*width)
@@ -1,6 +1,10 @@
+import copy
+import random
 import unittest
 from topicsync.topic import StringTopic
-from topicsync.change import StringChangeTypes, InvalidChangeError, Change
+from topicsync.state_machine.state_machine import StateMachine
+from topicsync import HistoryManager
+from topicsync.change import StringChangeTypes, InvalidChangeError, Change, VersionTooOldError
 
 from typing import Callable, Tuple
 
@@ -195,4 +199,130 @@ class TestStringDiffChange(unittest.TestCase):
                 StringChangeTypes.InsertChange(name, version, 2, 'yyyy'),
                 StringChangeTypes.DeleteChange(name, version, 1, 'xxx')
             )
-        )
\ No newline at end of file
+        )
+
+class TestStringHistoryLimit(unittest.TestCase):
+    def _insert(self, topic, base_version, position, insertion):
+        change = StringChangeTypes.InsertChange('test', base_version, position, insertion)
+        topic.apply_change(change)
+        return change
+
+    def test_max_changes(self):
+        topic = StringTopic('test', None, init_value='')
+        topic.set_history_limit(max_changes=8)
+        versions = [topic.version]
+        for i in range(20):
+            self._insert(topic, topic.version, i, 'a')
+            versions.append(topic.version)
+        self.assertLessEqual(len(topic.changes), 8)
+        self.assertLessEqual(len(topic.version_to_index), 9)
+
+        # a version that is still in the history can be rebased
+        base = versions[-3]
+        self._insert(topic, base, 0, 'b')
+        self.assertEqual(topic.get(), 'b' + 'a' * 20)
+
+        with self.assertRaises(VersionTooOldError):
+            self._insert(topic, versions[0], 0, 'c')
+        self.assertEqual(topic.get(), 'b' + 'a' * 20)
+
+    def test_changes_from_checkpoint(self):
+        topic = StringTopic('test', None, init_value='')
+        topic.set_history_limit(max_changes=4)
+        for i in range(5):
+            self._insert(topic, topic.version, i, str(i))
+        self.assertEqual(list(topic.changes_from(topic.checkpoint_version)), topic.changes)
+        self.assertEqual(list(topic.changes_from(topic.version)), [])
+
+    def test_max_bytes(self):
+        topic = StringTopic('test', None, init_value='')
+        topic.set_history_limit(max_bytes=10000)
+        for i in range(100):
+            self._insert(topic, topic.version, 0, 'x' * 100)
+        self.assertLessEqual(sum(map(StringTopic._estimate_change_size, topic.changes)), 10000)
+        self.assertEqual(len(topic.get()), 10000)
+
+    def test_serialize_after_compaction(self):
+        topic = StringTopic('test', None, init_value='')
+        topic.set_history_limit(max_changes=4)
+        for i in range(10):
+            self._insert(topic, topic.version, i, str(i))
+        base = topic.changes[-2]
+
+        restored = StringTopic.deserialize(topic.serialize(), None)
+        self.assertEqual(restored.checkpoint_version, topic.checkpoint_version)
+        self.assertEqual(restored.version_to_index, topic.version_to_index)
+        change = StringChangeTypes.InsertChange('test', base.result_topic_version, 0, 'x')
+        restored.apply_change(change)
+        self.assertEqual(restored.get(), 'x0123456789')
+
+    def test_reused_versions(self):
+        history = HistoryManager()
+        machine = StateMachine(transition_callback=history.add_transition)
+        history.set_server(machine)
+        topic = machine.add_topic('test', StringTopic)
+        topic.insert(0, 'a')
+        topic.insert(0, 'b')
+        history.undo()
+        restored = StringTopic.deserialize(topic.serialize(), None)
+        self.assertEqual(restored.version_to_index, topic.version_to_index)
+        self.assertEqual(restored._change_info[0][0], topic._change_info[0][0])
+
+        topic.set_history_limit(max_changes=4)
+        history.redo()
+        for i in range(6):
+            topic.insert(i, str(i))
+        self.assertEqual(topic.get(), '012345ba')
+        for version, index in topic.version_to_index.items():
+            if index >= topic._first_index:
+                self.assertEqual(topic._change_info[index - topic._first_index][0], version)
+        self.assertEqual(topic.version_to_index[topic.checkpoint_version], topic._first_index - 1)
+
+
+class TestStringRebase(unittest.TestCase):
+    '''
+    Rebasing with the composed transforms must give the same result as adjusting over every change since the base version.
+    '''
+    def _adjust_one_by_one(self, change, topic):
+        change = copy.deepcopy(change)
+        for applied in topic.changes_from(change.topic_version):
+            if isinstance(applied, StringChangeTypes.SetChange):
+                change.position = 0
+                if isinstance(change, StringChangeTypes.DeleteChange):
+                    change.deletion = ''
+            else:
+                change._adjust(applied)
+        return change
+
+    def test_same_as_adjust(self):
+        rng = random.Random(0)
+        for trial in range(20):
+            topic = StringTopic('test', None, init_value='abcdefgh')
+            history = [(topic.version, topic.get())]
+            for step in range(100):
+                base_version, base_value = rng.choice(history[-40:])
+                position = rng.randint(0, len(base_value))
+                if step % 37 == 36:
+                    change = StringChangeTypes.SetChange('test', 'reset')
+                elif rng.random() < 0.5:
+                    change = StringChangeTypes.InsertChange('test', base_version, position, rng.choice(['x', 'yz']))
+                else:
+                    change = StringChangeTypes.DeleteChange('test', base_version, position, base_value[position:position + rng.randint(0, 3)])
+
+                if not isinstance(change, StringChangeTypes.SetChange):
+                    expected = self._adjust_one_by_one(change, topic)
+                    topic.apply_change(change)
+                    self.assertEqual(change.position, expected.position)
+                    self.assertEqual(getattr(change, 'insertion', None), getattr(expected, 'insertion', None))
+                    self.assertEqual(getattr(change, 'deletion', None), getattr(expected, 'deletion', None))
+                else:
+                    topic.apply_change(change)
+                history.append((topic.version, topic.get()))
+
+    def test_reject_mismatched_deletion(self):
+        topic = StringTopic('test', None, init_value='abcdef')
+        base = topic.version
+        topic.apply_change(StringChangeTypes.InsertChange('test', base, 0, 'xx'))
+        with self.assertRaises(InvalidChangeError):
+            topic.apply_change(StringChangeTypes.DeleteChange('test', base, 2, 'cX'))
+        self.assertEqual(topic.get(), 'xxabcdef')